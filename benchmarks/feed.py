@@ -0,0 +1,128 @@
+"""
+Deterministic synthetic feed in the shape of the BCL product search export (`hits.hits[]._source`).
+"""
+import json
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+TOP_CATEGORIES = ['Wine', 'Spirits', 'Beer', 'Refreshment Beverages']
+COUNTRIES = [
+    ('CA', 'Canada'), ('FR', 'France'), ('IT', 'Italy'), ('ES', 'Spain'), ('US', 'United States Of America'),
+    ('GB', 'United Kingdom'), ('AU', 'Australia'), ('NZ', 'New Zealand'), ('CL', 'Chile'), ('AR', 'Argentina'),
+    ('DE', 'Germany'), ('PT', 'Portugal'), ('MX', 'Mexico'), ('JP', 'Japan'), ('IE', 'Ireland'),
+    ('ZA', 'South Africa'), ('BE', 'Belgium'), ('NL', 'Netherlands'), ('GR', 'Greece'), ('AT', 'Austria'),
+]
+VOLUMES = ['0.355', '0.375', '0.473', '0.5', '0.75', '1', '1.14', '1.5', '1.75']
+UNIT_SIZES = [1, 1, 1, 1, 4, 6, 8, 12, 24]
+
+
+def categories(depth: int = 3, subs_per_category: int = 8, classes_per_sub: int = 6) -> List[Dict[str, Any]]:
+    """
+    Category tree with BCL-style ids, one entry per leaf.
+    With the default depth of 3 there are a few hundred (category, sub-category, class) combinations.
+
+    :param depth: Number of levels, 1 (category only) to 3 (category, sub-category and class).
+    """
+    tree = []
+    for c, name in enumerate(TOP_CATEGORIES, start=1):
+        top = {'category': {'id': c, 'description': name}}
+        if depth < 2:
+            tree.append(top)
+            continue
+        for s in range(subs_per_category):
+            sub = {**top, 'subCategory': {'id': c * 100 + s, 'description': f'{name} Type {s}'}}
+            if depth < 3:
+                tree.append(sub)
+                continue
+            for k in range(classes_per_sub):
+                tree.append({
+                    **sub,
+                    'class': {'id': c * 10000 + s * 100 + k, 'description': f'{name} Type {s} Style {k}'},
+                })
+    return tree
+
+
+def changes_until(key: str, day_index: int, change_rate: float) -> int:
+    """
+    Number of price changes of a sku from day 1 through `day_index`, each day changing with `change_rate`
+    probability. The change days are drawn as geometric gaps from a generator seeded with `key`.
+    """
+    if change_rate <= 0:
+        return 0
+    rng = random.Random(key)
+    day = count = 0
+    while True:
+        gap = 0 if change_rate >= 1 else int(math.log(1 - rng.random()) / math.log(1 - change_rate))
+        day += 1 + gap
+        if day > day_index:
+            return count
+        count += 1
+
+
+def generate_feed(
+    size: int = 10000,
+    day: Optional[datetime] = None,
+    seed: int = 42,
+    day_index: int = 0,
+    change_rate: float = 0.05,
+    category_depth: int = 3,
+    countries: int = len(COUNTRIES),
+) -> Dict[str, Any]:
+    """
+    Build a feed of `size` products for one day.
+    The catalog is a pure function of `seed`; prices drift from day to day, `change_rate` of the skus changing
+    price on each `day_index`.
+
+    :param size: Number of products.
+    :param day: The `last_updated` timestamp of every product; defaults to today 08:00.
+    :param seed: Seed of the catalog.
+    :param day_index: Index of the day in a simulated history, drives the price changes.
+    :param change_rate: Fraction of skus whose price changes on a given day.
+    :param category_depth: Number of category levels, 1 to 3.
+    :param countries: Number of distinct countries, at most len(COUNTRIES).
+    :return: The feed document.
+    """
+    day = day or datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    tree = categories(category_depth)
+    country_mix = COUNTRIES[:max(1, countries)]
+    rng = random.Random(seed)
+    hits = []
+    for i in range(size):
+        sku = str(100000 + i)
+        code, country = rng.choice(country_mix)
+        branch = rng.choice(tree)
+        leaf = branch.get('class') or branch.get('subCategory') or branch['category']
+        regular_price = round(rng.uniform(3, 150), 2)
+
+        # The price on `day_index` depends on how many changes the sku went through until then
+        changes = changes_until(f'{seed}-{sku}', day_index, change_rate)
+        on_sale = changes % 2 == 1
+        current_price = round(regular_price * (0.8 if on_sale else 1) + (changes // 2) * 0.5, 2)
+
+        hits.append({'_source': {
+            'sku': sku,
+            'upc': ['0' + str(62000000000 + i * 7)],
+            'name': f'{leaf["description"]} {i}',
+            'volume': rng.choice(VOLUMES),
+            'unitSize': rng.choice(UNIT_SIZES),
+            'alcoholPercentage': round(rng.uniform(0.5, 45), 1),
+            'productType': branch['category']['description'],
+            'tastingDescription': 'Synthetic product ' * rng.randint(1, 8),
+            'countryName': country,
+            'countryCode': code,
+            **{key: dict(value) for key, value in branch.items()},
+            'last_updated': day.strftime('%Y-%m-%dT%H:%M:%S'),
+            'currentPrice': f'{current_price:.2f}',
+            'regularPrice': f'{max(regular_price, current_price):.2f}',
+            'promotionStartDate': (day - timedelta(days=3)).strftime('%Y-%m-%d') if on_sale else None,
+            'promotionEndDate': (day + timedelta(days=11)).strftime('%Y-%m-%d') if on_sale else None,
+        }})
+    return {'hits': {'total': size, 'hits': hits}}
+
+
+def write_feed(path: str, **kwargs: Any) -> str:
+    with open(path, 'w', encoding='utf8') as file:
+        json.dump(generate_feed(**kwargs), file)
+    return path
@@ -0,0 +1,54 @@
+"""
+Memory used by the products of a full feed, with and without the Country/Category intern pool.
+
+    python benchmarks/intern_memory.py [size]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from feed import generate_feed  # noqa: E402
+from models.category import Category  # noqa: E402
+from models.country import Country  # noqa: E402
+from models.product import Product  # noqa: E402
+from utils.interning import intern_pool  # noqa: E402
+
+
+def measure(hits, interned: bool) -> dict:
+    intern_pool.clear()
+    intern_pool.enabled = interned
+    gc.collect()
+    tracemalloc.start()
+    products = [Product(**hit['_source']) for hit in hits]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    countries = {id(p.country) for p in products if p.country}
+    categories = {id(x) for p in products for x in p.full_category() if x}
+    live = sum(1 for x in gc.get_objects() if isinstance(x, (Country, Category)))
+    return {
+        'interned': interned,
+        'products': len(products),
+        'retained_kb': round(current / 1024),
+        'peak_kb': round(peak / 1024),
+        'country_instances': len(countries),
+        'category_instances': len(categories),
+        'live_country_category_objects': live,
+    }
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Parse from a JSON round trip so every hit owns its dicts, as with the real feed
+    hits = json.loads(json.dumps(generate_feed(size)))['hits']['hits']
+    results = [measure(json.loads(json.dumps(hits)), interned) for interned in (False, True)]
+    intern_pool.enabled = True
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Replay a realistic traffic mix against a running app and report throughput and latency per route.
+
+    python benchmarks/load_test.py --url http://localhost:8000 --duration 60 --concurrency 16 --reload-every 20
+
+Each worker thread picks a route by weight: the catalog (`/api/data`), price charts (`/api/price/<sku>`) and
+thumbnails (`/image/<height>/<sku>.jpg`), with skus drawn from the catalog. `/api/reload` is posted every
+`--reload-every` seconds so the ingest runs during traffic.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utils.query_profiler import percentile  # noqa: E402
+
+IMAGE_HEIGHTS = [200, 400]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, elapsed_ms: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies[route].append(elapsed_ms)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, duration: float) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            report[route] = {
+                'requests': len(values),
+                'errors': self.errors[route],
+                'rps': round(len(values) / duration, 2),
+                'p50_ms': round(percentile(values, 50), 1),
+                'p90_ms': round(percentile(values, 90), 1),
+                'p99_ms': round(percentile(values, 99), 1),
+                'max_ms': round(values[-1], 1),
+            }
+        return report
+
+
+def pick_request(skus: List[str], weights: List[Tuple[str, float]]) -> Tuple[str, str]:
+    route = random.choices([x for x, _ in weights], [w for _, w in weights])[0]
+    sku = random.choice(skus)
+    if route == '/api/data':
+        return route, '/api/data'
+    if route == '/api/price':
+        return route, f'/api/price/{sku}?resolution=auto'
+    return route, f'/image/{random.choice(IMAGE_HEIGHTS)}/{sku}.jpg'
+
+
+def worker(base_url: str, skus: List[str], weights, deadline: float, recorder: Recorder) -> None:
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip'
+    while time.time() < deadline:
+        route, path = pick_request(skus, weights)
+        started = time.perf_counter()
+        try:
+            ok = session.get(base_url + path, timeout=30).status_code < 400
+        except requests.RequestException:
+            ok = False
+        recorder.record(route, (time.perf_counter() - started) * 1000, ok)
+
+
+def reloader(base_url: str, every: float, deadline: float, recorder: Recorder) -> None:
+    while time.time() + every < deadline:
+        time.sleep(every)
+        started = time.perf_counter()
+        try:
+            ok = requests.post(base_url + '/api/reload', timeout=30).status_code == 202
+        except requests.RequestException:
+            ok = False
+        recorder.record('/api/reload', (time.perf_counter() - started) * 1000, ok)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Boozehound HTTP load test')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--data-weight', type=float, default=1)
+    parser.add_argument('--price-weight', type=float, default=5)
+    parser.add_argument('--image-weight', type=float, default=20)
+    parser.add_argument('--reload-every', type=float, default=0, help='Seconds between reloads, 0 to disable')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    products = requests.get(base_url + '/api/data', timeout=60).json()['products']
+    skus = [product['sku'] for product in products]
+    if not skus:
+        print('The catalog is empty')
+        return 1
+
+    weights = [('/api/data', args.data_weight), ('/api/price', args.price_weight), ('/image', args.image_weight)]
+    recorder = Recorder()
+    started = time.time()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(base_url, skus, weights, deadline, recorder), daemon=True)
+        for _ in range(args.concurrency)
+    ]
+    if args.reload_every > 0:
+        threads.append(threading.Thread(
+            target=reloader, args=(base_url, args.reload_every, deadline, recorder), daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - started
+    report = {
+        'meta': {'url': base_url, 'duration': round(elapsed, 1), 'concurrency': args.concurrency,
+                 'catalog': len(skus)},
+        'routes': recorder.report(elapsed),
+        'total_rps': round(sum(len(x) for x in recorder.latencies.values()) / elapsed, 2),
+    }
+
+    print(f"{'route':<14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<14} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p90_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+    print(f"Total: {report['total_rps']:.1f} req/s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as file:
+            json.dump(report, file, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
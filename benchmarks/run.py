@@ -0,0 +1,241 @@
+"""
+Time the hot paths on a synthetic catalog stored in SQLite, and compare against a baseline.
+
+    python benchmarks/run.py --products 5000 --days 30 --output results.json
+    python benchmarks/run.py --products 5000 --days 30 --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --products 5000 --days 30 --baseline benchmarks/baseline.json
+
+Every case reports wall time (median and min over `--repeat` runs), the peak and net Python allocations of one
+extra run under tracemalloc, and the peak RSS of the process so far. With `--baseline`, cases whose median time
+grew by more than `--tolerance` are reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from feed import write_feed  # noqa: E402
+
+SAMPLE_SKUS = 200
+
+
+def max_rss_kb() -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # bytes on macOS, KiB on Linux
+
+
+def measure(fn: Callable[[Any], Any], repeat: int, setup: Callable[[], Any] = lambda: None) -> Dict[str, Any]:
+    """
+    Time `fn(setup())` `repeat` times, then run it once more under tracemalloc.
+    `setup` runs outside of the measurements.
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        started = time.perf_counter()
+        fn(arg)
+        times.append((time.perf_counter() - started) * 1000)
+
+    arg = setup()
+    tracemalloc.start()
+    fn(arg)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'runs': repeat,
+        'alloc_peak_kb': round(peak / 1024),
+        'alloc_net_kb': round(current / 1024),
+        'max_rss_kb': max_rss_kb(),
+    }
+
+
+def run(args: argparse.Namespace, log: Callable[[str], None]) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='boozehound-bench-')
+    os.environ['DB_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    for name in ('DB_READ_URL', 'LOCAL_DB_PATH'):
+        os.environ.pop(name, None)
+
+    import app as web
+    from repositories.product_rankings import ProductRankings
+    web.IMAGE_LOC = os.path.join(workdir, 'images')
+    service = web.product_service
+    service.outbox_path = os.path.join(workdir, 'outbox.jsonl')
+    if not web.warmup.wait():
+        raise RuntimeError(f'Could not load the catalog: {web.warmup.error}')
+
+    # Timed ingests (`repeat` runs plus the tracemalloc one) are the last days of the history, ending today
+    timed_days = args.repeat + 1
+    today = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    first_day = today - timedelta(days=args.days - 1)
+
+    def feed_of(day_index: int) -> str:
+        path = os.path.join(workdir, f'feed_{day_index}.json')
+        return write_feed(
+            path, size=args.products, day=first_day + timedelta(days=day_index), seed=args.seed,
+            day_index=day_index, change_rate=args.change_rate, category_depth=args.category_depth,
+            countries=args.countries)
+
+    started = time.perf_counter()
+    for day_index in range(args.days - timed_days):
+        service.load_products(feed_of(day_index))
+        service.persist_products()
+        log(f'Ingested day {day_index + 1}/{args.days}')
+    log(f'History built in {time.perf_counter() - started:.1f}s')
+
+    results: Dict[str, Any] = {}
+    pending = iter(range(args.days - timed_days, args.days))
+
+    def next_ingest() -> None:
+        service.load_products(feed_of(next(pending)))
+
+    latest_feed = feed_of(args.days - 1)
+    results['ProductService.load_products'] = measure(lambda _: service.load_products(latest_feed), args.repeat)
+    results['ProductService.persist_products'] = measure(lambda _: service.persist_products(), args.repeat, next_ingest)
+    service.reload_products()
+
+    results['ProductRepository.load_products'] = measure(
+        lambda _: service.product_repo.load_products(), args.repeat)
+
+    rows = service.db_helper.execute_query("""SELECT
+    last_updated, sku, regular_price, current_price, promotion_start_date, promotion_end_date
+FROM price_history""")
+    results['PriceHistoryRepository.filter_prices'] = measure(
+        lambda _: service.price_history_repo.filter_prices(rows), args.repeat)
+
+    results['ProductRankings.from_products'] = measure(
+        lambda _: ProductRankings.from_products(service.products), args.repeat)
+
+    results['Product.to_json_model'] = measure(
+        lambda _: [product.to_json_model() for product in service.products], args.repeat)
+
+    client = web.app.test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+    skus = [product.sku for product in service.products[:SAMPLE_SKUS]]
+
+    def get_all(urls: List[str]) -> None:
+        for url in urls:
+            response = client.get(url, headers=headers)
+            assert response.status_code in (200, 304), f'{url}: {response.status_code}'
+
+    results['GET /api/data'] = measure(lambda _: get_all(['/api/data']), args.repeat)
+    results['GET /api/data?fields=card'] = measure(lambda _: get_all(['/api/data?fields=card']), args.repeat)
+    results['GET /api/data?fields=card&format=columnar'] = measure(
+        lambda _: get_all(['/api/data?fields=card&format=columnar']), args.repeat)
+    results['GET /api/top'] = measure(
+        lambda _: get_all(['/api/top?score=combined&group=category&n=20']), args.repeat)
+    results['GET /api/price'] = measure(
+        lambda _: get_all([f'/api/price/{sku}' for sku in skus]), args.repeat)
+    results['GET /api/price?resolution=auto'] = measure(
+        lambda _: get_all([f'/api/price/{sku}?resolution=auto&range=1y' for sku in skus]), args.repeat)
+
+    # Images are served from the local cache; the upstream download is not part of the benchmark
+    os.makedirs(web.IMAGE_LOC, exist_ok=True)
+    for sku in skus:
+        with open(os.path.join(web.IMAGE_LOC, f'{sku}.jpg'), 'wb') as file:
+            file.write(b'\xff\xd8\xff\xe0' + os.urandom(16 * 1024) + b'\xff\xd9')
+    results['GET /image'] = measure(lambda _: get_all([f'/image/200/{sku}.jpg' for sku in skus]), args.repeat)
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'products': args.products,
+            'days': args.days,
+            'change_rate': args.change_rate,
+            'category_depth': args.category_depth,
+            'countries': args.countries,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'sample_skus': len(skus),
+        },
+        'results': results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Print the median times next to the baseline ones.
+
+    :return: The cases slower than the baseline by more than `tolerance` (a fraction).
+    """
+    if baseline.get('meta', {}).get('products') != report['meta']['products'] or \
+            baseline.get('meta', {}).get('days') != report['meta']['days']:
+        print('Warning: the baseline was recorded with a different catalog size')
+
+    regressions = []
+    print(f"{'case':<42} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for case, result in report['results'].items():
+        before = baseline.get('results', {}).get(case)
+        if not before:
+            print(f"{case:<42} {'-':>12} {result['median_ms']:>12.2f}")
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0
+        flag = ' !' if change > tolerance else ''
+        print(f"{case:<42} {before['median_ms']:>12.2f} {result['median_ms']:>12.2f} {change:>+8.1%}{flag}")
+        if change > tolerance:
+            regressions.append(case)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Boozehound hot path benchmarks')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30, help='Days of price history, ending today')
+    parser.add_argument('--change-rate', type=float, default=0.05, help='Daily probability of a price change')
+    parser.add_argument('--category-depth', type=int, default=3, choices=(1, 2, 3))
+    parser.add_argument('--countries', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against this results file')
+    parser.add_argument('--save-baseline', help='Write the results as the new baseline to this file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline')
+    parser.add_argument('--verbose', action='store_true', help='Show the application output')
+    args = parser.parse_args()
+    if args.days <= args.repeat + 1:
+        parser.error('--days must be larger than --repeat + 1')
+
+    # The application prints progress messages, keep them out of the report unless asked for
+    with open(os.devnull, 'w') as devnull:
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with quiet:
+            report = run(args, lambda message: print(message, file=sys.stderr))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf8') as file:
+            json.dump(report, file, indent=4)
+
+    print(json.dumps(report['results'], indent=4))
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf8') as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
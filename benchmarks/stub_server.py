@@ -0,0 +1,118 @@
+"""
+Local stand-in for the BCL feed and image hosts, for load tests.
+
+    python benchmarks/stub_server.py --port 9000 --products 5000 --latency-ms 80 --error-rate 0.01
+
+Then point the app at it:
+
+    BCL_URL=http://localhost:9000/feed.json BCL_IMAGE_URL=http://localhost:9000/images
+
+`/feed.json` serves a synthetic feed timestamped today, with the prices of day N of the simulated history
+(`?day=N`, by default the next day on every request) and `/images/<height>/<sku>.jpg` a deterministic JPEG-framed payload per sku. Every response is delayed by
+`--latency-ms` (+/- `--jitter`) and fails with a 503 with probability `--error-rate`.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from feed import generate_feed
+
+IMAGE_RE = re.compile(r'^/images/(\d+)/(\w+)\.jpg$')
+
+
+class StubState:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.lock = threading.Lock()
+        self.days = itertools.count()
+        self.feeds = {}
+
+    def feed(self, day_index: int) -> bytes:
+        with self.lock:
+            if day_index not in self.feeds:
+                self.feeds.clear()  # Keep one feed in memory
+                feed = generate_feed(
+                    self.args.products, seed=self.args.seed, day_index=day_index, change_rate=self.args.change_rate)
+                self.feeds[day_index] = json.dumps(feed).encode('utf8')
+            return self.feeds[day_index]
+
+    @staticmethod
+    def image(height: int, sku: str) -> bytes:
+        # Deterministic payload of a plausible thumbnail size
+        seed = hashlib.md5(f'{height}/{sku}'.encode()).digest()
+        size = 4 * 1024 + height * 40
+        body = (seed * (size // len(seed) + 1))[:size]
+        return b'\xff\xd8\xff\xe0' + body + b'\xff\xd9'
+
+
+def handler_for(state: StubState):
+    args = state.args
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def send_body(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            delay = max(0.0, args.latency_ms + random.uniform(-args.jitter, args.jitter) * args.latency_ms)
+            time.sleep(delay / 1000)
+            if random.random() < args.error_rate:
+                self.send_body(503, b'Service Unavailable', 'text/plain')
+                return
+
+            url = urlparse(self.path)
+            if url.path == '/feed.json':
+                day = parse_qs(url.query).get('day')
+                day_index = int(day[0]) if day else next(state.days)
+                self.send_body(200, state.feed(day_index), 'application/json')
+                return
+
+            match = IMAGE_RE.match(url.path)
+            if match:
+                self.send_body(200, state.image(int(match.group(1)), match.group(2)), 'image/jpeg')
+                return
+
+            self.send_body(404, b'Not Found', 'text/plain')
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub BCL feed and image server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--change-rate', type=float, default=0.05)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter', type=float, default=0.5, help='Latency jitter as a fraction of --latency-ms')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), handler_for(StubState(args)))
+    print(f'Stub server on http://{args.host}:{args.port} (feed: /feed.json, images: /images/<height>/<sku>.jpg)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
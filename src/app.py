@@ -4,33 +4,95 @@ import threading
 import time
 import hashlib
 
-import requests
 from dotenv import load_dotenv
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, g, jsonify, send_file, request
 from flask_compress import Compress
+from pydantic import ValidationError
 
+from models.product import FIELD_PROFILES
+from models.watch_rule import WatchRule
 from services.bcl_service import BCLService
+from repositories.price_history_store import day_offset
+from repositories.price_rollups import RESOLUTIONS
+from repositories.product_facets import FLAGS
+from repositories.product_rankings import TOP_N
 from services.product_service import ProductService
+from services.watchlist_service import new_token
+from utils import profiling
+from utils.metrics import (catalog_products, http_in_flight, http_request_seconds, http_requests, image_requests,
+                           image_upstream_seconds, ingest_download_bytes, ingest_parsed_products, ingest_persisted_rows,
+                           ingest_phase_seconds, ingest_runs, metrics)
+from utils.events import broadcaster as events
+from utils.gtin import normalize
+from utils.query_profiler import query_profiler
+from utils.run_state import stamp_age, write_stamp
+from utils.warmup import Warmup
 
 load_dotenv()
 
 PORT = os.environ.get('PORT', 8000)
 
 DB_URL = os.environ.get('DB_URL')
+DB_READ_URL = os.environ.get('DB_READ_URL')
+DB_MAX_REPLICA_LAG = float(os.getenv('DB_MAX_REPLICA_LAG', '30'))
+LOCAL_DB_PATH = os.getenv('LOCAL_DB_PATH')
+WATCHLIST_OUTBOX = os.getenv('WATCHLIST_OUTBOX', 'data/outbox.jsonl')
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv('PRICE_HISTORY_RETENTION_MONTHS', '24'))
+PRICE_HISTORY_ARCHIVE_DIR = os.getenv('PRICE_HISTORY_ARCHIVE_DIR', 'data/archive')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_DBNAME = os.getenv('DB_DBNAME')
 BCL_URL = os.getenv('BCL_URL')
+BCL_IMAGE_URL = os.getenv('BCL_IMAGE_URL', 'https://www.bcliquorstores.com/sites/default/files/imagecache')
 JSON_LOC = "data/products.json"
+RETRY_AFTER = 5  # seconds, while the catalog loads
+INGEST_LOCK = 'ingest'
+INGEST_MIN_INTERVAL = 3600  # seconds, a scheduled ingest is skipped when another worker just ran one
+MAX_UPC_BATCH = 100
+WATCHLIST_TOKEN_HEADER = 'X-Watchlist-Token'
 IMAGE_LOC = '/tmp/'
 
 print(f'WEB STARTING {__name__}')
 print(f'{DB_URL}')
-product_service: ProductService = ProductService(DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False)
+product_service: ProductService = ProductService(
+    DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False, read_db_url=DB_READ_URL, max_replica_lag=DB_MAX_REPLICA_LAG,
+    local_db_path=LOCAL_DB_PATH, outbox_path=WATCHLIST_OUTBOX, archive_dir=PRICE_HISTORY_ARCHIVE_DIR)
 
 app: Flask = Flask(__name__,
                    static_folder='web/static',
                    template_folder='web/templates')
+
+
+# Registered before the compression: after_request hooks run in reverse order, so the timings include it
+@app.before_request
+def start_request_metrics():
+    http_in_flight.inc()
+    g.metrics_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.inc(route=route, method=request.method, status=response.status_code)
+    http_request_seconds.observe(time.perf_counter() - g.metrics_started, route=route)
+    return response
+
+
+@app.teardown_request
+def end_request_metrics(_):
+    http_in_flight.dec()
+
+
+@app.before_request
+def require_catalog():
+    # Cheap answer while the catalog loads, the clients retry; /start would run an ingest on a half-loaded worker
+    warmup.ensure_started()
+    if not warmup.ready and (request.path.startswith('/api/') or request.path == '/start'):
+        return jsonify({"error": "Catalog loading", "status": warmup.status}), 503, {'Retry-After': str(RETRY_AFTER)}
+
+
+# Installed first: after_request hooks run in reverse order, so request profiles include the compression
+PROFILING = profiling.install(app)
 Compress(app)
 
 
@@ -48,14 +110,103 @@ def index():
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
+    models = product_service.json_models()
+    fields = request.args.get('fields')
+    if fields:
+        fields = FIELD_PROFILES.get(fields) or fields.split(',')
+        unknown = [x for x in fields if models and x not in models[0]]
+        if unknown:
+            return jsonify({"error": f"Unknown fields {', '.join(unknown)}"}), 400
+
+    since = request.args.get('since')
+    if since and since.isdigit():
+        # Clients too far behind (or that synced with another worker) get a full snapshot
+        delta = product_service.changelog.since(int(since))
+        if delta is not None:
+            return jsonify(dict(product_service.changelog.to_json_model(delta, fields),
+                                version=product_service.changelog.version, since=int(since),
+                                lookups=product_service.lookups()))
+
+    if request.args.get('format') == 'columnar':
+        return app.response_class(product_service.columnar(fields, app.json.dumps), mimetype='application/json')
+    if fields:
+        models = [{key: model[key] for key in fields} for model in models]
+
     data = {
-        'products': [x.to_json_model() for x in product_service.products],
+        'version': product_service.changelog.version,
+        'lookups': product_service.lookups(),
+        'products': models,
     }
     return jsonify(data)
 
 
+@app.route('/api/version', methods=['GET'])
+def get_version():
+    # Polled by the browser, 304 until the catalog version or the ingest phase changes
+    response = jsonify({'version': product_service.changelog.version, 'reload': events.latest.get('reload')})
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+@app.route('/api/product/<sku>', methods=['GET'])
+def get_product(sku):
+    product = product_service.find_product(sku)
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+
+    response = jsonify(product.to_json_model())
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+RANGE_UNITS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+
+
+def parse_range(value):
+    """
+    Parse a `range` parameter such as `90d`, `12w`, `6m`, `1y` or `all` into a number of days (None for all).
+    """
+    if not value or value == 'all':
+        return None
+    unit = value[-1].lower()
+    if unit not in RANGE_UNITS or not value[:-1].isdigit():
+        raise ValueError(f'Invalid range `{value}`')
+    return int(value[:-1]) * RANGE_UNITS[unit]
+
+
+def auto_resolution(days):
+    """
+    Pick the coarsest resolution that still keeps a chart of `days` days readable.
+    """
+    if days <= 180:
+        return 'day'
+    return 'week' if days <= 3 * 365 else 'month'
+
+
 @app.route('/api/price/<sku>', methods=['GET'])
 def get_price(sku):
+    try:
+        days = parse_range(request.args.get('range'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resolution = request.args.get('resolution', 'day')
+    if resolution == 'auto':
+        history_days = product_service.history_store.span_days(sku) or 0
+        resolution = auto_resolution(min(days, history_days) if days is not None else history_days)
+    if resolution != 'day' and resolution not in RESOLUTIONS:
+        return jsonify({"error": f"Invalid resolution `{resolution}`"}), 400
+
+    since_day = day_offset(datetime.date.today()) - days if days is not None else None
+    if resolution != 'day':
+        return jsonify(product_service.rollups.to_json_model(sku, resolution, since_day))
+
+    data = product_service.history_store.to_json_model(sku, since_day)
+    if data is not None:
+        return jsonify(data)
+
     if sku in product_service.price_history_repo.history_map:
         prices = product_service.price_history_repo.history_map[sku]
     if product_service.price_history_repo.load_history(sku):
@@ -69,6 +220,104 @@ def get_price(sku):
     return jsonify(data)
 
 
+@app.route('/api/top', methods=['GET'])
+def get_top():
+    score = request.args.get('score', 'combined')
+    group = request.args.get('group', 'category')
+    n = request.args.get('n', '10')
+    if not n.isdigit() or not 1 <= int(n) <= TOP_N:
+        return jsonify({"error": f"`n` must be between 1 and {TOP_N}"}), 400
+
+    fields = request.args.get('fields')
+    if fields:
+        models = product_service.json_models()
+        fields = FIELD_PROFILES.get(fields) or fields.split(',')
+        unknown = [x for x in fields if models and x not in models[0]]
+        if unknown:
+            return jsonify({"error": f"Unknown fields {', '.join(unknown)}"}), 400
+
+    groups = product_service.rankings.to_json_model(score, group, int(n))
+    if groups is None:
+        return jsonify({"error": f"Invalid score `{score}` or group `{group}`"}), 400
+    if fields:
+        for x in groups:
+            x['items'] = [dict({key: item[key] for key in fields}, score=item['score']) for item in x['items']]
+    return jsonify({'score': score, 'group': group, 'groups': groups, 'lookups': product_service.lookups()})
+
+
+@app.route('/api/facets', methods=['GET'])
+def get_facets():
+    category = request.args.get('category')
+    if category and not category.isdigit():
+        return jsonify({"error": f"Invalid category `{category}`"}), 400
+    flags = [x for x in FLAGS if request.args.get(x) == 'true']
+    return jsonify(product_service.facets.to_json_model(
+        int(category) if category else None, request.args.get('country') or None, flags))
+
+
+@app.route('/api/upc/<code>', methods=['GET'])
+def get_upc(code):
+    if normalize(code) is None:
+        return jsonify({"error": f"Invalid UPC/EAN `{code}`"}), 400
+    product = product_service.find_product(product_service.upc_index.lookup(code))
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify(product.to_json_model())
+
+
+@app.route('/api/upc', methods=['POST'])
+def get_upcs():
+    codes = (request.get_json(silent=True) or {}).get('codes')
+    if not isinstance(codes, list) or not all(isinstance(x, str) for x in codes):
+        return jsonify({"error": "`codes` must be a list of strings"}), 400
+    if len(codes) > MAX_UPC_BATCH:
+        return jsonify({"error": f"At most {MAX_UPC_BATCH} codes per request"}), 400
+
+    products = {}
+    for code in codes:
+        product = product_service.find_product(product_service.upc_index.lookup(code))
+        products[code] = product.to_json_model() if product else None
+    return jsonify({'products': products, 'invalid': [x for x in codes if normalize(x) is None]})
+
+
+@app.route('/api/watchlist', methods=['GET'])
+def get_watchlist():
+    subscriber = request.args.get('subscriber')
+    token = request.headers.get(WATCHLIST_TOKEN_HEADER)
+    if not subscriber:
+        return jsonify({"error": "`subscriber` is required"}), 400
+    if not token:
+        return jsonify({"error": f"`{WATCHLIST_TOKEN_HEADER}` header is required"}), 401
+    return jsonify([x.to_json_model() for x in product_service.watchlist.rules_of(subscriber, token)])
+
+
+@app.route('/api/watchlist', methods=['POST'])
+def add_watch_rule():
+    body = request.get_json(silent=True) or {}
+    try:
+        rule = WatchRule(**{key: value for key, value in body.items()
+                            if key not in ('id', 'date_added', 'token_hash')})
+    except ValidationError as e:
+        return jsonify({"error": e.errors(include_url=False, include_context=False)}), 400
+    # A client with rules keeps using its token, the others get a new one
+    token = request.headers.get(WATCHLIST_TOKEN_HEADER) or new_token()
+    rule = product_service.watchlist.add_rule(rule, token)
+    events.publish('watch_rules', {'added': rule.id})
+    return jsonify(dict(rule.to_json_model(), token=token)), 201
+
+
+@app.route('/api/watchlist/<int:rule_id>', methods=['DELETE'])
+def remove_watch_rule(rule_id):
+    token = request.headers.get(WATCHLIST_TOKEN_HEADER)
+    if not token:
+        return jsonify({"error": f"`{WATCHLIST_TOKEN_HEADER}` header is required"}), 401
+    # Also 404 for a rule of another owner, ids do not reveal which rules exist
+    if not product_service.watchlist.remove_rule(rule_id, token):
+        return jsonify({"error": "Rule not found"}), 404
+    events.publish('watch_rules', {'removed': rule_id})
+    return '', 204
+
+
 def run_daily_task():
     """Schedule the daily task."""
     while True:
@@ -81,29 +330,119 @@ def run_daily_task():
         print(f'Waiting `{wait_time}`...')
         time.sleep(wait_time)
         print('Reloading products...')
-        download_task()
+        download_task(scheduled=True)
         print('Products reloaded...')
+        partition_task()
+
+
+def download_task(scheduled=False):
+    """
+    Ingest the feed in one process of the deployment at a time. The leader publishes the end of the ingest and the
+    other workers then load the stored catalog (see `sync_task`) instead of downloading the feed themselves.
+
+    :param scheduled: Skip the ingest if another process completed one in the last INGEST_MIN_INTERVAL seconds.
+    """
+    with product_service.db_helper.try_lock(INGEST_LOCK) as leader:
+        if not leader:
+            print('Ingest already running in another process')
+            ingest_runs.inc(result='skipped')
+            return
+        age = stamp_age('ingest_finished')
+        if scheduled and age is not None and age < INGEST_MIN_INTERVAL:
+            print(f'Ingest ran {age:.0f}s ago in another process')
+            ingest_runs.inc(result='skipped')
+            return
+        ingest_task()
+        write_stamp('ingest_finished')
+
+
+def ingest_task():
+    phase = 'download'
+    started = time.perf_counter()
+    events.publish('reload', {'phase': phase})
+    try:
+        bcl = BCLService()
+        bcl.download_json(BCL_URL, JSON_LOC)
+        ingest_download_bytes.set(os.path.getsize(JSON_LOC))
 
-
-def download_task():
-    bcl = BCLService()
-    bcl.download_json(BCL_URL, JSON_LOC)
-
-    product_service.load_products(JSON_LOC)
-    product_service.persist_products()
-    product_service.reload_products()
+        started = observe_phase(phase, started)
+        phase = 'parse'
+        events.publish('reload', {'phase': phase})
+        product_service.load_products(JSON_LOC)
+        ingest_parsed_products.set(len(product_service.feed_products))
+
+        started = observe_phase(phase, started)
+        phase = 'persist'
+        events.publish('reload', {'phase': phase})
+        ingest_persisted_rows.inc(product_service.persist_products())
+
+        started = observe_phase(phase, started)
+        phase = 'reload'
+        events.publish('reload', {'phase': phase})
+        product_service.reload_products()
+        catalog_products.set(len(product_service.products))
+        observe_phase(phase, started)
+    except Exception:
+        print(f'Ingest failed during the {phase} phase')
+        ingest_runs.inc(result='error')
+        events.publish('reload', {'phase': 'error', 'failed': phase})
+        raise
+    ingest_runs.inc(result='ok')
+    # Only the leader announces versions, the other workers load the catalog of this one
+    version = product_service.changelog.version
+    events.publish('reload', {'phase': 'done', 'version': version})
+
+
+def sync_task():
+    """Load the catalog ingested by another process, under the version stored by its leader."""
+    with sync_lock:
+        try:
+            product_service.sync_catalog()
+        except Exception as e:
+            print(f'Catalog sync failed: {e}')
+            return
+    catalog_products.set(len(product_service.products))
+
+
+def on_remote_event(event, data):
+    # The leader of an ingest announces its end; a worker still warming up reads the stored catalog itself
+    if event == 'reload' and data.get('phase') == 'done' and warmup.ready \
+            and data.get('version') != product_service.changelog.version:
+        threading.Thread(target=sync_task, name='sync_task').start()
+    # Rules added or removed through another worker, which the ingest here has to see
+    if event == 'watch_rules':
+        product_service.watchlist.reload()
+
+
+sync_lock = threading.Lock()
+events.subscribe(on_remote_event)
+
+
+def observe_phase(phase, started):
+    """Record the duration of an ingest phase and return the start of the next one."""
+    now = time.perf_counter()
+    ingest_phase_seconds.observe(now - started, phase=phase)
+    return now
+
+
+def partition_task():
+    """Create upcoming price history partitions and archive the expired ones."""
+    try:
+        product_service.partitions.maintain(PRICE_HISTORY_RETENTION_MONTHS)
+    except Exception as e:
+        print(f'Partition maintenance failed: {e}')
 
 
 @app.route('/api/reload', methods=['POST'])
 def reload():
-    thread = threading.Thread(target=download_task)
+    thread = threading.Thread(target=download_task, name='download_task')
     thread.start()  # Start the background task
     return jsonify({"message": "Reload task started!"}), 202
 
 
 @app.route('/start', methods=['POST'])
 def start():
-    thread = threading.Thread(target=run_daily_task)
+    thread = threading.Thread(target=run_daily_task, name='run_daily_task')
     thread.start()
     try:
         return jsonify({"message": "Daily task started!"}), 202
@@ -114,9 +453,12 @@ def start():
 def image(height, sku):
     if_none_match = request.headers.get('If-None-Match')
     if if_none_match: # If the browser has a cached version, then let it use it
+        image_requests.inc(result='not_modified')
         return '', 304
 
-    url = f'https://www.bcliquorstores.com/sites/default/files/imagecache/{height}/{sku}.jpg'
+    import requests
+
+    url = f'{BCL_IMAGE_URL}/{height}/{sku}.jpg'
     download_path = os.path.join(IMAGE_LOC, f'{sku}.jpg')
 
     # Create downloads directory if it doesn't exist
@@ -125,16 +467,26 @@ def image(height, sku):
     # Check if image already exists locally
     if not os.path.exists(download_path):
         print(f'Downloading image for SKU: {sku}. URL: {url}')
-        response = requests.get(url)
+        started = time.perf_counter()
+        try:
+            response = requests.get(url)
+        except requests.RequestException:
+            image_requests.inc(result='error')
+            raise
+        finally:
+            image_upstream_seconds.observe(time.perf_counter() - started)
         if response.status_code == 200:
+            image_requests.inc(result='miss')
             print(f'Image for SKU: {sku} downloaded successfully.')
             with open(download_path, 'wb') as f:
                 f.write(response.content)
         else:
             print(f'Failed to download image for SKU: {sku}. Status code: {response.status_code}')
+            image_requests.inc(result='error')
             return jsonify({"error": "Image not found"}), 404
     else:
         print(f'Image for SKU: {sku} already exists locally.')
+        image_requests.inc(result='hit')
 
     # Generate ETag from file content
     with open(download_path, 'rb') as f:
@@ -157,28 +509,76 @@ def image(height, sku):
     return web_response
 
 
+@app.route('/admin/queries', methods=['GET', 'POST'])
+def query_stats():
+    # An admin endpoint like /admin/profile: only served when PROFILING is set. A POST also resets the statistics
+    if not PROFILING:
+        return jsonify({"error": "Not found"}), 404
+    data = {
+        'slow_ms': query_profiler.slow_ms,
+        'queries': query_profiler.snapshot(),
+    }
+    if request.method == 'POST':
+        query_profiler.reset()
+    return jsonify(data)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app.route('/ping', methods=['GET'])
 def ping():
     return jsonify("pong"), 200
 
-def web_start():
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    return jsonify(warmup.to_json_model()), 200 if warmup.ready else 503
+
+
+def web_start(progress=None):
+    """
+    Load the catalog.
+
+    :param progress: Optional Warmup reporting the steps.
+    """
+    step = progress.step if progress else lambda name: None
+    # Ingest announcements of the other workers
+    events.ensure_started()
+
+    step('repositories')
     product_service.load_repos()
 
-    if product_service.product_repo.db_helper.offline:
+    # With a local tier the catalog is served from it while the database is down
+    if product_service.db_helper.offline and not product_service.products:
+        step('feed')
         bcl = BCLService()
         bcl.download_json(BCL_URL, JSON_LOC)
         product_service.load_products(JSON_LOC)
+        # Not the stored catalog: served without a version
+        product_service.set_products(product_service.feed_products)
+        if product_service.db_helper.local:
+            step('persist')
+            product_service.persist_products()
+    catalog_products.set(len(product_service.products))
+
+
+warmup = Warmup(web_start)
 
 # gunicorn
 if __name__ == 'src.app':
-    web_start()
+    # The master only imports (--preload), every worker starts its own warm-up as soon as it is forked
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=warmup.ensure_started)
 elif __name__ == '__main__':
 
     start()
 
     if os.getenv('ENV') == 'local':
 
-        web_start()
+        warmup.ensure_started()
         app.run(host='0.0.0.0', port=80, debug=True, use_reloader=False)
     else:
         print(f'WEB STARTED {__name__}. Port {PORT}')
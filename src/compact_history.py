@@ -0,0 +1,26 @@
+import os
+
+from dotenv import load_dotenv
+
+from services.product_service import ProductService
+
+load_dotenv()
+
+DB_URL = os.getenv('DB_URL')
+DB_USER = os.getenv('DB_USER')
+DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_DBNAME = os.getenv('DB_DBNAME')
+
+
+def main():
+    """
+    One-time migration: compact `price_history` into `price_history_intervals`.
+    """
+    product_service = ProductService(DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False)
+    product_service.load_repos()
+    count = product_service.price_history_repo.compact_history()
+    print(f'{count} price intervals written.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,99 +1,611 @@
 import logging
-from typing import Any, List, Optional, Tuple
+import threading
+import time
+import zlib
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 
-import psycopg2
-import pymysql
+import sqlite_backend
+from utils.metrics import db_connect_errors, db_connect_seconds
+from utils.query_profiler import QueryProfiler, query_profiler
+from utils.run_state import file_lock
+
+BULK_BATCH_SIZE = 1000
+LAG_CHECK_INTERVAL = 5  # seconds between replica lag probes
+READ_RETRY_INTERVAL = 30  # seconds a failed read endpoint is skipped for
+OFFLINE_RETRY_INTERVAL = 10  # seconds between connection attempts while the primary is down
+
+# Tables copied to the local tier and their columns. The raw price_history is left out: the catalog and its
+# history are served from the intervals.
+LOCAL_TABLES = {
+    'countries': 'code, name',
+    'categories': 'id, name, parent_category_id, bcl_id',
+    'products': 'id, sku, name, category_id, country_code, description, volume, alcohol, upc, unit_size, '
+                'sub_category_id, class_id, date_added, date_updated',
+    'product_upcs': 'sku, upc, position',
+    'price_history_intervals': 'sku, valid_from, valid_to, regular_price, current_price, promotion_start_date, '
+                               'promotion_end_date',
+    'watch_rules': 'id, subscriber, sku, category_id, max_price, max_price_per_litre, date_added, token_hash',
+}
+# Aggregates compared by `sync_local` before copying the large tables, which are not updated in place
+LOCAL_WATERMARKS = {
+    'product_upcs': 'COUNT(*)',
+    'price_history_intervals': 'COUNT(*), MAX(valid_to)',
+}
+
+
+def _mark_value(value: Any) -> str:
+    """
+    Format a watermark value the same way for all backends: SQLite returns dates as ISO text.
+    """
+    return '' if value is None else str(value).replace('T', ' ')[:19]
+
+
+def is_read_query(query: str) -> bool:
+    words = query.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in ('SELECT', 'WITH') and 'FOR UPDATE' not in query.upper()
 
 
 class DbHelper:
-    def __init__(self, config: dict):
+    def __init__(
+        self,
+        config: dict,
+        profiler: Optional[QueryProfiler] = None,
+        read_config: Optional[dict] = None,
+        max_replica_lag: float = 30,
+        local: Optional['DbHelper'] = None,
+    ):
         """
         Initialize the DbHelper with database connection configuration.
+        Three backends are supported: MySQL (`localhost` hosts), SQLite (a `sqlite` path key) and Postgres.
 
         :param config: A dictionary containing database connection parameters.
+        :param profiler: Optional statement profiler; defaults to the process-wide one.
+        :param read_config: Optional connection parameters of a read endpoint (replica) for plain reads.
+        :param max_replica_lag: Reads fall back to the primary while the replica lags more than this, in seconds.
+            It is also the window after a write during which the writing thread reads from the primary.
+        :param local: Optional local (SQLite) tier. Writes are mirrored to it and all queries are served from it
+            while the primary is unreachable, once it has been filled by `sync_local()`.
         """
         self.config = config
-        self.is_mysql = True
+        self.local = local
+        self.read_config = read_config
+        self.max_replica_lag = max_replica_lag
+        self.profiler = profiler or query_profiler
+        # Dialect of the primary, also used for queries routed to the replica before the primary was ever opened
+        self.is_mysql = self.backend == 'mysql'
         self.logger = logging.getLogger(__name__)
         self.offline = False
+        self._retry_at = 0.0
+        # Per-thread unit of work, so a background ingest does not capture web request queries
+        self._local = threading.local()
+        self._replica_lag: Optional[float] = None
+        self._replica_checked = 0.0
+        self._replica_down_until = 0.0
+        self._local_ready: Optional[bool] = None
 
-    def connect(self) -> pymysql.connections.Connection:
-        """
-        Establish and return a connection to the database.
+    @staticmethod
+    def backend_of(config: dict) -> str:
+        if 'sqlite' in config:
+            return 'sqlite'
+        if 'localhost' in config['host']:
+            return 'mysql'
+        return 'postgres'
 
-        :return: A pymysql database connection object.
-        """
+    @property
+    def backend(self) -> str:
+        return self.backend_of(self.config)
+
+    @classmethod
+    def _open(cls, config: dict) -> Any:
+        backend = cls.backend_of(config)
+        started = time.perf_counter()
         try:
-            if 'localhost' in self.config['host']:
-                return pymysql.connect(**self.config)
+            # The drivers are imported on first use, only the configured one is ever loaded
+            if backend == 'sqlite':
+                connection = sqlite_backend.connect(config['sqlite'])
+            elif backend == 'mysql':
+                import pymysql
+                connection = pymysql.connect(**config)
+            else:
+                import psycopg2
+                connection = psycopg2.connect(**config)
+        except Exception:
+            db_connect_errors.inc(backend=backend)
+            raise
+        db_connect_seconds.observe(time.perf_counter() - started, backend=backend)
+        return connection
 
-            self.is_mysql = False
-            return psycopg2.connect(**self.config)
+    def connect(self) -> Any:
+        """
+        Establish and return a connection to the database. A failure switches to offline mode, which the next
+        successful connection leaves.
 
+        :return: A database connection object, or None if the database is unreachable.
+        """
+        try:
+            connection = self._open(self.config)
         except Exception as e:
             self.offline = True
+            self._retry_at = time.monotonic() + OFFLINE_RETRY_INTERVAL
             self.logger.error(f"Database error: {str(e)}")
+            return None
+
+        if self.offline:
+            self.offline = False
+            self.logger.warning("Database reachable again, leaving offline mode.")
+        return connection
+
+    def connect_primary(self) -> Any:
+        """
+        Connect to the primary, without retrying more than once per OFFLINE_RETRY_INTERVAL while it is down.
+
+        :return: A database connection object, or None while offline.
+        """
+        if self.offline and time.monotonic() < self._retry_at:
+            return None
+        return self.connect()
+
+    def _require_tier(self) -> None:
+        """
+        Raise if a write has nowhere to go: the primary is down and there is no local tier.
+        """
+        if self.offline and not self.local:
+            raise ConnectionError("Database unreachable and no local tier configured")
+
+    def connect_read(self) -> Optional[Any]:
+        """
+        Establish a connection to the read endpoint, if one is configured, reachable and within the lag bound.
+
+        :return: A database connection object, or None when reads have to go to the primary.
+        """
+        now = time.monotonic()
+        if not self.read_config or now < self._replica_down_until:
+            return None
+
+        try:
+            connection = self._open(self.read_config)
+        except Exception as e:
+            self._replica_down_until = now + READ_RETRY_INTERVAL
+            self.logger.error(f"Read endpoint unavailable, using primary: {str(e)}")
+            return None
+
+        if now - self._replica_checked >= LAG_CHECK_INTERVAL:
+            self._replica_checked = now
+            self._replica_lag = self._probe_lag(connection)
+
+        if self._replica_lag is None or self._replica_lag > self.max_replica_lag:
+            connection.close()
+            return None
+
+        return connection
+
+    def _probe_lag(self, connection: Any) -> Optional[float]:
+        """
+        Measure the replication delay of the read endpoint in seconds. A server that is not a replica has no lag.
+
+        :return: The lag in seconds, or None if it could not be determined.
+        """
+        try:
+            backend = self.backend_of(self.read_config)
+            if backend == 'sqlite':
+                return 0.0
+            with connection.cursor() as cursor:
+                if backend == 'mysql':
+                    cursor.execute("SHOW SLAVE STATUS")
+                    row = cursor.fetchone()
+                    if not row:
+                        return 0.0
+                    columns = [x[0] for x in cursor.description]
+                    lag = row[columns.index('Seconds_Behind_Master')]
+                else:
+                    cursor.execute("""
+                        SELECT CASE
+                            WHEN NOT pg_is_in_recovery() THEN 0
+                            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                        END
+                    """)
+                    lag = cursor.fetchone()[0]
+            connection.commit()
+        except Exception as e:
+            self.logger.error(f"Could not measure replica lag: {str(e)}")
+            return None
+
+        if lag is None:
+            return None
+        if float(lag) > self.max_replica_lag:
+            self.logger.warning(f"Replica lag {float(lag):.1f}s exceeds {self.max_replica_lag}s, reading from primary.")
+        return float(lag)
+
+    def _mark_write(self) -> None:
+        self._local.last_write = time.monotonic()
+
+    def _reads_own_writes(self) -> bool:
+        """
+        Return True if the current thread wrote recently enough that a replica may not have its changes yet.
+        """
+        last_write = getattr(self._local, 'last_write', None)
+        return last_write is not None and time.monotonic() - last_write < self.max_replica_lag
+
+    @contextmanager
+    def primary(self) -> Iterator['DbHelper']:
+        """
+        Route every read of the current thread to the primary until the block exits, for reads that must see
+        the writes of another process (a replica may not have them yet).
+        """
+        previous = getattr(self._local, 'primary', False)
+        self._local.primary = True
+        try:
+            yield self
+        finally:
+            self._local.primary = previous
+
+    def _session_connection(self) -> Optional[Any]:
+        """
+        Return the connection of the unit of work open on the current thread, if any.
+        """
+        return getattr(self._local, 'connection', None)
+
+    def _acquire(self, read: bool = False) -> Tuple[Any, bool]:
+        """
+        Return a connection for a single statement and whether it belongs to an open session.
+        Session connections must not be committed or closed by the statement itself.
+
+        :param read: If True, the statement may be served by the read endpoint.
+        """
+        connection = self._session_connection()
+        if connection is not None:
+            return connection, True
+        if read and not self.offline and not self._reads_own_writes() and not getattr(self._local, 'primary', False):
+            connection = self.connect_read()
+            if connection is not None:
+                return connection, False
+        return self.connect_primary(), False
+
+    def _release(self, connection: Any, in_session: bool, commit: bool = True) -> None:
+        if in_session or connection is None:
+            return
+        try:
+            if commit:
+                connection.commit()
+        finally:
+            connection.close()
+
+    @contextmanager
+    def session(self) -> Iterator['DbHelper']:
+        """
+        Open a unit of work: every query issued from the current thread until the block exits runs on one
+        connection inside one transaction, which is committed once at the end or rolled back on error.
+        Nested sessions join the outer one. While the primary is down the unit of work goes to the local tier;
+        without one it raises ConnectionError.
 
+        Usage:
+            with db_helper.session():
+                repo.bulk_add(...)
+        """
+        if self._session_connection() is not None:
+            yield self
+            return
+
+        connection = self.connect_primary()
+        if connection is None:
+            self._require_tier()
+            with self.local.session():
+                yield self
+            return
+
+        self._local.connection = connection
+        self._local.savepoints = 0
+        try:
+            # The local tier mirrors the unit of work and is rolled back with it
+            with self.local.session() if self.local else nullcontext():
+                yield self
+                connection.commit()
+            self._mark_write()
+        except Exception:
+            self.logger.error("Session failed, rolling back.")
+            connection.rollback()
+            raise
+        finally:
+            self._local.connection = None
+            connection.close()
 
-    def execute_query(self, query: str, params: Optional[Tuple] = None, fetch_one: bool = False) -> Any:
+    @contextmanager
+    def try_lock(self, name: str) -> Iterator[bool]:
+        """
+        Try to take an exclusive lock shared by every process using the database, without waiting.
+        Postgres uses a session advisory lock and MySQL a named lock, both held by a dedicated connection, so they
+        are released if the process dies. SQLite, or a database that is down, falls back to a file lock in the run
+        directory, which only coordinates the processes of one host.
+
+        Usage:
+            with db_helper.try_lock('ingest') as acquired:
+                if acquired:
+                    ...
+
+        :param name: The lock name.
+        :return: Whether the lock was acquired; it is held until the block exits.
+        """
+        connection = None
+        if self.backend != 'sqlite':
+            connection = self.connect_primary()
+        if connection is None:
+            with file_lock(name) as acquired:
+                yield acquired
+            return
+
+        if self.backend == 'postgres':
+            # Outside a transaction, the connection is not left idle in transaction during the block
+            connection.autocommit = True
+            lock = ("SELECT pg_try_advisory_lock(%s)", (zlib.crc32(name.encode()),))
+            unlock = ("SELECT pg_advisory_unlock(%s)", (zlib.crc32(name.encode()),))
+        else:
+            lock = ("SELECT GET_LOCK(%s, 0)", (name,))
+            unlock = ("SELECT RELEASE_LOCK(%s)", (name,))
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(*lock)
+                acquired = bool(cursor.fetchone()[0])
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    with connection.cursor() as cursor:
+                        cursor.execute(*unlock)
+        finally:
+            connection.close()
+
+    @contextmanager
+    def savepoint(self, name: Optional[str] = None) -> Iterator[None]:
+        """
+        Isolate a block inside the open session: on error, only the work done since the savepoint is rolled back
+        and the exception is re-raised, leaving the surrounding transaction usable. Outside a session it is a no-op.
+
+        :param name: Optional savepoint name; a unique one is generated when omitted.
+        """
+        connection = self._session_connection()
+        if connection is None:
+            yield
+            return
+
+        self._local.savepoints += 1
+        name = name or f"sp_{self._local.savepoints}"
+        with connection.cursor() as cursor:
+            cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except Exception:
+            with connection.cursor() as cursor:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(f"RELEASE SAVEPOINT {name}")
+
+    def execute_query(
+        self,
+        query: str,
+        params: Optional[Tuple] = None,
+        fetch_one: bool = False,
+        primary: bool = False,
+        mirror: bool = True,
+    ) -> Any:
         """
         Execute a SQL query and return results.
+        Plain reads are routed to the read endpoint when one is configured, unless `primary` is set, the current
+        thread wrote recently or the replica lags too much.
 
         :param query: The SQL query to execute.
         :param params: Optional parameters for the SQL query.
         :param fetch_one: If True, fetches a single record; otherwise, fetches all records.
+        :param primary: If True, always run the query on the primary (read-your-writes).
+        :param mirror: If False, a write is not mirrored to the local tier (primary-only DDL and maintenance).
         :return: The query result. If fetch_one is True, returns a single record; otherwise, returns a list of records.
         """
         self.logger.debug(f"Executing query: {query[:100]}...")
-        connection = self.connect()
+        is_read = is_read_query(query)
+        connection, in_session = self._acquire(read=is_read and not primary)
         result = None
 
         if self.offline:
+            if not is_read:
+                self._require_tier()
+            # A local tier that was never synced would serve a partial catalog
+            if not self.local or (is_read and not self.local_ready):
+                return result
+            result = self.local.execute_query(query, params, fetch_one)
+            self._local.rowcount = getattr(self.local._local, 'rowcount', 0)
             return result
 
+        committed = False
+        started = time.perf_counter()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(query, params)
-                if fetch_one:
+                if cursor.description is None:
+                    # Statement without a result set (UPDATE/DELETE), psycopg2 refuses to fetch those
+                    result = None if fetch_one else []
+                elif fetch_one:
                     result = cursor.fetchone()
                 else:
                     result = cursor.fetchall()
-                connection.commit()
+                rows_affected = cursor.rowcount
+            committed = True
+            self._local.rowcount = rows_affected
+            if not is_read:
+                self._mark_write()
         except Exception as e:
+            self.profiler.record(query, (time.perf_counter() - started) * 1000, error=True)
             self.logger.error(f"Database error: {str(e)}")
             raise
+        else:
+            rows_returned = (1 if result else 0) if fetch_one else len(result or ())
+            is_slow = self.profiler.record(
+                query, (time.perf_counter() - started) * 1000, rows_returned,
+                rows_affected if rows_returned == 0 else 0)
+            if is_slow and self.profiler.explain and not in_session:
+                self._explain(connection, query, params)
         finally:
-            connection.close()
+            self._release(connection, in_session, committed)
+
+        if not is_read and mirror:
+            self._write_through('execute_query', query, params)
 
         return result
 
-    def insert_query(self, query: str, params: Optional[Tuple] = None) -> Any:
+    @property
+    def local_ready(self) -> bool:
+        """
+        Return True if the local tier holds a copy of the primary made by `sync_local()`, in this or an earlier run.
+        """
+        if self._local_ready is None and self.local:
+            row = self.local.execute_query("SELECT COUNT(*) FROM local_sync", fetch_one=True)
+            self._local_ready = bool(row and row[0])
+        return bool(self._local_ready)
+
+    def sync_local(self) -> None:
+        """
+        Copy the tables of the primary to the local tier: a new local tier, or one that missed writes while it was
+        unreachable. The small tables are always copied, as their rows are updated in place; the large ones only
+        when their watermark differs. The writes are mirrored from then on.
+        """
+        if not self.local or self.offline:
+            return
+        for table, columns in LOCAL_TABLES.items():
+            watermark = LOCAL_WATERMARKS.get(table)
+            if watermark:
+                query = f"SELECT {watermark} FROM {table}"
+                try:
+                    primary_mark = self.execute_query(query, fetch_one=True, primary=True)
+                except Exception as e:
+                    self.logger.warning(f"{table} not copied to the local tier: {str(e)}")
+                    continue
+                if self.offline:
+                    return
+                local_mark = self.local.execute_query(query, fetch_one=True)
+                if [_mark_value(value) for value in primary_mark] == [_mark_value(value) for value in local_mark]:
+                    continue
+
+            try:
+                rows = self.execute_query(f"SELECT {columns} FROM {table}", primary=True) or []
+            except Exception as e:
+                self.logger.warning(f"{table} not copied to the local tier: {str(e)}")
+                continue
+            if self.offline:
+                return
+            placeholders = ', '.join(['%s'] * len(columns.split(',')))
+            with self.local.session():
+                self.local.execute_query(f"DELETE FROM {table}")
+                self.local.bulk_insert_query(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+            print(f'{len(rows)} rows of {table} copied to the local tier')
+
+        self.local.execute_query("DELETE FROM local_sync")
+        self.local.execute_query("INSERT INTO local_sync (synced_at) VALUES (CURRENT_TIMESTAMP)")
+        self._local_ready = True
+
+    def execute_update(self, query: str, params: Optional[Tuple] = None) -> int:
+        """
+        Execute an UPDATE or DELETE.
+
+        :return: The number of rows it changed.
+        """
+        self._local.rowcount = 0
+        self.execute_query(query, params)
+        return self._local.rowcount
+
+    def _write_through(self, method: str, *args: Any) -> None:
+        """
+        Mirror a successful write to the local tier. The local tier is a cache: its failures are logged, not raised.
+        """
+        if not self.local:
+            return
+        try:
+            getattr(self.local, method)(*args)
+        except Exception as e:
+            self.logger.error(f"Local tier write failed: {str(e)}")
+
+    def _explain(self, connection: Any, query: str, params: Optional[Tuple]) -> None:
+        """
+        Log the EXPLAIN ANALYZE plan of a slow read. Only Postgres SELECTs are explained, as ANALYZE re-executes
+        the statement.
+        """
+        if self.backend != 'postgres' or not query.lstrip().upper().startswith('SELECT'):
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+                self.profiler.log_plan(query, cursor.fetchall())
+        except Exception as e:
+            self.logger.error(f"Could not explain query: {str(e)}")
+
+    def insert_query(self, query: str, params: Optional[Tuple] = None, mirror: bool = True) -> Any:
         """
         Executes an SQL query that inserts data into the database and returns the ID of the last inserted row.
 
         :param query: SQL query string to be executed. Should be an INSERT statement.
         :param params: Optional tuple of parameters to be passed to the query. Defaults to None.
+        :param mirror: If False, the insert is not mirrored to the local tier.
         :return: The ID of the last inserted row. Returns None if no row was inserted.
         """
-        connection = self.connect()
+        connection, in_session = self._acquire()
         result = None
 
         if self.offline:
-            return result
+            self._require_tier()
+            return self.local.insert_query(query, params)
 
+        committed = False
+        started = time.perf_counter()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(query, params)
                 result = cursor.lastrowid
-                connection.commit()
+                rows_affected = cursor.rowcount
+            committed = True
+            self._mark_write()
         finally:
-            connection.close()
+            self.profiler.record(
+                query, (time.perf_counter() - started) * 1000,
+                rows_affected=rows_affected if committed else 0, error=not committed)
+            self._release(connection, in_session, committed)
 
+        if mirror:
+            self._write_through('insert_query', query, params)
         return result
 
+    def insert_row(self, table: str, columns: Sequence[str], params: Tuple) -> Any:
+        """
+        Insert a row into a table with a generated `id` column and return that id.
+        The row is mirrored to the local tier under the primary's id, so that the local ids never drift.
+
+        :param table: The table to insert into.
+        :param columns: The inserted columns, without `id`.
+        :param params: The values of the columns.
+        :return: The id of the new row.
+        """
+        placeholders = ', '.join(['%s'] * len(columns))
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        if self.backend == 'postgres' and not self.offline:
+            # psycopg2 has no lastrowid
+            row = self.execute_query(query + " RETURNING id", params, mirror=False)
+            new_id = row[0][0] if row else None
+        else:
+            new_id = self.insert_query(query, params, mirror=False)
+
+        # Offline, the row went to the local tier only
+        if new_id is not None and not self.offline:
+            self._write_through(
+                'execute_query',
+                f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES (%s, {placeholders})", (new_id, *params))
+        return new_id
+
     def bulk_insert_query(self, query: str, params_list: List[Tuple]) -> None:
         """
         Executes a bulk insert SQL query.
+        Inside a session the rows are sent in batches, each under its own savepoint: a failing batch is rolled back
+        to its savepoint and the error is re-raised, so the unit of work is rolled back as a whole and the callers
+        can resync their in-memory state.
 
         :param query: SQL query string template for the bulk insert.
         :param params_list: List of parameter tuples to be inserted.
@@ -101,14 +613,41 @@ class DbHelper:
         if not params_list:
             return
 
-        connection = self.connect()
+        connection, in_session = self._acquire()
 
         if self.offline:
+            self._require_tier()
+            return self.local.bulk_insert_query(query, params_list)
+
+        if in_session:
+            for start in range(0, len(params_list), BULK_BATCH_SIZE):
+                batch = params_list[start:start + BULK_BATCH_SIZE]
+                started = time.perf_counter()
+                try:
+                    with self.savepoint(), connection.cursor() as cursor:
+                        cursor.executemany(query, batch)
+                        rows_affected = cursor.rowcount
+                except Exception as e:
+                    self.profiler.record(query, (time.perf_counter() - started) * 1000, error=True)
+                    self.logger.error(f"Batch of {len(batch)} rows at offset {start} failed: {str(e)}")
+                    raise
+                else:
+                    self.profiler.record(query, (time.perf_counter() - started) * 1000, rows_affected=rows_affected)
+                    self._write_through('bulk_insert_query', query, batch)
             return None
 
+        committed = False
+        started = time.perf_counter()
         try:
             with connection.cursor() as cursor:
                 cursor.executemany(query, params_list)
-                connection.commit()
+                rows_affected = cursor.rowcount
+            committed = True
+            self._mark_write()
         finally:
-            connection.close()
+            self.profiler.record(
+                query, (time.perf_counter() - started) * 1000,
+                rows_affected=rows_affected if committed else 0, error=not committed)
+            self._release(connection, in_session, committed)
+
+        self._write_through('bulk_insert_query', query, params_list)
@@ -18,6 +18,7 @@ DB_URL = os.getenv('DB_URL')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_DBNAME = os.getenv('DB_DBNAME')
+LOCAL_DB_PATH = os.getenv('LOCAL_DB_PATH')
 JSON_LOC = "data/products.json"
 CSV_LOC = "data/products.csv"
 FETCH = True #if len(sys.argv) == 2 and sys.argv[1] == 'fetch' else False
@@ -29,7 +30,7 @@ def main():
     logger.info("Starting Boozehound application...")
 
     bcl = None
-    product_service = ProductService(DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False)
+    product_service = ProductService(DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False, local_db_path=LOCAL_DB_PATH)
 
     if FETCH:
         bcl = BCLService()
@@ -39,7 +40,7 @@ def main():
     product_service.persist_products()
 
     if bcl:
-        bcl.write_products_to_csv(product_service.products, CSV_LOC)
+        bcl.write_products_to_csv(product_service.feed_products, CSV_LOC)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,28 @@
+import os
+
+from dotenv import load_dotenv
+
+from services.product_service import ProductService
+
+load_dotenv()
+
+DB_URL = os.getenv('DB_URL')
+DB_USER = os.getenv('DB_USER')
+DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_DBNAME = os.getenv('DB_DBNAME')
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv('PRICE_HISTORY_RETENTION_MONTHS', '24'))
+PRICE_HISTORY_ARCHIVE_DIR = os.getenv('PRICE_HISTORY_ARCHIVE_DIR', 'data/archive')
+
+
+def main():
+    """
+    Create the upcoming `price_history` partitions and archive the ones past the retention window.
+    """
+    product_service = ProductService(
+        DB_URL, DB_USER, DB_PASSWORD, DB_DBNAME, False, archive_dir=PRICE_HISTORY_ARCHIVE_DIR)
+    product_service.load_repos()
+    product_service.partitions.maintain(PRICE_HISTORY_RETENTION_MONTHS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from models.price_history import PriceHistory
+from utils.type_utils import get_float
+
+
+def _day(value: Any) -> Optional[str]:
+    return str(value)[:10] if value else None
+
+
+def naive(value: datetime) -> datetime:
+    # DB timestamps come back without a timezone, feed timestamps may carry one
+    return value.replace(tzinfo=None)
+
+
+class PriceInterval(BaseModel):
+    """
+    A run of identical prices for a sku, observed from `valid_from` through `valid_to`.
+    """
+    sku: str
+    valid_from: datetime
+    valid_to: datetime
+    regular_price: Optional[Union[str, float]] = None
+    current_price: Optional[Union[str, float]] = None
+    promotion_start_date: Optional[Union[date, datetime]] = None
+    promotion_end_date: Optional[Union[date, datetime]] = None
+
+    @staticmethod
+    def price_key_of(
+        regular_price: Any,
+        current_price: Any,
+        promotion_start_date: Any,
+        promotion_end_date: Any,
+    ) -> Tuple:
+        # Normalized so that DB decimals, feed strings and dates of either type compare equal
+        return (
+            get_float(regular_price), get_float(current_price), _day(promotion_start_date), _day(promotion_end_date)
+        )
+
+    def price_key(self) -> Tuple:
+        return self.price_key_of(
+            self.regular_price, self.current_price, self.promotion_start_date, self.promotion_end_date)
+
+    def holds(self, history: PriceHistory) -> bool:
+        """
+        Return True if the price history point has the same prices as this interval.
+        """
+        return self.price_key() == self.price_key_of(
+            history.regular_price, history.current_price, history.promotion_start_date, history.promotion_end_date)
+
+    @classmethod
+    def from_history(cls, history: PriceHistory) -> 'PriceInterval':
+        return cls(
+            sku=history.sku,
+            valid_from=history.last_updated,
+            valid_to=history.last_updated,
+            regular_price=history.regular_price,
+            current_price=history.current_price,
+            promotion_start_date=history.promotion_start_date,
+            promotion_end_date=history.promotion_end_date,
+        )
+
+    def to_price_history(self, last_updated: datetime) -> PriceHistory:
+        return PriceHistory(
+            sku=self.sku,
+            last_updated=last_updated,
+            regular_price=self.regular_price,
+            current_price=self.current_price,
+            promotion_start_date=self.promotion_start_date,
+            promotion_end_date=self.promotion_end_date,
+        )
+
+
+def intervals_to_points(intervals: List[PriceInterval]) -> List[PriceHistory]:
+    """
+    Expand chronologically ordered intervals of one sku into the change-point series: the first and last
+    observation of every run of the same current price.
+
+    :param intervals: Intervals of a single sku, ordered by `valid_from`.
+    :return: The price history points, in chronological order.
+    """
+    points: List[PriceHistory] = []
+    run_start = 0
+    for i, interval in enumerate(intervals):
+        is_last = i == len(intervals) - 1
+        if not is_last and get_float(intervals[i + 1].current_price) == get_float(interval.current_price):
+            continue
+
+        first, last = intervals[run_start], interval
+        points.append(first.to_price_history(first.valid_from))
+        if last.valid_to != first.valid_from:
+            points.append(last.to_price_history(last.valid_to))
+        run_start = i + 1
+
+    return points
@@ -0,0 +1,37 @@
+from datetime import date
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+
+class PriceStats(BaseModel):
+    """
+    Price statistics of a sku, day-weighted over its observed history.
+    """
+    current_price: float
+    min_price: float
+    max_price: float
+    mean_price: float
+    median_price: float
+    min_price_30d: float
+    max_price_30d: float
+    mean_price_30d: float
+    min_price_90d: float
+    max_price_90d: float
+    mean_price_90d: float
+    last_change: Optional[date] = None
+    days_since_change: int = 0
+    discount_vs_median: float = 0  # Fraction below the median price, negative when above
+
+    class Config:
+        frozen = True
+
+    def is_lowest_90d(self) -> bool:
+        return self.current_price <= self.min_price_90d
+
+    def to_json_model(self) -> dict[str, Any]:
+        data = self.model_dump(exclude={'current_price'})
+        data.update({
+            'is_lowest_90d': self.is_lowest_90d(),
+        })
+        return data
@@ -6,13 +6,26 @@ from pydantic import BaseModel, Field, model_validator
 from models.category import Category
 from models.country import Country
 from models.price_history import PriceHistory
+from models.price_stats import PriceStats
+from utils.interning import intern_pool
 from utils.type_utils import get_float
 
 BCL_PRODUCT_URL = "https://www.bcliquorstores.com/product/"
 
+# Named field sets of `to_json_model()`; the product details (tasting notes, price statistics) are left out of cards.
+# Cards only have flat values: countries and categories are referenced by code and id (see ProductService.lookups).
+FIELD_PROFILES = {
+    'card': (
+        'sku', 'name', 'upc', 'is_active', 'combined_score', 'country_code', 'category_ids', 'first_update',
+        'alcohol', 'volume', 'unit_size', 'ppml', 'regular_price', 'sale_price', 'promotion_end_date',
+        'discount_vs_median',
+    ),
+}
+
 
 class Product(BaseModel):
     upc: Optional[str] = None
+    upcs: Optional[List[str]] = None  # Every UPC of the product, `upc` is the first one
     sku: Optional[str] = None
     volume: Optional[Union[str, float]] = None  # Volume in liters
     unitSize: Optional[int]  # Number of units in the package
@@ -28,6 +41,7 @@ class Product(BaseModel):
     price_history: Optional[List[PriceHistory]] = None
     is_active: Optional[bool] = True
     first_update: Optional[datetime] = None
+    price_stats: Optional[PriceStats] = None  # Attached from the price analytics, not stored
 
     def get_numeric_volume(self) -> float:
         return get_float(self.volume)
@@ -81,6 +95,9 @@ class Product(BaseModel):
         # populate SubSubCategory
         values = cls.combine_sub_sub_category(values)
 
+        # Share one Category instance per id
+        values = cls.intern_categories(values)
+
         # Populate PriceHistory object
         values = cls.combine_history_fields(values)
 
@@ -91,7 +108,7 @@ class Product(BaseModel):
         country_name = values.pop('countryName', None)
         country_code = values.pop('countryCode', None)
         if country_name or country_code:
-            values['country'] = Country(name=country_name, code=country_code)
+            values['country'] = intern_pool.country(country_name, country_code)
         return values
 
     @classmethod
@@ -101,12 +118,20 @@ class Product(BaseModel):
             values['subSubCategory'] = subSubCategory
         return values
 
+    @classmethod
+    def intern_categories(cls: Type['Product'], values: dict) -> dict:
+        for key in ('category', 'subCategory', 'subSubCategory'):
+            if values.get(key) is not None:
+                values[key] = intern_pool.category(values[key])
+        return values
+
     @classmethod
     def populate_upc_from_list_or_sku(cls: Type['Product'], values: dict) -> dict:
         # Extract 'b' from the nested structure if it exists
         if 'upc' in values and isinstance(values['upc'], list):
             if len(values['upc']):
-                values['upc'] = values['upc'][0]
+                values['upcs'] = [str(x) for x in values['upc']]
+                values['upc'] = values['upcs'][0]
             else:
                 values['upc'] = values['sku']
 
@@ -131,18 +156,32 @@ class Product(BaseModel):
         return values
 
     def to_json_model(self) -> dict[str, Any]:
+        # Cached for the whole catalog: nothing here may depend on the current time (clients derive "new" items
+        # from `first_update`)
         data = self.model_dump(include={'name', 'sku', 'upc', 'tastingDescription', 'is_active'})
+        price = max(self.price_history, key=lambda x: x.last_updated).to_json_model() if self.price_history else None
+        full_category = [x for x in self.full_category() if x]
         data.update({
             'combined_score': int(self.combined_score()),
             'country': self.country.to_json_model(),
+            'country_code': self.country.code,
             'category': self.category.description,
-            'is_new': (datetime.now() - self.first_update).days < 7 if self.first_update else False,
+            'first_update': self.first_update.date().isoformat() if self.first_update else None,
             'alcohol': self.alcohol_score(),
             'volume': self.get_numeric_volume(),
             'unit_size': self.get_numeric_unit_size(),
             'ppml': self.price_per_milliliter(),
-            'price': max(self.price_history, key=lambda x: x.last_updated).to_json_model() if self.price_history else None,
-            'full_category': [x.to_json_model() for x in self.full_category() if x],
+            'price': price,
+            'regular_price': price['price'] if price else None,
+            'sale_price': price['sale_price'] if price else None,
+            'promotion_end_date': price['promotion_end_date'] if price else None,
+            'full_category': [x.to_json_model() for x in full_category],
+            'category_ids': [x.id for x in full_category],
+            'stats': self.price_stats.to_json_model() if self.price_stats else None,
+            # Flat copies so the client can sort on them
+            'discount_vs_median': self.price_stats.discount_vs_median if self.price_stats else 0,
+            'days_since_change': self.price_stats.days_since_change if self.price_stats else None,
+            'is_lowest_90d': self.price_stats.is_lowest_90d() if self.price_stats else False,
         })
 
         return data
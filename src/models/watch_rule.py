@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Any, Optional, Type
+
+from pydantic import BaseModel, model_validator
+
+
+class WatchRule(BaseModel):
+    """
+    A price alert: notify `subscriber` when a sku, or any product of a category, drops to a threshold.
+    A rule targets either a `sku` or a `category_id` and has either a `max_price` or a `max_price_per_litre`.
+    """
+    id: Optional[int] = None
+    subscriber: str
+    sku: Optional[str] = None
+    category_id: Optional[int] = None
+    max_price: Optional[float] = None
+    max_price_per_litre: Optional[float] = None
+    date_added: Optional[datetime] = None
+    token_hash: Optional[str] = None  # SHA-256 of the owner token, never sent to clients
+
+    class Config:
+        frozen = True
+
+    @model_validator(mode='after')
+    def validate_target(self: 'WatchRule') -> 'WatchRule':
+        if (self.sku is None) == (self.category_id is None):
+            raise ValueError('A rule needs exactly one of `sku` or `category_id`')
+        if (self.max_price is None) == (self.max_price_per_litre is None):
+            raise ValueError('A rule needs exactly one of `max_price` or `max_price_per_litre`')
+        return self
+
+    def threshold(self) -> float:
+        return self.max_price if self.max_price is not None else self.max_price_per_litre
+
+    def to_json_model(self) -> dict[str, Any]:
+        return self.model_dump(exclude={'token_hash'}, exclude_none=True)
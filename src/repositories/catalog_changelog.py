@@ -0,0 +1,126 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from utils.run_state import next_counter, read_counter
+
+CHANGELOG_VERSIONS = 20  # Catalog versions a client can be behind and still get a delta
+VERSION_COUNTER = 'catalog_version'
+
+Delta = Dict[str, Any]
+
+
+def diff(old: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]]) -> Delta:
+    """
+    :param old: The JSON models of the previous catalog by sku.
+    :param new: The JSON models of the new catalog by sku.
+    :return: The added models, the removed skus and the changed fields of the other products.
+    """
+    changed = {}
+    for sku, model in new.items():
+        previous = old.get(sku)
+        if previous is not None and previous != model:
+            changed[sku] = {key: value for key, value in model.items() if previous.get(key) != value}
+    return {
+        'added': {sku: model for sku, model in new.items() if sku not in old},
+        'removed': [sku for sku in old if sku not in new],
+        'changed': changed,
+    }
+
+
+def new_version() -> int:
+    """
+    Allocate the version of a newly persisted catalog, once per ingest by its leader. Versions are at least the
+    current time in seconds, so they keep growing if the run directory is wiped.
+    """
+    return next_counter(VERSION_COUNTER, int(time.time()) - 1)
+
+
+def stored_version() -> int:
+    """
+    :return: The version of the catalog in the database, to read before loading it; 0 if none was allocated.
+    """
+    return read_counter(VERSION_COUNTER)
+
+
+class CatalogChangelog:
+    """
+    Versions of the served catalog and the deltas between consecutive ones, for the last CHANGELOG_VERSIONS versions.
+    A version belongs to a persisted catalog (see `new_version`): every worker that loads it from the database serves
+    it under the same version, so they compute the same deltas. A catalog that was not persisted has version 0 and
+    is only sent as a full snapshot.
+    """
+
+    def __init__(self, retain: int = CHANGELOG_VERSIONS) -> None:
+        self.version = 0
+        self.models: Dict[str, Dict[str, Any]] = {}
+        # (from version, to version, delta)
+        self.entries: Deque[Tuple[int, int, Delta]] = deque(maxlen=retain)
+
+    def record(self, models: Sequence[Dict[str, Any]], version: int = 0) -> None:
+        """
+        Register the served catalog.
+
+        :param models: Its JSON models.
+        :param version: Its version, 0 if it is not a persisted catalog.
+        """
+        new = {model['sku']: model for model in models}
+        if not version:
+            self.entries.clear()
+        elif self.version and version != self.version:
+            self.entries.append((self.version, version, diff(self.models, new)))
+        self.version = version
+        self.models = new
+
+    def since(self, version: int) -> Optional[Delta]:
+        """
+        Merge the deltas from `version` to the current version.
+
+        :return: The delta, or None if `version` is unknown or too old.
+        """
+        if not version:
+            return None
+        if version == self.version:
+            return {'added': {}, 'removed': [], 'changed': {}}
+        entries = list(self.entries)
+        start = next((i for i, (from_version, _, _) in enumerate(entries) if from_version == version), None)
+        if start is None:
+            return None
+
+        added: Dict[str, Dict[str, Any]] = {}
+        removed: Dict[str, None] = {}
+        changed: Dict[str, Dict[str, Any]] = {}
+        for _, _, delta in entries[start:]:
+            for sku, model in delta['added'].items():
+                added[sku] = model
+                removed.pop(sku, None)
+                changed.pop(sku, None)
+            for sku in delta['removed']:
+                added.pop(sku, None)
+                changed.pop(sku, None)
+                removed[sku] = None
+            for sku, fields in delta['changed'].items():
+                if sku in added:
+                    added[sku] = {**added[sku], **fields}
+                else:
+                    changed[sku] = {**changed.get(sku, {}), **fields}
+        return {'added': added, 'removed': list(removed), 'changed': changed}
+
+    @staticmethod
+    def to_json_model(delta: Delta, fields: Optional[Sequence[str]] = None) -> Dict[str, List[Any]]:
+        """
+        :param fields: Project the models and changes on these fields.
+        """
+        def project(model: Dict[str, Any]) -> Dict[str, Any]:
+            return {key: value for key, value in model.items() if fields is None or key in fields}
+
+        changes = []
+        for sku, values in delta['changed'].items():
+            values = project(values)
+            if values:
+                changes.append({'sku': sku, **values})
+        return {
+            'added': [project(model) for model in delta['added'].values()],
+            'removed': delta['removed'],
+            'changed': changes,
+        }
@@ -3,6 +3,7 @@ from typing import Dict, Optional
 from db_helper import DbHelper
 
 from models.category import Category
+from utils.interning import intern_pool
 
 
 class CategoryRepository:
@@ -29,7 +30,10 @@ class CategoryRepository:
 
         print(f'\x1b[2K\r{len(categories) if categories else 0} categories loaded.')
 
-        return {bcl_id: Category(description=name, id=bcl_id) for name, bcl_id in categories}
+        categories_map = {bcl_id: Category(description=name, id=bcl_id) for name, bcl_id in categories}
+        # Stored categories are the canonical instances for feed parsing
+        intern_pool.seed_categories(categories_map.values())
+        return categories_map
 
     def get_or_add_category(
         self,
@@ -66,12 +70,9 @@ class CategoryRepository:
             return category.id
 
         # Insert category into the database
-        insert_query = """
-            INSERT INTO categories (name, parent_category_id, bcl_id)
-            VALUES (%s, %s, %s);
-        """
-        new_category_id = self.db_helper.insert_query(
-            insert_query, (category.description, parent_category_id, category.id))
+        new_category_id = self.db_helper.insert_row(
+            'categories', ('name', 'parent_category_id', 'bcl_id'),
+            (category.description, parent_category_id, category.id))
 
         # Update the in-memory dictionary
         self.categories_map[category.id] = category
@@ -3,6 +3,7 @@ from typing import Dict, Optional, Tuple
 from db_helper import DbHelper
 
 from models.country import Country
+from utils.interning import intern_pool
 
 
 class CountryRepository:
@@ -28,7 +29,10 @@ class CountryRepository:
             return {}
 
         print(f'\x1b[2K\r{len(countries)} countries loaded.')
-        return {code: Country(name=name, code=code) for name, code in countries}
+        countries_map = {code: Country(name=name, code=code) for name, code in countries}
+        # Stored countries are the canonical instances for feed parsing
+        intern_pool.seed_countries(countries_map.values())
+        return countries_map
 
     def get_or_add_country(self, country: Country) -> str:
         """
@@ -0,0 +1,143 @@
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from models.price_stats import PriceStats
+from repositories.price_history_store import EPOCH, day_offset
+from utils.type_utils import get_float
+
+WINDOWS = (30, 90)
+
+
+class PriceAnalytics:
+    """
+    Running price statistics per sku.
+    Each sku keeps its history as runs of the same price (first day, last day, price); new observations extend or
+    append runs, and only the statistics of the skus touched by an ingest are recomputed.
+    """
+
+    def __init__(self) -> None:
+        self.run_starts: Dict[str, array] = {}
+        self.run_ends: Dict[str, array] = {}
+        self.run_prices: Dict[str, array] = {}
+        self.stats: Dict[str, PriceStats] = {}
+
+    @classmethod
+    def from_intervals(cls, rows: Iterable[Tuple], today: Optional[date] = None) -> 'PriceAnalytics':
+        """
+        Build the analytics from price intervals.
+
+        :param rows: Tuples (sku, valid_from, valid_to, regular_price, current_price), ordered by sku, then valid_from.
+        :param today: The day rolling windows end on; defaults to today.
+        :return: The populated analytics.
+        """
+        analytics = cls()
+        for sku, valid_from, valid_to, _, current_price in rows:
+            analytics.add_days(sku, day_offset(valid_from), day_offset(valid_to), get_float(current_price))
+        analytics.refresh(analytics.run_starts.keys(), today)
+        return analytics
+
+    def add_days(self, sku: str, first_day: int, last_day: int, price: float) -> None:
+        """
+        Record that the sku was at `price` on every day from `first_day` through `last_day`.
+        """
+        starts = self.run_starts.setdefault(sku, array('i'))
+        ends = self.run_ends.setdefault(sku, array('i'))
+        prices = self.run_prices.setdefault(sku, array('f'))
+
+        if starts and prices[-1] == array('f', [price])[0] and first_day <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], last_day)
+        elif starts and first_day <= ends[-1]:
+            return  # Already recorded
+        else:
+            starts.append(first_day)
+            ends.append(last_day)
+            prices.append(price)
+
+    def last_price(self, sku: str) -> Optional[float]:
+        """
+        Return the latest recorded price of a sku, or None if it has no history.
+        """
+        prices = self.run_prices.get(sku)
+        return round(prices[-1], 2) if prices else None
+
+    def apply(self, changes: List[Tuple[Any, Optional[datetime]]], today: Optional[date] = None) -> None:
+        """
+        Fold the interval changes of an ingest in and recompute the statistics of the touched skus only.
+
+        :param changes: (interval, previous valid_to) pairs; the previous end is None for newly opened intervals.
+        :param today: The day rolling windows end on; defaults to today.
+        """
+        touched: Set[str] = set()
+        for interval, previous_valid_to in changes:
+            last_day = day_offset(interval.valid_to)
+            first_day = day_offset(previous_valid_to) + 1 if previous_valid_to else day_offset(interval.valid_from)
+            if first_day <= last_day:
+                self.add_days(interval.sku, first_day, last_day, get_float(interval.current_price))
+            touched.add(interval.sku)
+        self.refresh(touched, today)
+
+    def refresh(self, skus: Iterable[str], today: Optional[date] = None) -> None:
+        as_of = day_offset(today or date.today())
+        for sku in list(skus):
+            stats = self.compute(sku, as_of)
+            if stats is not None:
+                self.stats[sku] = stats
+
+    def compute(self, sku: str, as_of: int) -> Optional[PriceStats]:
+        """
+        Compute the statistics of a sku from its runs.
+
+        :param sku: The sku.
+        :param as_of: Day offset the rolling windows end on.
+        :return: The statistics, or None if the sku has no history.
+        """
+        starts, ends, prices = self.run_starts.get(sku), self.run_ends.get(sku), self.run_prices.get(sku)
+        if not starts:
+            return None
+
+        runs = list(zip(starts, ends, prices))
+        weighted = [(price, end - start + 1) for start, end, price in runs]
+        total_days = sum(days for _, days in weighted)
+
+        # Day-weighted median
+        median = weighted[0][0]
+        seen = 0
+        for price, days in sorted(weighted):
+            seen += days
+            if seen * 2 >= total_days:
+                median = price
+                break
+
+        windows = {}
+        for window in WINDOWS:
+            since = as_of - window + 1
+            in_window = [(price, end - max(start, since) + 1) for start, end, price in runs if end >= since]
+            if not in_window:
+                # Nothing observed recently, the last known price still applies
+                in_window = [(runs[-1][2], 1)]
+            window_days = sum(days for _, days in in_window)
+            windows[window] = (
+                min(price for price, _ in in_window),
+                max(price for price, _ in in_window),
+                sum(price * days for price, days in in_window) / window_days,
+            )
+
+        current_price = runs[-1][2]
+        last_change = EPOCH + timedelta(days=runs[-1][0])
+        return PriceStats(
+            current_price=round(current_price, 2),
+            min_price=round(min(prices), 2),
+            max_price=round(max(prices), 2),
+            mean_price=round(sum(price * days for price, days in weighted) / total_days, 2),
+            median_price=round(median, 2),
+            min_price_30d=round(windows[30][0], 2),
+            max_price_30d=round(windows[30][1], 2),
+            mean_price_30d=round(windows[30][2], 2),
+            min_price_90d=round(windows[90][0], 2),
+            max_price_90d=round(windows[90][1], 2),
+            mean_price_90d=round(windows[90][2], 2),
+            last_change=last_change if len(runs) > 1 else None,
+            days_since_change=max(0, as_of - runs[-1][0]),
+            discount_vs_median=round((median - current_price) / median, 4) if median else 0,
+        )
@@ -0,0 +1,180 @@
+import csv
+import gzip
+import logging
+import os
+from datetime import date
+from typing import List, Optional
+
+from db_helper import DbHelper
+
+HISTORY_COLUMNS = "last_updated, sku, regular_price, current_price, promotion_start_date, promotion_end_date, source"
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class PriceHistoryPartitions:
+    """
+    Maintenance of the monthly range partitions of `price_history`
+    (see schema/migrations/003_price_history_partitions*.sql).
+    Partitions are created ahead of time; the ones older than the retention window are written to a gzipped CSV
+    in the archive directory and dropped. The full change-point history stays in `price_history_intervals`.
+    Tables that are not partitioned, and SQLite, are left alone.
+    """
+
+    def __init__(self, db_helper: DbHelper, archive_dir: str = 'data/archive'):
+        """
+        :param db_helper: An instance of the DbHelper class.
+        :param archive_dir: Directory the expired partitions are archived to.
+        """
+        self.db_helper = db_helper
+        self.archive_dir = archive_dir
+
+    def partition_name(self, month: date) -> str:
+        if self.db_helper.is_mysql:
+            return f"p{month:%Y%m}"
+        return f"price_history_{month:%Y_%m}"
+
+    def month_of(self, name: str) -> Optional[date]:
+        """
+        Return the month of a partition from its name, or None for the default/catch-all partition.
+        """
+        digits = ''.join(x for x in name if x.isdigit())
+        if len(digits) != 6:
+            return None
+        return date(int(digits[:4]), int(digits[4:]), 1)
+
+    def list_partitions(self) -> List[str]:
+        """
+        Return the names of the partitions of `price_history`; empty if the table is not partitioned.
+        """
+        if self.db_helper.backend == 'sqlite':
+            return []
+        if self.db_helper.is_mysql:
+            query = """
+                SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'price_history' AND PARTITION_NAME IS NOT NULL
+            """
+        else:
+            query = """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                WHERE parent.relname = 'price_history'
+            """
+        rows = self.db_helper.execute_query(query, primary=True)
+        return sorted(name for name, in rows or [])
+
+    def oldest_unpartitioned_month(self) -> Optional[date]:
+        """
+        MySQL: return the month of the oldest row of the catch-all partition `p_future`, or None if it is empty.
+        """
+        row = self.db_helper.execute_query(
+            "SELECT MIN(last_updated) FROM price_history PARTITION (p_future)", fetch_one=True, primary=True)
+        return month_start(row[0]) if row and row[0] else None
+
+    def create_future_partitions(self, months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+        """
+        Create the partitions of the current month and the next `months_ahead` months that do not exist yet.
+        On MySQL the months of the rows still in `p_future` are created too.
+
+        :return: The names of the created partitions.
+        """
+        existing = self.list_partitions()
+        if not existing:
+            return []
+
+        current = month_start(today or date.today())
+        month = current
+        if self.db_helper.is_mysql:
+            # After the migration every existing row is in p_future: its months are split off first, oldest first,
+            # otherwise the first split would put all of them in the current month's partition
+            oldest = self.oldest_unpartitioned_month()
+            if oldest is not None and oldest < current:
+                month = oldest
+
+        created = []
+        while month <= add_months(current, months_ahead):
+            name = self.partition_name(month)
+            upper = add_months(month, 1)
+            if name in existing:
+                month = upper
+                continue
+            if self.db_helper.is_mysql:
+                # New ranges are split off the catch-all partition
+                query = f"""
+                    ALTER TABLE price_history REORGANIZE PARTITION p_future INTO (
+                        PARTITION {name} VALUES LESS THAN (TO_DAYS('{upper}')),
+                        PARTITION p_future VALUES LESS THAN MAXVALUE
+                    )
+                """
+            else:
+                query = f"""
+                    CREATE TABLE IF NOT EXISTS {name} PARTITION OF price_history
+                    FOR VALUES FROM ('{month}') TO ('{upper}')
+                """
+            self.db_helper.execute_query(query, mirror=False)
+            created.append(name)
+            print(f"Partition {name} was created.")
+            month = upper
+        return created
+
+    def archive_partition(self, name: str) -> str:
+        """
+        Write the rows of a partition to a gzipped CSV file, then drop the partition.
+
+        :return: The path of the archive file.
+        """
+        if self.db_helper.is_mysql:
+            select_query = f"SELECT {HISTORY_COLUMNS} FROM price_history PARTITION ({name})"
+            drop_queries = [f"ALTER TABLE price_history DROP PARTITION {name}"]
+        else:
+            select_query = f"SELECT {HISTORY_COLUMNS} FROM {name}"
+            drop_queries = [f"ALTER TABLE price_history DETACH PARTITION {name}", f"DROP TABLE {name}"]
+
+        rows = self.db_helper.execute_query(select_query, primary=True) or []
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"price_history_{self.month_of(name):%Y_%m}.csv.gz")
+        # Written under a temporary name so that a partially written archive is never mistaken for a complete one
+        with gzip.open(path + '.tmp', 'wt', encoding='utf8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([x.strip() for x in HISTORY_COLUMNS.split(',')])
+            writer.writerows(rows)
+        os.replace(path + '.tmp', path)
+
+        for query in drop_queries:
+            self.db_helper.execute_query(query, mirror=False)
+        print(f"Partition {name} archived to {path} ({len(rows)} rows).")
+        return path
+
+    def archive_expired(self, retention_months: int, today: Optional[date] = None) -> List[str]:
+        """
+        Archive and drop the partitions entirely older than `retention_months` months.
+
+        :return: The paths of the archive files.
+        """
+        cutoff = add_months(month_start(today or date.today()), -retention_months)
+        paths = []
+        for name in self.list_partitions():
+            month = self.month_of(name)
+            if month is not None and add_months(month, 1) <= cutoff:
+                paths.append(self.archive_partition(name))
+        return paths
+
+    def maintain(self, retention_months: int, months_ahead: int = 3) -> None:
+        """
+        Run the partition maintenance: create the upcoming partitions and archive the expired ones.
+        """
+        if self.db_helper.offline:
+            logging.warning("Database offline, skipping partition maintenance")
+            return
+        self.create_future_partitions(months_ahead)
+        if retention_months > 0:
+            self.archive_expired(retention_months)
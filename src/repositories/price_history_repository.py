@@ -1,12 +1,15 @@
+import heapq
 import logging
-from itertools import groupby
+from datetime import datetime
 from operator import itemgetter
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from db_helper import DbHelper
 
 from models.price_history import PriceHistory
+from models.price_interval import PriceInterval, intervals_to_points, naive
 from models.product import Product
+from repositories.price_history_store import PriceHistoryStore
 
 
 class PriceHistoryRepository:
@@ -22,8 +25,58 @@ class PriceHistoryRepository:
         """
         self.db_helper = db_helper
         self.history_map: Dict[str, List[PriceHistory]] = {}
+        # Latest price interval per sku, loaded on the first ingest
+        self.open_intervals: Optional[Dict[str, PriceInterval]] = None
 
     def load_history(self, sku) -> List[PriceHistory]:
+        """
+        Load the price change points of a sku from the interval table into the in-memory dictionary.
+        Falls back to the raw price history for skus that have no intervals yet.
+
+        :return: The price history points of the sku, in chronological order.
+        """
+        query = """SELECT
+    sku, valid_from, valid_to, regular_price, current_price, promotion_start_date, promotion_end_date
+FROM price_history_intervals WHERE sku = %s ORDER BY valid_from;"""
+
+        rows = self.db_helper.execute_query(query, (sku,))
+        if not rows:
+            return self.load_raw_history(sku)
+
+        price_histories_list = intervals_to_points([self._interval_from_row(row) for row in rows])
+        print(f'{len(rows)} price intervals loaded for sku {sku}.')
+
+        self.history_map[sku] = price_histories_list
+        return price_histories_list
+
+    def load_interval_rows(self) -> List[Tuple]:
+        """
+        Bulk-load the price intervals of the active catalog, the products seen in the last 30 days (see
+        `ProductRepository.load_products`). Their whole history is loaded, the rollups and analytics need it.
+
+        :return: Tuples (sku, valid_from, valid_to, regular_price, current_price), ordered by sku, then valid_from.
+        """
+        # The recent intervals are found through the valid_to index, the history of their skus through the primary key
+        query = """SELECT i.sku, i.valid_from, i.valid_to, i.regular_price, i.current_price
+FROM price_history_intervals i
+JOIN products p ON p.sku = i.sku
+WHERE i.sku IN (SELECT sku FROM price_history_intervals WHERE valid_to >= CURRENT_DATE - 30)
+ORDER BY i.sku, i.valid_from;"""
+
+        print('Loading price intervals from DB...', end='\r')
+        rows = self.db_helper.execute_query(query) or []
+        print(f'\x1b[2K\r{len(rows)} price intervals loaded.')
+        return rows
+
+    def load_history_store(self) -> PriceHistoryStore:
+        """
+        Bulk-load the price intervals of the active catalog into a compact in-memory store.
+
+        :return: The populated store.
+        """
+        return PriceHistoryStore.from_intervals(self.load_interval_rows())
+
+    def load_raw_history(self, sku) -> List[PriceHistory]:
 
         """
         Load all products price histories from the database into an in-memory dictionary.
@@ -71,125 +124,268 @@ FROM price_history WHERE sku = %s ORDER BY last_updated;"""
         if len(prices) < 2:
             return prices
 
-        # Sort by SKU and date
-        sorted_prices = sorted(prices, key=lambda x: (x[1], x[0]))  # sort by sku, then date
-        filtered_prices = []
-
-        # Group by SKU
-        for sku, sku_group in groupby(sorted_prices, key=itemgetter(1)):
-            sku_prices = list(sku_group)
-
-            if not sku_prices:
-                continue
+        # Group by SKU, keeping each group in chronological order
+        sku_groups: Dict[str, List[Tuple]] = {}
+        for row in sorted(prices, key=itemgetter(0)):
+            sku_groups.setdefault(row[1], []).append(row)
 
+        filtered_groups = []
+        for sku_prices in sku_groups.values():
             # Always keep the first and last price points for each SKU
-            filtered_prices.append(sku_prices[0])
+            kept = [0]
 
             # Add points where price changes
             for i in range(1, len(sku_prices)):
-                curr_price = sku_prices[i][3]  # current_price is at index 3
-                prev_price = sku_prices[i-1][3]
-
-                if curr_price != prev_price:
+                if sku_prices[i][3] != sku_prices[i - 1][3]:  # current_price is at index 3
                     # Add both the last price before change and first price after change
-                    filtered_prices.append(sku_prices[i-1])
-                    filtered_prices.append(sku_prices[i])
+                    if kept[-1] != i - 1:
+                        kept.append(i - 1)
+                    kept.append(i)
+
+            if kept[-1] != len(sku_prices) - 1:
+                kept.append(len(sku_prices) - 1)
+
+            filtered_groups.append([sku_prices[i] for i in kept])
+
+        # Merge the per-SKU runs back into chronological order
+        return list(heapq.merge(*filtered_groups, key=itemgetter(0)))
+
+    @staticmethod
+    def _interval_from_row(row: Tuple) -> PriceInterval:
+        sku, valid_from, valid_to, regular_price, current_price, promotion_start_date, promotion_end_date = row
+        return PriceInterval(
+            sku=sku,
+            valid_from=valid_from,
+            valid_to=valid_to,
+            regular_price=regular_price,
+            current_price=current_price,
+            promotion_start_date=promotion_start_date,
+            promotion_end_date=promotion_end_date,
+        )
+
+    def load_open_intervals(self) -> Dict[str, PriceInterval]:
+        """
+        Load the latest price interval of every sku.
+
+        :return: A dictionary mapping skus to their open interval.
+        """
+        query = """SELECT
+    i.sku, i.valid_from, i.valid_to, i.regular_price, i.current_price, i.promotion_start_date, i.promotion_end_date
+FROM price_history_intervals i
+JOIN (
+    SELECT sku, MAX(valid_from) AS valid_from
+    FROM price_history_intervals
+    GROUP BY sku
+) o ON i.sku = o.sku AND i.valid_from = o.valid_from
+"""
+        rows = self.db_helper.execute_query(query, primary=True)
+        return {row[0]: self._interval_from_row(row) for row in rows or []}
+
+    def build_intervals(self, rows: Iterable[Tuple]) -> List[PriceInterval]:
+        """
+        Collapse raw price history rows into intervals of identical prices.
 
-            # Add last price point if not already added
-            if sku_prices[-1] not in filtered_prices:
-                filtered_prices.append(sku_prices[-1])
+        :param rows: Price history tuples (last_updated, sku, regular_price, current_price, promo_start, promo_end),
+            ordered by sku, then date.
+        :return: The intervals, one per run of identical prices.
+        """
+        intervals: List[PriceInterval] = []
+        current: Optional[PriceInterval] = None
+        for last_updated, sku, regular_price, current_price, promotion_start_date, promotion_end_date in rows:
+            history = PriceHistory(
+                sku=sku,
+                last_updated=last_updated,
+                regular_price=regular_price,
+                current_price=current_price,
+                promotion_start_date=promotion_start_date,
+                promotion_end_date=promotion_end_date
+            )
+            if current is not None and current.sku == sku and current.holds(history):
+                current.valid_to = history.last_updated
+                continue
 
-        # Sort final result by date for chronological order
-        return sorted(filtered_prices, key=itemgetter(0))
+            current = PriceInterval.from_history(history)
+            intervals.append(current)
 
-    def get_or_add_price_history(
-        self,
-        product: Product,
-    ) -> Optional[str]:
+        return intervals
+
+    def compact_history(self) -> int:
         """
-        Retrieve the history ID if it exists in memory based on sku;
-        otherwise, insert the history into the database and return the new ID.
+        One-time migration: build the interval table from the raw price history.
+        Refused once the table holds intervals: the months of expired `price_history` partitions are archived and
+        dropped (see PriceHistoryPartitions), so only the intervals still hold them and a rebuild would lose them.
 
-        :param product: The product object with price history.
-        :return: The ID of the product, or None if price history is missing.
+        :return: The number of intervals written.
         """
-        if not product.price_history:
-            logging.warning(f"No price history found for product {product.sku}")
-            return None
+        existing = self.db_helper.execute_query(
+            "SELECT COUNT(*) FROM price_history_intervals", fetch_one=True, primary=True)
+        if existing[0]:
+            print('Price intervals already exist, the raw price history is not compacted again.')
+            return 0
 
-        try:
-            history = product.price_history[-1]
-        except IndexError:
-            logging.warning(f"Empty price history list for product {product.sku}")
-            return None
+        query = """SELECT
+    last_updated, sku, regular_price, current_price, promotion_start_date, promotion_end_date
+FROM price_history ORDER BY sku, last_updated;"""
+
+        print('Loading raw price history from DB...', end='\r')
+        rows = self.db_helper.execute_query(query, primary=True) or []
+        intervals = self.build_intervals(rows)
+        print(f'\x1b[2K\r{len(rows)} price histories compacted into {len(intervals)} intervals.')
+
+        with self.db_helper.session():
+            self.db_helper.bulk_insert_query(self._insert_intervals_query(), [
+                self._interval_params(interval) for interval in intervals
+            ])
+
+        self.open_intervals = None
+        return len(intervals)
+
+    def _insert_intervals_query(self) -> str:
+        if self.db_helper.is_mysql:
+            return """
+                INSERT IGNORE INTO price_history_intervals (
+                    sku, valid_from, valid_to, regular_price, current_price,
+                    promotion_start_date, promotion_end_date
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+        return """
+            INSERT INTO price_history_intervals (
+                sku, valid_from, valid_to, regular_price, current_price,
+                promotion_start_date, promotion_end_date
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (sku, valid_from) DO NOTHING
+        """
 
-        # Check if the history is already in memory
-        if history.sku in self.history_map and history in self.history_map[history.sku]:
-            return history.sku
+    @staticmethod
+    def _interval_params(interval: PriceInterval) -> Tuple:
+        return (
+            interval.sku, interval.valid_from, interval.valid_to, interval.regular_price, interval.current_price,
+            interval.promotion_start_date, interval.promotion_end_date
+        )
+
+    def bulk_add_price_intervals(
+        self,
+        histories: List[PriceHistory],
+    ) -> List[Tuple[PriceInterval, Optional[datetime]]]:
+        """
+        Record new price history points in the interval table: the open interval of a sku is extended while
+        its price holds, and a new interval is opened when the price changes.
+
+        :param histories: New price history points, at most one per sku.
+        :return: (interval, previous valid_to) for every extended interval, (interval, None) for every opened one.
+        """
+        if self.open_intervals is None:
+            self.open_intervals = self.load_open_intervals()
+
+        extended: List[PriceInterval] = []
+        opened: List[PriceInterval] = []
+        changes: List[Tuple[PriceInterval, Optional[datetime]]] = []
+        for history in histories:
+            interval = self.open_intervals.get(history.sku)
+            if interval is not None and naive(history.last_updated) <= naive(interval.valid_to):
+                continue
+
+            if interval is not None and interval.holds(history):
+                changes.append((interval, interval.valid_to))
+                interval.valid_to = history.last_updated
+                extended.append(interval)
+            else:
+                interval = PriceInterval.from_history(history)
+                self.open_intervals[history.sku] = interval
+                opened.append(interval)
+                changes.append((interval, None))
+
+        update_query = """
+            UPDATE price_history_intervals SET valid_to = %s
+            WHERE sku = %s AND valid_from = %s
+        """
+        self.db_helper.bulk_insert_query(
+            update_query, [(interval.valid_to, interval.sku, interval.valid_from) for interval in extended])
+        self.db_helper.bulk_insert_query(
+            self._insert_intervals_query(), [self._interval_params(interval) for interval in opened])
+        print(f"Extended {len(extended)} and opened {len(opened)} price intervals")
+        return changes
+
+    def _add_raw_histories(self, histories: List[PriceHistory]) -> None:
+        """
+        Insert price change points into the raw price history.
+        """
+        if not histories:
+            return
 
-        # Insert price history into the database
         insert_query = """
             INSERT INTO price_history (
-                last_updated, sku, regular_price, current_price, promotion_start_date, promotion_end_date, source
-            ) VALUES(%s, %s, %s, %s, %s, %s, 'bcl');
+                last_updated, sku, regular_price, current_price,
+                promotion_start_date, promotion_end_date, source
+            ) VALUES(%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (last_updated, sku) DO NOTHING;
         """
-        self.db_helper.insert_query(
-            insert_query,
+        self.db_helper.bulk_insert_query(insert_query, [
             (
                 history.last_updated, history.sku, history.regular_price, history.current_price,
-                history.promotion_start_date,
-                history.promotion_end_date
+                history.promotion_start_date, history.promotion_end_date, 'bcl'
             )
-        )
-
-        # Update the in-memory dictionary
-        self.history_map.setdefault(history.sku, []).append(history)
+            for history in histories
+        ])
+        print(f"Inserted {len(histories)} price changes")
 
-        print(f"Price history inserted for product {product.name}")
-        return history.sku
-
-    def bulk_add_price_histories(self, products: List[Product]) -> None:
+    def add_price_histories(
+        self,
+        histories: List[PriceHistory],
+    ) -> List[Tuple[PriceInterval, Optional[datetime]]]:
         """
-        Bulk insert price histories for multiple products.
+        Record new price history points. The intervals hold every observation; a raw `price_history` row is only
+        written when the price changes, for the first point of every opened interval.
 
-        :param products: List of products with price histories to insert.
+        :param histories: New price history points, at most one per sku.
+        :return: The price interval changes, see `bulk_add_price_intervals`.
         """
-        params_list = []
-        processed_histories: Set[tuple] = set()
-
-        for product in products:
-            if not product.price_history:
-                continue
+        changes = self.bulk_add_price_intervals(histories)
+        histories_map = {history.sku: history for history in histories}
 
-            history = product.price_history[-1]
-            history_key = (history.sku, history.last_updated)
+        # Update in-memory map
+        for interval, _ in changes:
+            self.history_map.setdefault(interval.sku, []).append(histories_map[interval.sku])
 
-            # Skip if history already exists in memory or was already processed
-            if (history.sku in self.history_map and history in self.history_map[history.sku]) or \
-               history_key in processed_histories:
-                continue
+        self._add_raw_histories(
+            [histories_map[interval.sku] for interval, previous_valid_to in changes if previous_valid_to is None])
+        return changes
 
-            params_list.append((
-                history.last_updated, history.sku, history.regular_price,
-                history.current_price, history.promotion_start_date,
-                history.promotion_end_date, 'bcl'
-            ))
-            processed_histories.add(history_key)
+    def get_or_add_price_history(
+        self,
+        product: Product,
+    ) -> Optional[str]:
+        """
+        Record the latest price history of a product, unless it is already recorded.
 
-            # Update in-memory map
-            self.history_map.setdefault(history.sku, []).append(history)
+        :param product: The product object with price history.
+        :return: The sku of the product, or None if price history is missing.
+        """
+        if not product.price_history:
+            logging.warning(f"No price history found for product {product.sku}")
+            return None
 
-        if not params_list:
+        try:
+            history = product.price_history[-1]
+        except IndexError:
+            logging.warning(f"Empty price history list for product {product.sku}")
             return None
 
-        print(f'Inserting {len(params_list)} price histories...')
+        if self.add_price_histories([history]):
+            print(f"Price history inserted for product {product.name}")
+        return history.sku
 
-        insert_query = """
-            INSERT INTO price_history (
-                last_updated, sku, regular_price, current_price,
-                promotion_start_date, promotion_end_date, source
-            ) VALUES(%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (last_updated, sku) DO NOTHING;
+    def bulk_add_price_histories(self, products: List[Product]) -> List[Tuple[PriceInterval, Optional[datetime]]]:
+        """
+        Bulk record the latest price histories of multiple products. Points already covered by the open interval
+        of their sku are skipped.
+
+        :param products: List of products with price histories to insert.
+        :return: The price interval changes, see `bulk_add_price_intervals`.
         """
-        self.db_helper.bulk_insert_query(insert_query, params_list)
-        print(f"Bulk inserted {len(params_list)} price histories")
+        # One point per sku
+        histories = list({
+            product.sku: product.price_history[-1] for product in products if product.price_history
+        }.values())
+        print(f'Recording {len(histories)} price histories...')
+        return self.add_price_histories(histories)
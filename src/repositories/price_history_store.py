@@ -0,0 +1,127 @@
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.type_utils import get_float
+
+EPOCH = date(2000, 1, 1)
+
+
+def day_offset(value: Any) -> int:
+    """
+    Convert a date, datetime or ISO string into a number of days since EPOCH.
+    """
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+class PriceHistoryStore:
+    """
+    Compact in-memory price history of the whole catalog.
+    The change points of all skus are kept in contiguous typed arrays (day offsets as int32, prices as float32),
+    with a per-sku (offset, length) index into them.
+    """
+
+    def __init__(self) -> None:
+        self.days = array('i')
+        self.prices = array('f')
+        self.regular_prices = array('f')
+        self.index: Dict[str, Tuple[int, int]] = {}
+
+    @classmethod
+    def from_intervals(cls, rows: Iterable[Tuple]) -> 'PriceHistoryStore':
+        """
+        Build the store from price intervals.
+
+        :param rows: Tuples (sku, valid_from, valid_to, regular_price, current_price), ordered by sku, then valid_from.
+        :return: The populated store.
+        """
+        store = cls()
+        sku = None
+        start = 0
+        run: Optional[List] = None  # [first_day, last_day, current_price, regular_price, last_regular_price]
+
+        for row_sku, valid_from, valid_to, regular_price, current_price in rows:
+            current_price, regular_price = get_float(current_price), get_float(regular_price)
+            if row_sku != sku:
+                if run is not None:
+                    store._add_run(run)
+                    store.index[sku] = (start, len(store.days) - start)
+                sku, start, run = row_sku, len(store.days), None
+
+            if run is not None and run[2] == current_price:
+                run[1], run[4] = day_offset(valid_to), regular_price
+                continue
+
+            if run is not None:
+                store._add_run(run)
+            run = [day_offset(valid_from), day_offset(valid_to), current_price, regular_price, regular_price]
+
+        if run is not None:
+            store._add_run(run)
+            store.index[sku] = (start, len(store.days) - start)
+
+        return store
+
+    def _add_run(self, run: List) -> None:
+        # A run of the same current price contributes its first and last observation
+        first_day, last_day, current_price, regular_price, last_regular_price = run
+        self.days.append(first_day)
+        self.prices.append(current_price)
+        self.regular_prices.append(regular_price)
+        if last_day != first_day:
+            self.days.append(last_day)
+            self.prices.append(current_price)
+            self.regular_prices.append(last_regular_price)
+
+    def __contains__(self, sku: str) -> bool:
+        return sku in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def span_days(self, sku: str) -> Optional[int]:
+        """
+        Return the number of days between the first and last point of a sku, or None if it is not in the store.
+        """
+        if sku not in self.index:
+            return None
+        offset, length = self.index[sku]
+        return self.days[offset + length - 1] - self.days[offset]
+
+    def nbytes(self) -> int:
+        return sum(x.itemsize * len(x) for x in (self.days, self.prices, self.regular_prices))
+
+    def to_json_model(self, sku: str, since_day: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Serialize the history of a sku in the format of `PriceHistory.to_json_model_simple`.
+
+        :param sku: The sku.
+        :param since_day: Optional first day to include. The price in effect on that day is reported as a point on it.
+        :return: The price points, or None if the sku is not in the store.
+        """
+        if sku not in self.index:
+            return None
+
+        offset, length = self.index[sku]
+        first = offset
+        if since_day is not None:
+            while first < offset + length and self.days[first] < since_day:
+                first += 1
+
+        data = [
+            {
+                'last_updated': datetime.combine(EPOCH + timedelta(days=self.days[i]), datetime.min.time()),
+                'price': round(self.prices[i], 2),
+            }
+            for i in range(first, offset + length)
+        ]
+        if offset < first < offset + length and self.days[first] != since_day:
+            data.insert(0, {
+                'last_updated': datetime.combine(EPOCH + timedelta(days=since_day), datetime.min.time()),
+                'price': round(self.prices[first - 1], 2),
+            })
+        return data
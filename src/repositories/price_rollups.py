@@ -0,0 +1,131 @@
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from repositories.price_history_store import EPOCH, day_offset
+from utils.type_utils import get_float
+
+# Bucket layout in the per-sku value arrays
+OPEN, CLOSE, LOW, HIGH, TOTAL, DAYS = range(6)
+STRIDE = 6
+
+
+def week_start(day: int) -> int:
+    # Monday of the week; EPOCH is a Saturday
+    return day - (EPOCH.weekday() + day) % 7
+
+
+def month_start(day: int) -> int:
+    value = EPOCH + timedelta(days=day)
+    return (date(value.year, value.month, 1) - EPOCH).days
+
+
+def next_week(start: int) -> int:
+    return start + 7
+
+
+def next_month(start: int) -> int:
+    value = EPOCH + timedelta(days=start)
+    year, month = (value.year + 1, 1) if value.month == 12 else (value.year, value.month + 1)
+    return (date(year, month, 1) - EPOCH).days
+
+
+RESOLUTIONS: Dict[str, Tuple[Callable[[int], int], Callable[[int], int]]] = {
+    'week': (week_start, next_week),
+    'month': (month_start, next_month),
+}
+
+
+class PriceRollups:
+    """
+    Per-sku open/close/min/max/average price per week and per month.
+    Prices are weighted by the number of days they were observed, from the price intervals.
+    Buckets are appended in chronological order, so new observations update them in place.
+    """
+
+    def __init__(self) -> None:
+        # resolution -> sku -> bucket start days / bucket values (STRIDE floats per bucket)
+        self.starts: Dict[str, Dict[str, array]] = {x: {} for x in RESOLUTIONS}
+        self.values: Dict[str, Dict[str, array]] = {x: {} for x in RESOLUTIONS}
+
+    @classmethod
+    def from_intervals(cls, rows: Iterable[Tuple]) -> 'PriceRollups':
+        """
+        Build the rollups from price intervals.
+
+        :param rows: Tuples (sku, valid_from, valid_to, regular_price, current_price), ordered by sku, then valid_from.
+        :return: The populated rollups.
+        """
+        rollups = cls()
+        for sku, valid_from, valid_to, _, current_price in rows:
+            rollups.add_days(sku, day_offset(valid_from), day_offset(valid_to), get_float(current_price))
+        return rollups
+
+    def add_days(self, sku: str, first_day: int, last_day: int, price: float) -> None:
+        """
+        Record that the sku was at `price` on every day from `first_day` through `last_day`.
+        Days must not precede the ones already recorded for the sku.
+        """
+        for resolution, (bucket_of, next_bucket) in RESOLUTIONS.items():
+            starts = self.starts[resolution].setdefault(sku, array('i'))
+            values = self.values[resolution].setdefault(sku, array('f'))
+            day = first_day
+            while day <= last_day:
+                start = bucket_of(day)
+                span_end = min(last_day, next_bucket(start) - 1)
+                days = span_end - day + 1
+
+                if starts and starts[-1] >= start:
+                    i = (len(starts) - 1) * STRIDE
+                    values[i + CLOSE] = price
+                    values[i + LOW] = min(values[i + LOW], price)
+                    values[i + HIGH] = max(values[i + HIGH], price)
+                    values[i + TOTAL] += price * days
+                    values[i + DAYS] += days
+                else:
+                    starts.append(start)
+                    values.extend((price, price, price, price, price * days, days))
+
+                day = span_end + 1
+
+    def apply(self, changes: List[Tuple[Any, Optional[datetime]]]) -> None:
+        """
+        Apply the interval changes of an ingest.
+
+        :param changes: (interval, previous valid_to) pairs; the previous end is None for newly opened intervals.
+        """
+        for interval, previous_valid_to in changes:
+            last_day = day_offset(interval.valid_to)
+            first_day = day_offset(previous_valid_to) + 1 if previous_valid_to else day_offset(interval.valid_from)
+            if first_day <= last_day:
+                self.add_days(interval.sku, first_day, last_day, get_float(interval.current_price))
+
+    def to_json_model(self, sku: str, resolution: str, since_day: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Serialize the buckets of a sku.
+
+        :param sku: The sku.
+        :param resolution: One of RESOLUTIONS.
+        :param since_day: Optional first day to include; the bucket containing it is included.
+        :return: One entry per bucket, `price` being the average price over the bucket.
+        """
+        starts = self.starts[resolution].get(sku)
+        if not starts:
+            return []
+
+        since = RESOLUTIONS[resolution][0](since_day) if since_day is not None else None
+        values = self.values[resolution][sku]
+        data = []
+        for n, start in enumerate(starts):
+            if since is not None and start < since:
+                continue
+            i = n * STRIDE
+            data.append({
+                'last_updated': datetime.combine(EPOCH + timedelta(days=start), datetime.min.time()),
+                'price': round(values[i + TOTAL] / values[i + DAYS], 2),
+                'open': round(values[i + OPEN], 2),
+                'close': round(values[i + CLOSE], 2),
+                'min': round(values[i + LOW], 2),
+                'max': round(values[i + HIGH], 2),
+            })
+        return data
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models.product import Product
+from utils.type_utils import get_float
+
+FLAGS = ('sale_only', 'is_new', 'single_only')
+NEW_DAYS = 7
+
+
+def popcount(bits: int) -> int:
+    return bin(bits).count('1')
+
+
+def is_on_sale(product: Product) -> bool:
+    if not product.price_history:
+        return False
+    price = max(product.price_history, key=lambda x: x.last_updated)
+    return get_float(price.current_price) < get_float(price.regular_price)
+
+
+def is_new(product: Product, now: datetime) -> bool:
+    return (now - product.first_update).days < NEW_DAYS if product.first_update else False
+
+
+class ProductFacets:
+    """
+    Facet counts of the catalog, conditional on the applied filters.
+    Every facet value (category at any level, country, flag) has a bitmap of its products, stored in a Python int
+    where bit i is the i-th product, so a filtered count is an AND of bitmaps and a popcount.
+    As usual for facets, the counts of a facet ignore the filter on that same facet: with a country selected, the
+    other countries still show how many products they would have.
+    The `is_new` bitmap depends on the time of the request: it is built per request from the products that were new
+    when the catalog was loaded, as the others can only have aged since.
+    """
+
+    def __init__(self) -> None:
+        self.all = 0
+        self.categories: Dict[int, int] = {}
+        self.category_labels: Dict[int, Dict[str, Any]] = {}
+        self.countries: Dict[str, int] = {}
+        self.country_names: Dict[str, Optional[str]] = {}
+        self.flags: Dict[str, int] = {x: 0 for x in FLAGS if x != 'is_new'}
+        # (first update, bit) of the products new at load time
+        self.new_products: List[Tuple[datetime, int]] = []
+
+    @classmethod
+    def from_products(cls, products: Iterable[Product], now: Optional[datetime] = None) -> 'ProductFacets':
+        now = now or datetime.now()
+        facets = cls()
+        for i, product in enumerate(products):
+            bit = 1 << i
+            facets.all |= bit
+            for level, category in enumerate(product.full_category()):
+                if category is None:
+                    continue
+                facets.categories[category.id] = facets.categories.get(category.id, 0) | bit
+                facets.category_labels.setdefault(category.id, {'description': category.description, 'level': level})
+            if product.country is not None:
+                code = product.country.code
+                facets.countries[code] = facets.countries.get(code, 0) | bit
+                facets.country_names.setdefault(code, product.country.name)
+            if is_on_sale(product):
+                facets.flags['sale_only'] |= bit
+            if is_new(product, now):
+                facets.new_products.append((product.first_update, bit))
+            if product.get_numeric_unit_size() == 1:
+                facets.flags['single_only'] |= bit
+        return facets
+
+    def flag_bits(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Return the bitmap of every flag at the given time.
+        """
+        cutoff = (now or datetime.now()) - timedelta(days=NEW_DAYS)
+        new_bits = 0
+        for first_update, bit in self.new_products:
+            if first_update > cutoff:
+                new_bits |= bit
+        return dict(self.flags, is_new=new_bits)
+
+    def _mask(self, category: Optional[int], country: Optional[str], flags: Dict[str, int],
+              exclude: Optional[str] = None) -> int:
+        mask = self.all
+        if category is not None and exclude != 'category':
+            mask &= self.categories.get(category, 0)
+        if country and exclude != 'country':
+            mask &= self.countries.get(country, 0)
+        for flag, bits in flags.items():
+            if flag != exclude:
+                mask &= bits
+        return mask
+
+    def to_json_model(self, category: Optional[int] = None, country: Optional[str] = None,
+                      flags: Iterable[str] = (), now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Count the products per facet value under the given filters; values without products are left out.
+
+        :param category: Id of the selected category (any level).
+        :param country: Code of the selected country.
+        :param flags: The set flags among FLAGS.
+        :param now: The time the `is_new` flag is evaluated at, the current time by default.
+        """
+        flag_bits = self.flag_bits(now)
+        flags = {x: flag_bits[x] for x in flags if x in flag_bits}
+
+        mask = self._mask(category, country, flags, exclude='category')
+        categories = {}
+        for category_id, bits in self.categories.items():
+            count = popcount(bits & mask)
+            if count:
+                categories[category_id] = dict(self.category_labels[category_id], count=count)
+
+        mask = self._mask(category, country, flags, exclude='country')
+        countries = {}
+        for code, bits in self.countries.items():
+            count = popcount(bits & mask)
+            if count:
+                countries[code] = {'name': self.country_names[code], 'count': count}
+
+        return {
+            'total': popcount(self._mask(category, country, flags)),
+            'categories': categories,
+            'countries': countries,
+            'flags': {x: popcount(flag_bits[x] & self._mask(category, country, flags, exclude=x)) for x in FLAGS},
+        }
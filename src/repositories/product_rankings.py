@@ -0,0 +1,109 @@
+import heapq
+import math
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models.product import Product
+from utils.type_utils import get_float
+
+TOP_N = 100  # Products kept per group and score
+
+# name -> scoring function, higher is better
+SCORES: Dict[str, Callable[[Product], float]] = {}
+
+GROUPS: Dict[str, Callable[[Product], Optional[str]]] = {
+    'category': lambda p: p.category.description if p.category else None,
+}
+
+
+def register_score(name: str) -> Callable[[Callable[[Product], float]], Callable[[Product], float]]:
+    """
+    Register a scoring function under `name`; rankings are precomputed for every registered score.
+    """
+    def decorator(fn: Callable[[Product], float]) -> Callable[[Product], float]:
+        SCORES[name] = fn
+        return fn
+    return decorator
+
+
+def latest_price(product: Product) -> Tuple[float, float]:
+    """
+    :return: The regular and current price of the last observation.
+    """
+    price = max(product.price_history, key=lambda x: x.last_updated)
+    return get_float(price.regular_price), get_float(price.current_price)
+
+
+@register_score('combined')
+def combined_score(product: Product) -> float:
+    return product.combined_score()
+
+
+@register_score('ppml')
+def cheapest_per_millilitre(product: Product) -> float:
+    return -product.price_per_milliliter()
+
+
+@register_score('alcohol_per_dollar')
+def alcohol_per_dollar(product: Product) -> float:
+    # Millilitres of pure alcohol per dollar
+    _, current_price = latest_price(product)
+    alcohol_ml = product.get_numeric_volume() * 1000 * product.get_numeric_unit_size() * product.alcohol_score() / 100
+    return alcohol_ml / current_price if current_price > 0 else 0
+
+
+@register_score('discount')
+def discount_depth(product: Product) -> float:
+    regular_price, current_price = latest_price(product)
+    return (regular_price - current_price) / regular_price if regular_price > 0 else 0
+
+
+class ProductRankings:
+    """
+    Top products per group for every registered score, selected with a heap at catalog load,
+    so a request only slices precomputed lists.
+    """
+
+    def __init__(self) -> None:
+        # score -> group -> [(score value, product)] in descending order; groups by their best score
+        self.rankings: Dict[str, Dict[str, List[Tuple[Optional[str], List[Tuple[float, Product]]]]]] = {}
+        self.json_models: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_products(cls, products: Iterable[Product], n: int = TOP_N) -> 'ProductRankings':
+        rankings = cls()
+        priced = [p for p in products if p.price_history]
+        for score_name, score in SCORES.items():
+            scored = []
+            for product in priced:
+                value = score(product)
+                if math.isfinite(value):
+                    scored.append((value, product))
+
+            rankings.rankings[score_name] = {}
+            for group_name, group_of in GROUPS.items():
+                groups: Dict[Optional[str], List[Tuple[float, Product]]] = {}
+                for item in scored:
+                    groups.setdefault(group_of(item[1]), []).append(item)
+                top = [(key, heapq.nlargest(n, items, key=lambda x: x[0])) for key, items in groups.items()]
+                top.sort(key=lambda x: x[1][0][0], reverse=True)
+                rankings.rankings[score_name][group_name] = top
+        return rankings
+
+    def to_json_model(self, score: str, group: str, n: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        :return: The top `n` products of every group, best group first; None if there is no such score or group.
+        """
+        top = self.rankings.get(score, {}).get(group)
+        if top is None:
+            return None
+        return [
+            {group: key, 'items': [dict(self._json_model(product), score=value) for value, product in items[:n]]}
+            for key, items in top
+        ]
+
+    def _json_model(self, product: Product) -> Dict[str, Any]:
+        # Serialized once per catalog, only for the products that made a top list
+        data = self.json_models.get(product.sku)
+        if data is None:
+            data = self.json_models[product.sku] = product.to_json_model()
+        return data
@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from db_helper import DbHelper
 
@@ -27,6 +27,7 @@ class ProductRepository:
         self.category_repository: CategoryRepository = category_repository
         self.country_repository: CountryRepository = country_repository
         self.history_repository: PriceHistoryRepository = history_repository
+        self.stored_upcs: Set[Tuple[str, str]] = set()
         self.products_map: Dict[str, Product] = self.load_products()
 
     def load_products(self) -> Dict[str, Product]:
@@ -35,23 +36,23 @@ class ProductRepository:
 
         :return: A dictionary mapping Product objects to product IDs.
         """
+        # The latest observation of a sku is the end of its last price interval
         query = """SELECT
     p.sku, name, category_id, country_code, description, volume, alcohol, upc, unit_size, id, sub_category_id, class_id,
-    last_updated, regular_price, current_price, promotion_start_date, promotion_end_date, last_update >= CURRENT_DATE - 2 as is_active, first_update
+    i.valid_to, i.regular_price, i.current_price, i.promotion_start_date, i.promotion_end_date, i.valid_to >= CURRENT_DATE - 2 as is_active, first_update
 FROM products p
 JOIN (
-    SELECT sku, MAX(last_updated) as last_update, MIN(last_updated) as first_update
-    FROM price_history
-    WHERE last_updated >= CURRENT_DATE - 90
+    SELECT sku, MAX(valid_from) as valid_from, MIN(valid_from) as first_update
+    FROM price_history_intervals
+    WHERE valid_to >= CURRENT_DATE - 90
     GROUP BY sku
 ) h ON p.sku = h.sku
-JOIN (
-    SELECT sku, last_updated, regular_price, current_price, promotion_start_date, promotion_end_date
-    FROM price_history
-) ph ON p.sku = ph.sku AND h.last_update = ph.last_updated
-WHERE h.last_update >= CURRENT_DATE - 30
+JOIN price_history_intervals i ON i.sku = h.sku AND i.valid_from = h.valid_from
+WHERE i.valid_to >= CURRENT_DATE - 30
 """
 
+        upcs_map = self.load_upcs()
+
         print('Loading products from DB...', end='\r')
         products = self.db_helper.execute_query(query)
         if not products:
@@ -106,6 +107,7 @@ WHERE h.last_update >= CURRENT_DATE - 30
                     volume=volume,
                     alcoholPercentage=alcohol,
                     upc=upc,
+                    upcs=upcs_map.get(sku),
                     unitSize=unit_size,
                     subCategory=sub_category,
                     subSubCategory=class_name,
@@ -124,6 +126,54 @@ WHERE h.last_update >= CURRENT_DATE - 30
         print(f"Successfully loaded {len(product_dict)} valid products")
         return product_dict
 
+    def load_upcs(self) -> Dict[str, List[str]]:
+        """
+        Load every UPC of the products, the ones stored in `products.upc` first.
+
+        :return: A dictionary mapping skus to their UPCs; empty if the product_upcs table does not exist yet.
+        """
+        # Rebuilt from the table, pairs of a rolled-back ingest are not considered stored anymore
+        self.stored_upcs = set()
+        query = "SELECT sku, upc FROM product_upcs ORDER BY sku, position"
+        try:
+            rows = self.db_helper.execute_query(query)
+        except Exception as e:
+            logging.warning(f"Could not load product UPCs, apply the product_upcs migration: {e}")
+            return {}
+
+        upcs_map: Dict[str, List[str]] = {}
+        for sku, upc in rows or []:
+            upcs_map.setdefault(sku, []).append(upc)
+            self.stored_upcs.add((sku, upc))
+        return upcs_map
+
+    def bulk_add_upcs(self, products: List[Product]) -> None:
+        """
+        Store the UPCs of the products that are not stored yet.
+
+        :param products: The products, with every UPC of the feed in `upcs`.
+        """
+        params_list = []
+        for product in products:
+            for position, upc in enumerate(product.upcs or []):
+                if (product.sku, upc) in self.stored_upcs:
+                    continue
+                params_list.append((product.sku, upc, position))
+
+        if not params_list:
+            return
+
+        if self.db_helper.is_mysql:
+            insert_query = "INSERT IGNORE INTO product_upcs (sku, upc, position) VALUES (%s, %s, %s)"
+        else:
+            insert_query = """
+                INSERT INTO product_upcs (sku, upc, position) VALUES (%s, %s, %s)
+                ON CONFLICT (sku, upc) DO NOTHING
+            """
+        self.db_helper.bulk_insert_query(insert_query, params_list)
+        self.stored_upcs.update((sku, upc) for sku, upc, _ in params_list)
+        print(f"Bulk inserted {len(params_list)} product UPCs")
+
     def get_or_add_product(
         self,
         product: Product,
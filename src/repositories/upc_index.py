@@ -0,0 +1,38 @@
+from typing import Dict, Iterable, Optional
+
+from models.product import Product
+from utils.gtin import normalize, normalize_stored
+
+
+class UpcIndex:
+    """
+    Hash index from normalized barcodes (GTIN-14) to skus, over every UPC of the served products.
+    A barcode shared by several products resolves to the best ranked one.
+    """
+
+    def __init__(self) -> None:
+        self.skus: Dict[str, str] = {}
+
+    @classmethod
+    def from_products(cls, products: Iterable[Product]) -> 'UpcIndex':
+        """
+        :param products: The products, best ranked first.
+        """
+        index = cls()
+        for product in products:
+            for code in product.upcs or ([product.upc] if product.upc else []):
+                gtin = normalize_stored(code)
+                if gtin is not None:
+                    index.skus.setdefault(gtin, product.sku)
+        return index
+
+    def lookup(self, code: str) -> Optional[str]:
+        """
+        :param code: A scanned barcode; it must carry a valid check digit.
+        :return: The sku of the product, or None if the code is invalid or unknown.
+        """
+        gtin = normalize(code)
+        return self.skus.get(gtin) if gtin is not None else None
+
+    def __len__(self) -> int:
+        return len(self.skus)
@@ -0,0 +1,78 @@
+import logging
+from typing import List, Optional
+
+from db_helper import DbHelper
+
+from models.watch_rule import WatchRule
+
+
+class WatchlistRepository:
+    def __init__(self, db_helper: DbHelper):
+        """
+        Initialize the WatchlistRepository with a DbHelper instance.
+
+        :param db_helper: An instance of the DbHelper class.
+        """
+        self.db_helper = db_helper
+
+    def load_rules(self, subscriber: Optional[str] = None, token_hash: Optional[str] = None) -> List[WatchRule]:
+        """
+        Load the watch rules from the database, from the primary so that a rule just written by another process is
+        seen.
+
+        :param subscriber: Only the rules of this subscriber, created with the owner token of `token_hash`.
+        :param token_hash: SHA-256 of the owner token, required with `subscriber`.
+        :return: The rules; empty if the watch_rules table does not exist yet.
+        """
+        query = """
+            SELECT id, subscriber, sku, category_id, max_price, max_price_per_litre, date_added, token_hash
+            FROM watch_rules
+        """
+        params = None
+        if subscriber is not None:
+            query += " WHERE subscriber = %s AND token_hash = %s"
+            params = (subscriber, token_hash)
+        try:
+            rows = self.db_helper.execute_query(query, params, primary=True)
+        except Exception as e:
+            logging.warning(f"Could not load watch rules, apply the watch_rules migrations: {e}")
+            return []
+        if not rows:
+            return []
+
+        return [
+            WatchRule(
+                id=id, subscriber=subscriber, sku=sku, category_id=category_id,
+                max_price=float(max_price) if max_price is not None else None,
+                max_price_per_litre=float(max_price_per_litre) if max_price_per_litre is not None else None,
+                date_added=date_added, token_hash=token_hash,
+            )
+            for id, subscriber, sku, category_id, max_price, max_price_per_litre, date_added, token_hash in rows
+        ]
+
+    def add_rule(self, rule: WatchRule) -> WatchRule:
+        """
+        Insert a watch rule.
+
+        :param rule: The rule to insert; its id is ignored.
+        :return: The rule with the id assigned by the database.
+        """
+        params = (
+            rule.subscriber, rule.sku, rule.category_id, rule.max_price, rule.max_price_per_litre, rule.token_hash)
+        new_id = self.db_helper.insert_row(
+            'watch_rules', ('subscriber', 'sku', 'category_id', 'max_price', 'max_price_per_litre', 'token_hash'),
+            params)
+
+        print(f"Watch rule for {rule.subscriber} was inserted with id {new_id}.")
+        return rule.model_copy(update={'id': new_id})
+
+    def remove_rule(self, rule_id: int, token_hash: str) -> bool:
+        """
+        Delete a watch rule.
+
+        :param rule_id: The id of the rule.
+        :param token_hash: SHA-256 of the owner token the rule was created with.
+        :return: False if there is no such rule with that token.
+        """
+        query = "DELETE FROM watch_rules WHERE id = %s AND token_hash = %s"
+        return self.db_helper.execute_update(query, (rule_id, token_hash)) > 0
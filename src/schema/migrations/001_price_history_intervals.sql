@@ -0,0 +1,14 @@
+-- Change-point compressed price history: one row per run of identical prices.
+-- After applying, run `python src/compact_history.py` once to build the intervals from `price_history`.
+-- MySQL: use DATETIME instead of TIMESTAMP.
+
+CREATE TABLE IF NOT EXISTS price_history_intervals (
+    sku VARCHAR(20) NOT NULL,
+    valid_from TIMESTAMP NOT NULL,
+    valid_to TIMESTAMP NOT NULL,
+    regular_price NUMERIC(10, 2),
+    current_price NUMERIC(10, 2),
+    promotion_start_date TIMESTAMP NULL,
+    promotion_end_date TIMESTAMP NULL,
+    PRIMARY KEY (sku, valid_from)
+);
@@ -0,0 +1,12 @@
+-- Price alerts: a rule targets a sku or a category (BCL id), with a price or a price per litre threshold.
+-- MySQL: use `id INT AUTO_INCREMENT PRIMARY KEY` and DATETIME instead of TIMESTAMP.
+
+CREATE TABLE IF NOT EXISTS watch_rules (
+    id SERIAL PRIMARY KEY,
+    subscriber VARCHAR(255) NOT NULL,
+    sku VARCHAR(20),
+    category_id INTEGER,
+    max_price NUMERIC(10, 2),
+    max_price_per_litre NUMERIC(10, 2),
+    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,7 @@
+-- MySQL: range-partition `price_history` by month on `last_updated` (requires a DATETIME column).
+-- Partitions are named pYYYYMM and split off `p_future` by `python src/maintain_partitions.py`: run it right after
+-- this migration, it creates one partition per month from the oldest row to the upcoming months.
+
+ALTER TABLE price_history PARTITION BY RANGE (TO_DAYS(last_updated)) (
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
@@ -0,0 +1,41 @@
+-- Postgres: turn `price_history` into a table range-partitioned by month on `last_updated`.
+-- Partitions are named price_history_YYYY_MM; `python src/maintain_partitions.py` (also run by the daily task)
+-- creates the upcoming ones and archives the ones past the retention window.
+-- Run `python src/compact_history.py` before archiving anything: the intervals keep the full history.
+-- MySQL: see 003_price_history_partitions.mysql.sql.
+
+BEGIN;
+
+ALTER TABLE price_history RENAME TO price_history_unpartitioned;
+
+CREATE TABLE price_history (LIKE price_history_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY RANGE (last_updated);
+ALTER TABLE price_history ADD PRIMARY KEY (last_updated, sku);
+CREATE INDEX price_history_sku_last_updated_idx ON price_history (sku, last_updated);
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE(MIN(last_updated), CURRENT_DATE)),
+            date_trunc('month', CURRENT_DATE) + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )::DATE
+        FROM price_history_unpartitioned
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF price_history FOR VALUES FROM (%L) TO (%L)',
+            'price_history_' || to_char(month, 'YYYY_MM'), month, (month + INTERVAL '1 month')::DATE
+        );
+    END LOOP;
+END $$;
+
+-- Catch-all for rows outside the created ranges, should stay empty
+CREATE TABLE price_history_default PARTITION OF price_history DEFAULT;
+
+INSERT INTO price_history SELECT * FROM price_history_unpartitioned;
+DROP TABLE price_history_unpartitioned;
+
+COMMIT;
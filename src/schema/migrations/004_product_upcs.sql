@@ -0,0 +1,12 @@
+-- Every UPC of a product, in feed order (`products.upc` only keeps the first one).
+-- MySQL: same statement.
+
+CREATE TABLE IF NOT EXISTS product_upcs (
+    sku VARCHAR(20) NOT NULL,
+    upc VARCHAR(20) NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (sku, upc)
+);
+
+INSERT INTO product_upcs (sku, upc, position)
+SELECT sku, upc, 0 FROM products WHERE upc IS NOT NULL AND upc <> '';
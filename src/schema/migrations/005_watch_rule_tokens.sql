@@ -0,0 +1,5 @@
+-- Price alerts are listed and deleted with the owner token returned when they are created; only its SHA-256 is
+-- stored. Rules created before this migration have no token and can no longer be deleted through the API.
+
+ALTER TABLE watch_rules ADD COLUMN token_hash VARCHAR(64);
+CREATE INDEX watch_rules_subscriber_idx ON watch_rules (subscriber);
@@ -0,0 +1,4 @@
+-- The active catalog is found from the intervals that ended recently, without scanning the whole history.
+-- MySQL: same statement.
+
+CREATE INDEX price_history_intervals_valid_to_idx ON price_history_intervals (valid_to);
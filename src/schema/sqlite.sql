@@ -0,0 +1,82 @@
+-- SQLite mirror of the production schema, used for local development, tests, benchmarks and the offline cache.
+-- Column names and keys match the Postgres/MySQL tables so the repositories run unchanged.
+
+CREATE TABLE IF NOT EXISTS countries (
+    code TEXT PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    parent_category_id INTEGER,
+    bcl_id INTEGER NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sku TEXT NOT NULL UNIQUE,
+    name TEXT,
+    category_id INTEGER,
+    country_code TEXT,
+    description TEXT,
+    volume REAL,
+    alcohol REAL,
+    upc TEXT,
+    unit_size INTEGER,
+    sub_category_id INTEGER,
+    class_id INTEGER,
+    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    date_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    last_updated TIMESTAMP NOT NULL,
+    sku TEXT NOT NULL,
+    regular_price REAL,
+    current_price REAL,
+    promotion_start_date TIMESTAMP,
+    promotion_end_date TIMESTAMP,
+    source TEXT,
+    PRIMARY KEY (last_updated, sku)
+);
+
+CREATE INDEX IF NOT EXISTS price_history_sku_idx ON price_history (sku, last_updated);
+
+-- Every UPC of a product, in feed order
+CREATE TABLE IF NOT EXISTS product_upcs (
+    sku TEXT NOT NULL,
+    upc TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (sku, upc)
+);
+
+-- Change-point compressed price history: one row per run of identical prices
+CREATE TABLE IF NOT EXISTS price_history_intervals (
+    sku TEXT NOT NULL,
+    valid_from TIMESTAMP NOT NULL,
+    valid_to TIMESTAMP NOT NULL,
+    regular_price REAL,
+    current_price REAL,
+    promotion_start_date TIMESTAMP,
+    promotion_end_date TIMESTAMP,
+    PRIMARY KEY (sku, valid_from)
+);
+CREATE INDEX IF NOT EXISTS price_history_intervals_valid_to_idx ON price_history_intervals (valid_to);
+
+-- Price alerts: a rule targets a sku or a category, with a price or a price per litre threshold
+CREATE TABLE IF NOT EXISTS watch_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subscriber TEXT NOT NULL,
+    sku TEXT,
+    category_id INTEGER,
+    max_price REAL,
+    max_price_per_litre REAL,
+    date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    token_hash TEXT
+);
+
+-- Local tier only: time of the last copy of the primary (see DbHelper.sync_local)
+CREATE TABLE IF NOT EXISTS local_sync (
+    synced_at TIMESTAMP NOT NULL
+);
@@ -2,9 +2,6 @@ import csv
 import json
 from typing import List
 
-import requests
-from tqdm import tqdm
-
 from models.product import Product
 
 
@@ -13,6 +10,10 @@ class BCLService:
         pass
 
     def download_json(self, url: str, output_path: str):
+        # Imported on first use to keep the application start fast
+        import requests
+        from tqdm import tqdm
+
         response = requests.get(url, stream=True)
         total_size = int(response.headers.get('content-length', 0))
         block_size = 1024  # 1 Kilobyte
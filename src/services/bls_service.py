@@ -2,9 +2,6 @@ import csv
 import json
 from typing import List
 
-import requests
-from tqdm import tqdm
-
 from models.product import Product
 
 
@@ -13,6 +10,9 @@ class BLSService:
         pass
 
     def download_json(self, url: str, output_path: str):
+        # Imported on first use to keep the application start fast
+        import requests
+        from tqdm import tqdm
 
         # Define the JSON payload
         payload = {
@@ -1,20 +1,50 @@
 
 import json
-from typing import List
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from db_helper import DbHelper
+from sqlite_backend import sqlite_path
 
 from models.product import Product
+from repositories.catalog_changelog import CatalogChangelog, new_version, stored_version
 from repositories.category_repository import CategoryRepository
 from repositories.country_repository import CountryRepository
+from repositories.price_analytics import PriceAnalytics
+from repositories.price_history_partitions import PriceHistoryPartitions
 from repositories.price_history_repository import PriceHistoryRepository
+from repositories.price_history_store import PriceHistoryStore
+from repositories.price_rollups import PriceRollups
+from repositories.product_facets import ProductFacets
+from repositories.product_rankings import ProductRankings
 from repositories.product_repository import ProductRepository
+from repositories.upc_index import UpcIndex
+from repositories.watchlist_repository import WatchlistRepository
+from services.watchlist_service import WatchlistService
+from utils import columnar
+from utils.type_utils import get_float
+
+MAX_COLUMNAR_BODIES = 8  # Field sets encoded per catalog, least recently used dropped first
 
 
 class ProductService:
-    def __init__(self, db_url: str, user: str, password: str, db_name: str, load_repos: bool = False) -> None:
+    def __init__(
+        self,
+        db_url: str,
+        user: str,
+        password: str,
+        db_name: str,
+        load_repos: bool = False,
+        read_db_url: Optional[str] = None,
+        max_replica_lag: float = 30,
+        local_db_path: Optional[str] = None,
+        outbox_path: str = 'data/outbox.jsonl',
+        archive_dir: str = 'data/archive',
+    ) -> None:
         print(f'Initializing ProductService with DB URL: {db_url}, User: {user}, DB Name: {db_name}')
-        if db_url == 'localhost':
+        if db_url and db_url.startswith('sqlite:'):
+            self.db_config = {'sqlite': sqlite_path(db_url)}
+        elif db_url == 'localhost':
             self.db_config = {
                 'host': db_url,
                 'user': 'cron_job',
@@ -29,22 +59,154 @@ class ProductService:
                 'dbname': db_name,
             }
 
+        # Reads can be served by a replica sharing the primary's credentials
+        if read_db_url and read_db_url.startswith('sqlite:'):
+            self.read_db_config = {'sqlite': sqlite_path(read_db_url)}
+        else:
+            self.read_db_config = {**self.db_config, 'host': read_db_url} if read_db_url else None
+        self.max_replica_lag = max_replica_lag
+        # Optional SQLite write-through cache, served from while the primary database is down
+        self.local_db_config = {'sqlite': local_db_path} if local_db_path else None
+        # Price alert notifications are appended to this JSONL file for delivery
+        self.outbox_path = outbox_path
+        # Expired price history partitions are archived there
+        self.archive_dir = archive_dir
 
         self.products: List[Product] = []
+        self.feed_products: List[Product] = []  # Parsed from the feed, served once persisted
+        self.products_by_sku: Dict[str, Product] = {}
+        self._json_models: Optional[List[Dict[str, Any]]] = None
+        self._lookups: Optional[Dict[str, Dict[str, str]]] = None
+        self._columnar: 'OrderedDict[Tuple[str, ...], bytes]' = OrderedDict()
+        self.changelog = CatalogChangelog()
+        self.history_store = PriceHistoryStore()
+        self.rollups = PriceRollups()
+        self.analytics = PriceAnalytics()
+        self.rankings = ProductRankings()
+        self.upc_index = UpcIndex()
+        self.facets = ProductFacets()
 
         if load_repos:
             self.load_repos()
 
     def load_repos(self) -> None:
-        db_helper = DbHelper(self.db_config)
-        self.country_repo = CountryRepository(db_helper)
-        self.category_repo = CategoryRepository(db_helper)
-        self.price_history_repo = PriceHistoryRepository(db_helper)
+        self.db_helper = DbHelper(
+            self.db_config,
+            read_config=self.read_db_config,
+            max_replica_lag=self.max_replica_lag,
+            local=DbHelper(self.local_db_config) if self.local_db_config else None,
+        )
+        self.db_helper.sync_local()
+        version = stored_version()
+        self.country_repo = CountryRepository(self.db_helper)
+        self.category_repo = CategoryRepository(self.db_helper)
+        self.price_history_repo = PriceHistoryRepository(self.db_helper)
+        self.partitions = PriceHistoryPartitions(self.db_helper, self.archive_dir)
+
+        self.product_repo = ProductRepository(
+            self.db_helper, self.category_repo, self.country_repo, self.price_history_repo)
+        self.watchlist = WatchlistService(WatchlistRepository(self.db_helper), self.outbox_path)
+
+        self.load_history()
+        self.serve_stored(self.product_repo.products_map, version)
+
+    def load_history(self) -> None:
+        """
+        Rebuild the in-memory price history store and rollups of the active catalog.
+        """
+        rows = self.price_history_repo.load_interval_rows()
+        self.history_store = PriceHistoryStore.from_intervals(rows)
+        self.rollups = PriceRollups.from_intervals(rows)
+        self.analytics = PriceAnalytics.from_intervals(rows)
+
+    def rank_products(self, products: Iterable[Product]) -> List[Product]:
+        """
+        Attach the price statistics to the products and sort them by the custom metric.
+        """
+        stats = self.analytics.stats
+        return sorted((p.model_copy(update={'price_stats': stats.get(p.sku)}) for p in products),
+                      key=lambda p: p.combined_score(), reverse=True)
+
+    def set_products(self, products: Iterable[Product], version: int = 0) -> None:
+        """
+        Replace the served catalog, record its version and precompute its top rankings, barcode index and facets.
+
+        :param version: The version of the persisted catalog (see `stored_version`), 0 for a catalog not persisted.
+        """
+        self.products = self.rank_products(products)
+        self.products_by_sku = {product.sku: product for product in self.products}
+        self._json_models = None
+        self._lookups = None
+        self._columnar = OrderedDict()
+        self.changelog.record(self.json_models(), version)
+        self.rankings = ProductRankings.from_products(self.products)
+        self.upc_index = UpcIndex.from_products(self.products)
+        self.facets = ProductFacets.from_products(self.products)
+
+    def serve_stored(self, products: Dict[str, Product], version: int) -> bool:
+        """
+        Serve a catalog loaded from the database. One read from the local tier while the primary is down is not the
+        versioned catalog, and an empty one leaves the served catalog in place.
 
-        self.product_repo = ProductRepository(db_helper, self.category_repo, self.country_repo, self.price_history_repo)
+        :param version: The version stored before the catalog was loaded.
+        :return: Whether the catalog was swapped in.
+        """
+        if self.db_helper.offline:
+            if not products:
+                print('Database unreachable, keeping the served catalog')
+                return False
+            version = 0
+        self.set_products(products.values(), version)
+        return True
 
-        self.products = sorted(list(self.product_repo.products_map.values()),
-                               key=lambda p: p.combined_score(), reverse=True)
+    def json_models(self) -> List[Dict[str, Any]]:
+        """
+        :return: The JSON models of the served products, serialized once per catalog.
+        """
+        models = self._json_models
+        if models is None:
+            models = self._json_models = [product.to_json_model() for product in self.products]
+        return models
+
+    def lookups(self) -> Dict[str, Dict[str, str]]:
+        """
+        :return: The names of the countries by code and the descriptions of the categories by id, referenced by the
+            `country_code` and `category_ids` fields of the JSON models.
+        """
+        lookups = self._lookups
+        if lookups is None:
+            lookups = self._lookups = {'countries': {}, 'categories': {}}
+            for product in self.products:
+                if product.country is not None:
+                    lookups['countries'][product.country.code] = product.country.name
+                for category in product.full_category():
+                    if category is not None:
+                        lookups['categories'][str(category.id)] = category.description
+        return lookups
+
+    def columnar(self, fields: Optional[Sequence[str]] = None, dumps: Callable[[Any], str] = json.dumps) -> bytes:
+        """
+        :param fields: The fields to include; all of them by default.
+        :param dumps: The JSON serializer.
+        :return: The catalog in the columnar format (see utils/columnar.py) as JSON, encoded once per catalog for the
+            most recently requested field sets.
+        """
+        models = self.json_models()
+        all_fields = tuple(models[0]) if models else ()
+        # The same fields in any order or repeated are one body, in the order of the JSON models
+        key = tuple(x for x in all_fields if x in set(fields)) if fields else all_fields
+        body = self._columnar.get(key)
+        if body is None:
+            data = dict(columnar.encode(models, key), version=self.changelog.version, lookups=self.lookups())
+            body = self._columnar[key] = dumps(data).encode('utf8')
+            while len(self._columnar) > MAX_COLUMNAR_BODIES:
+                self._columnar.popitem(last=False)
+        else:
+            self._columnar.move_to_end(key)
+        return body
+
+    def find_product(self, sku: Optional[str]) -> Optional[Product]:
+        return self.products_by_sku.get(sku) if sku else None
 
     def load_products(self, filename: str) -> None:
         with open(filename, 'r', encoding="utf8") as file:
@@ -52,34 +214,92 @@ class ProductService:
 
         hits = json_data.get("hits", {}).get("hits", [])
 
-        products = [Product(**hit.get("_source", {})) for hit in hits]
+        # Served once persisted and reloaded, under the version of the ingest
+        self.feed_products = [Product(**hit.get("_source", {})) for hit in hits]
+
+    def persist_products(self) -> int:
+        """
+        Persist the products of the feed in a single unit of work: either the whole snapshot is committed or nothing
+        is. A snapshot committed on the primary gets a new catalog version; one that only reached the local tier
+        while the primary is down does not.
+
+        :return: The number of new price history points.
+        """
+        products = self.feed_products
+        try:
+            with self.db_helper.session():
+                for country in {product.country for product in products if product.country is not None}:
+                    self.country_repo.get_or_add_country(country)
+
+                categories = {(product.category, product.subCategory, product.subSubCategory)
+                              for product in products}
+                for category, subCategory, subSubCategory in categories:
+                    if category:
+                        self.category_repo.get_or_add_category(
+                            subSubCategory,
+                            subCategory,
+                            category
+                        )
+
+                self.product_repo.bulk_add_products(products)
+                self.product_repo.bulk_add_upcs(products)
+                interval_changes = self.price_history_repo.bulk_add_price_histories(products)
+        except Exception:
+            # In-memory maps were updated optimistically, resync them with what is actually stored
+            self.country_repo.countries_map = self.country_repo.load_countries()
+            self.category_repo.categories_map = self.category_repo.load_categories()
+            self.product_repo.products_map = self.product_repo.load_products()
+            self.price_history_repo.history_map = {}
+            self.price_history_repo.open_intervals = None
+            raise
+        if self.db_helper.offline:
+            print('Database unreachable, the snapshot was only stored in the local tier')
+        else:
+            new_version()
+
+        # Alerts only look at the skus whose price changed, against their previous price
+        products_map = {product.sku: product for product in products}
+        price_changes = [
+            (products_map[interval.sku], self.analytics.last_price(interval.sku), get_float(interval.current_price))
+            for interval, previous_valid_to in interval_changes
+            if previous_valid_to is None and interval.sku in products_map
+        ]
 
-        # Sort products by the custom metric
-        self.products = sorted(products, key=lambda p: p.combined_score(), reverse=True)
+        # Rollups and analytics are maintained incrementally, only the new observations are folded in
+        self.rollups.apply(interval_changes)
+        self.analytics.apply(interval_changes)
 
-    def persist_products(self):
-        for country in {product.country for product in self.products if product.country is not None}:
-            self.country_repo.get_or_add_country(country)
+        self.watchlist.evaluate(price_changes)
+        return len(interval_changes)
 
-        categories = {(product.category, product.subCategory, product.subSubCategory) for product in self.products}
-        for category, subCategory, subSubCategory in categories:
-            if category:
-                self.category_repo.get_or_add_category(
-                    subSubCategory,
-                    subCategory,
-                    category
-                )
+    def sync_catalog(self) -> None:
+        """
+        Swap in the catalog persisted by another process, under the version its ingest stored: the countries,
+        categories, products, price history and watch rules are reloaded from the database, and the ingest caches are
+        dropped so that a later ingest here starts from the stored rows. Everything is read from the primary: the
+        ingest was just committed there and a replica may not have it yet.
+        """
+        version = stored_version()
+        with self.db_helper.primary():
+            self.country_repo.countries_map = self.country_repo.load_countries()
+            self.category_repo.categories_map = self.category_repo.load_categories()
+            self.price_history_repo.history_map = {}
+            self.price_history_repo.open_intervals = None
+            self.product_repo = ProductRepository(
+                self.db_helper, self.category_repo, self.country_repo, self.price_history_repo)
+            self.watchlist.reload()
 
-        self.product_repo.bulk_add_products(self.products)
-        self.price_history_repo.bulk_add_price_histories(self.products)
+            self.load_history()
+        self.serve_stored(self.product_repo.products_map, version)
 
     def reload_products(self):
         """Reload just the product repository and products from the database."""
+        version = stored_version()
         self.product_repo = ProductRepository(
-            DbHelper(self.db_config),
+            self.db_helper,
             self.category_repo,
             self.country_repo,
             self.price_history_repo
         )
-        self.products = sorted(list(self.product_repo.products_map.values()),
-                             key=lambda p: p.combined_score(), reverse=True)
+        if self.serve_stored(self.product_repo.products_map, version):
+            self.history_store = self.price_history_repo.load_history_store()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.product import Product
+from models.watch_rule import WatchRule
+from repositories.watchlist_repository import WatchlistRepository
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class WatchlistService:
+    """
+    Evaluates price alerts against the price changes of an ingest.
+    Rules are indexed by sku and by category, with their thresholds sorted, so a price change only looks at
+    the rules whose threshold lies between the new and the previous price.
+    Rules can be added and removed through any worker: the other workers reload their index when it announces the
+    change (see app.py), and listing and removing go to the database.
+    Rules are listed and removed with the owner token returned when they are created; only its hash is stored.
+    """
+
+    def __init__(self, watchlist_repo: WatchlistRepository, outbox_path: str) -> None:
+        self.watchlist_repo = watchlist_repo
+        self.outbox_path = outbox_path
+        self.lock = threading.Lock()
+        self.rules: Dict[int, WatchRule] = {}
+        # key -> sorted (threshold, rule id); keys are skus for sku rules and category ids for category rules
+        self.sku_index: Dict[str, List[Tuple[float, int]]] = {}
+        self.sku_litre_index: Dict[str, List[Tuple[float, int]]] = {}
+        self.category_index: Dict[int, List[Tuple[float, int]]] = {}
+        self.category_litre_index: Dict[int, List[Tuple[float, int]]] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """
+        Rebuild the index from the stored rules.
+        """
+        rules = self.watchlist_repo.load_rules()
+        with self.lock:
+            self.rules = {}
+            self.sku_index = {}
+            self.sku_litre_index = {}
+            self.category_index = {}
+            self.category_litre_index = {}
+            for rule in rules:
+                self._index(rule)
+
+    def _index_of(self, rule: WatchRule) -> Tuple[Dict[Any, List[Tuple[float, int]]], Any]:
+        if rule.sku is not None:
+            return (self.sku_index if rule.max_price is not None else self.sku_litre_index), rule.sku
+        return (self.category_index if rule.max_price is not None else self.category_litre_index), rule.category_id
+
+    def _index(self, rule: WatchRule) -> None:
+        index, key = self._index_of(rule)
+        insort(index.setdefault(key, []), (rule.threshold(), rule.id))
+        self.rules[rule.id] = rule
+
+    def add_rule(self, rule: WatchRule, token: str) -> WatchRule:
+        """
+        Persist and index a new rule.
+
+        :param token: The owner token, see `new_token()`.
+        """
+        rule = self.watchlist_repo.add_rule(rule.model_copy(update={'token_hash': hash_token(token)}))
+        with self.lock:
+            self._index(rule)
+        return rule
+
+    def remove_rule(self, rule_id: int, token: str) -> bool:
+        """
+        Delete a rule.
+
+        :param token: The owner token the rule was created with.
+        :return: False if there is no such rule with that token.
+        """
+        if not self.watchlist_repo.remove_rule(rule_id, hash_token(token)):
+            return False
+        with self.lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is not None:
+                index, key = self._index_of(rule)
+                entries = index[key]
+                entries.pop(bisect_left(entries, (rule.threshold(), rule.id)))
+                if not entries:
+                    del index[key]
+        return True
+
+    def rules_of(self, subscriber: str, token: str) -> List[WatchRule]:
+        return self.watchlist_repo.load_rules(subscriber, hash_token(token))
+
+    @staticmethod
+    def _crossed(entries: Optional[List[Tuple[float, int]]], previous: float, value: float) -> List[int]:
+        # Thresholds t with value <= t < previous: the ones the price just dropped to
+        if not entries:
+            return []
+        first = bisect_left(entries, (value, -1))
+        last = bisect_left(entries, (previous, -1))
+        return [rule_id for _, rule_id in entries[first:last]]
+
+    def evaluate(self, price_changes: List[Tuple[Product, Optional[float], float]]) -> List[Dict[str, Any]]:
+        """
+        Find the rules fired by the price changes of an ingest and write their notifications to the outbox.
+
+        :param price_changes: (product, previous price, new price) for every sku whose price changed; the previous
+            price is None for new products, which are not alerted.
+        :return: The notifications.
+        """
+        notifications = []
+        now = datetime.now()
+        with self.lock:
+            for product, previous, price in price_changes:
+                # Without a previous price nothing was crossed: a new product, or one whose history is not loaded
+                if previous is None or price >= previous:
+                    continue
+
+                fired = self._crossed(self.sku_index.get(product.sku), previous, price)
+
+                category_ids = {x.id for x in product.full_category() if x}
+                for category_id in category_ids:
+                    fired += self._crossed(self.category_index.get(category_id), previous, price)
+
+                litres = product.get_numeric_volume() * product.get_numeric_unit_size()
+                if litres > 0:
+                    previous_per_litre = previous / litres
+                    fired += self._crossed(self.sku_litre_index.get(product.sku), previous_per_litre, price / litres)
+                    for category_id in category_ids:
+                        fired += self._crossed(
+                            self.category_litre_index.get(category_id), previous_per_litre, price / litres)
+
+                for rule_id in fired:
+                    rule = self.rules[rule_id]
+                    notifications.append({
+                        'rule_id': rule.id,
+                        'subscriber': rule.subscriber,
+                        'sku': product.sku,
+                        'name': product.name,
+                        'price': price,
+                        'previous_price': previous,
+                        'price_per_litre': round(price / litres, 2) if litres > 0 else None,
+                        'threshold': rule.threshold(),
+                        'created': now.isoformat(),
+                    })
+
+        self.write_outbox(notifications)
+        print(f'{len(notifications)} price alerts for {len(price_changes)} price changes')
+        return notifications
+
+    def write_outbox(self, notifications: List[Dict[str, Any]]) -> None:
+        """
+        Append notifications to the outbox, one JSON document per line.
+        """
+        if not notifications:
+            return
+        os.makedirs(os.path.dirname(self.outbox_path) or '.', exist_ok=True)
+        with open(self.outbox_path, 'a', encoding='utf8') as file:
+            for notification in notifications:
+                file.write(json.dumps(notification) + '\n')
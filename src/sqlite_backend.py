@@ -0,0 +1,169 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema', 'sqlite.sql')
+CACHED_STATEMENTS = 512
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+_DATE_MATH_RE = re.compile(r'CURRENT_DATE\s*-\s*(\d+)', re.I)
+_NOW_RE = re.compile(r'\bNOW\(\)', re.I)
+_MYSQL_UPSERT_RE = re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE', re.I)
+_MYSQL_VALUES_RE = re.compile(r'\bVALUES\((\w+)\)', re.I)
+_MYSQL_LAST_ID_RE = re.compile(r'\bid\s*=\s*LAST_INSERT_ID\(id\)\s*,', re.I)
+
+# Columns added to existing tables after their creation: (table, column, type)
+ADDED_COLUMNS = [
+    ('watch_rules', 'token_hash', 'TEXT'),
+]
+
+_local = threading.local()
+_initialized: set = set()
+_init_lock = threading.Lock()
+
+# Store dates as ISO text so they compare and sort the same way as on the server databases
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+# NUMERIC columns of Postgres/MySQL, copied by DbHelper.sync_local
+sqlite3.register_adapter(Decimal, float)
+
+
+def sqlite_path(url: str) -> str:
+    """
+    Extract the database path from a `sqlite:///relative.db` or `sqlite:////absolute.db` URL.
+
+    :param url: The SQLite URL.
+    :return: The file system path of the database.
+    """
+    return url[len('sqlite:///'):] if url.startswith('sqlite:///') else url[len('sqlite:'):]
+
+
+@lru_cache(maxsize=256)
+def translate(query: str) -> str:
+    """
+    Rewrite the Postgres/MySQL dialect used by the repositories into SQLite.
+    Results are cached so that identical statements keep hitting SQLite's prepared statement cache.
+
+    :param query: SQL query using `%s` placeholders.
+    :return: The equivalent SQLite query.
+    """
+    query = _PLACEHOLDER_RE.sub('?', query)
+    query = _DATE_MATH_RE.sub(lambda m: f"date('now', '-{m.group(1)} days')", query)
+    query = _NOW_RE.sub('CURRENT_TIMESTAMP', query)
+    if _MYSQL_UPSERT_RE.search(query):
+        query = _MYSQL_LAST_ID_RE.sub('', query)
+        query = _MYSQL_UPSERT_RE.sub('ON CONFLICT DO UPDATE SET', query)
+        query = _MYSQL_VALUES_RE.sub(r'excluded.\1', query)
+    return query
+
+
+class SqliteCursor:
+    """
+    DB-API cursor wrapper exposing the context manager protocol of the pymysql/psycopg2 cursors.
+    """
+
+    def __init__(self, connection: 'SqliteConnection'):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+
+    def __enter__(self) -> 'SqliteCursor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.cursor.close()
+
+    def execute(self, query: str, params: Optional[Sequence] = None) -> None:
+        self.connection.begin()
+        self.cursor.execute(translate(query), params or ())
+
+    def executemany(self, query: str, params_list: List[Sequence]) -> None:
+        self.connection.begin()
+        self.cursor.executemany(translate(query), params_list)
+
+    def fetchone(self) -> Optional[Tuple]:
+        return self.cursor.fetchone()
+
+    def fetchall(self) -> List[Tuple]:
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self.cursor.lastrowid
+
+    @property
+    def description(self) -> Any:
+        return self.cursor.description
+
+
+class SqliteConnection:
+    """
+    Thread-bound SQLite connection. Transactions are opened explicitly on first use and `close()` keeps the
+    underlying connection (and its prepared statements) alive for the next query of the same thread.
+    """
+
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self)
+
+    def begin(self) -> None:
+        if not self.raw.in_transaction:
+            self.raw.execute('BEGIN')
+
+    def commit(self) -> None:
+        if self.raw.in_transaction:
+            self.raw.execute('COMMIT')
+
+    def rollback(self) -> None:
+        if self.raw.in_transaction:
+            self.raw.execute('ROLLBACK')
+
+    def close(self) -> None:
+        self.rollback()
+
+
+def initialize(raw: sqlite3.Connection, path: str) -> None:
+    with _init_lock:
+        if path in _initialized:
+            return
+        raw.execute('PRAGMA journal_mode=WAL')
+        with open(SCHEMA_PATH, 'r', encoding='utf8') as file:
+            raw.executescript(file.read())
+        for table, column, column_type in ADDED_COLUMNS:
+            if column not in {row[1] for row in raw.execute(f'PRAGMA table_info({table})')}:
+                raw.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+        _initialized.add(path)
+
+
+def connect(path: str) -> SqliteConnection:
+    """
+    Return the current thread's connection to the SQLite database at `path`, creating the schema on first use.
+
+    :param path: The file system path of the database.
+    :return: A connection wrapper usable by DbHelper.
+    """
+    connections: Dict[str, SqliteConnection] = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    if path not in connections:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Transactions are managed by SqliteConnection, not by the sqlite3 module
+        raw = sqlite3.connect(path, timeout=30, isolation_level=None, cached_statements=CACHED_STATEMENTS)
+        raw.execute('PRAGMA synchronous=NORMAL')
+        initialize(raw, path)
+        connections[path] = SqliteConnection(raw)
+
+    return connections[path]
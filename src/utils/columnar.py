@@ -0,0 +1,76 @@
+from typing import Any, Dict, Hashable, List, Sequence
+
+# Dictionary-encoded fields and the table their values go to
+TABLES = {
+    'country': 'countries',
+    'country_code': 'country_codes',
+    'category': 'category_names',
+    'full_category': 'categories',
+    'price.promotion_end_date': 'dates',
+    'promotion_end_date': 'dates',
+}
+
+# Nested objects are split in one column per key; an object whose columns are all null is null
+NESTED = {
+    'price': ('price', 'sale_price', 'promotion_end_date'),
+}
+
+
+def table_key(value: Any) -> Hashable:
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+
+class Encoder:
+    def __init__(self) -> None:
+        self.tables: Dict[str, List[Any]] = {}
+        self.indexes: Dict[str, Dict[Hashable, int]] = {}
+
+    def ref(self, table: str, value: Any) -> Any:
+        """
+        :return: The id of `value` in `table`, added if new; None for None.
+        """
+        if value is None:
+            return None
+        index = self.indexes.setdefault(table, {})
+        key = table_key(value)
+        ref = index.get(key)
+        if ref is None:
+            values = self.tables.setdefault(table, [])
+            ref = index[key] = len(values)
+            values.append(value)
+        return ref
+
+    def column(self, name: str, values: List[Any]) -> List[Any]:
+        table = TABLES.get(name)
+        if table is None:
+            return values
+        return [[self.ref(table, x) for x in value] if isinstance(value, list) else self.ref(table, value)
+                for value in values]
+
+
+def encode(models: Sequence[Dict[str, Any]], fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    Encode JSON models as columns: one array per field, in product order.
+    Repeated objects and strings (countries, categories, dates) are stored once in `tables` and referenced by
+    their index. `web/static/app.js` (`decodeColumnar`) rebuilds the row models.
+
+    :param models: The row models.
+    :param fields: The fields to encode.
+    """
+    encoder = Encoder()
+    columns: Dict[str, List[Any]] = {}
+    for field in fields:
+        if field in NESTED:
+            for key in NESTED[field]:
+                name = f'{field}.{key}'
+                columns[name] = encoder.column(name, [m[field][key] if m[field] else None for m in models])
+        else:
+            columns[field] = encoder.column(field, [m[field] for m in models])
+
+    return {
+        'format': 'columnar',
+        'count': len(models),
+        'tables': encoder.tables,
+        'refs': {name: table for name, table in TABLES.items() if name in columns},
+        'columns': columns,
+    }
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.run_state import run_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MAX_LOG_BYTES = 256 * 1024  # The shared log is truncated past this size
+POLL_INTERVAL = 1.0
+
+
+class EventBroadcaster:
+    """
+    Application events (reload progress) shared by the processes of the deployment. Events are appended to
+    `<run dir>/events.jsonl`, which a poller thread in every process follows, so the end of an ingest in one gunicorn
+    worker reaches the listeners of all of them. The last event of each kind is kept for /api/version.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: The shared event log; None keeps the events in the process.
+        """
+        self.path = path
+        self.pid: Optional[int] = None
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # The lock may be held by a thread that does not exist in the child
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.lock = threading.Lock()
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.offset: Optional[int] = None
+        self.pid = None
+
+    def subscribe(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """
+        Call `listener(event, data)` on the poller thread for every event published by another process.
+        """
+        self.listeners.append(listener)
+
+    def ensure_started(self) -> None:
+        """
+        Start following the shared log in this process.
+        """
+        if self.pid == os.getpid() or not self.path:
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.offset = self._size()
+            threading.Thread(target=self._poll, name='event_poller', daemon=True).start()
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """
+        Send an event to the listeners of the other processes.
+        """
+        self.latest[event] = data
+        if not self.path:
+            return
+        line = json.dumps({'pid': os.getpid(), 'event': event, 'data': data}) + '\n'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf8') as file:
+                if fcntl:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                if file.tell() > MAX_LOG_BYTES:
+                    file.truncate(0)
+                file.write(line)
+        except OSError as e:
+            logging.getLogger(__name__).error(f"Could not write event: {e}")
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            try:
+                self._read_log()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Event log polling failed: {e}")
+
+    def _read_log(self) -> None:
+        size = self._size()
+        if size == self.offset:
+            return
+        if size < self.offset:
+            self.offset = 0  # Truncated
+        with open(self.path, 'r', encoding='utf8') as file:
+            file.seek(self.offset)
+            lines = file.readlines()
+            if lines and not lines[-1].endswith('\n'):
+                lines.pop()  # Still being written
+            self.offset += sum(len(line.encode('utf8')) for line in lines)
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('pid') != os.getpid():
+                self.latest[record['event']] = record['data']
+                for listener in self.listeners:
+                    try:
+                        listener(record['event'], record['data'])
+                    except Exception as e:
+                        logging.getLogger(__name__).error(f"Event listener failed: {e}")
+
+
+broadcaster = EventBroadcaster(os.path.join(run_dir(), 'events.jsonl'))
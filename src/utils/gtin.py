@@ -0,0 +1,44 @@
+from typing import Optional
+
+GTIN_LENGTHS = (8, 12, 13, 14)  # GTIN-8 (EAN-8), GTIN-12 (UPC-A), GTIN-13 (EAN-13), GTIN-14
+
+
+def check_digit(digits: str) -> str:
+    """
+    GS1 check digit of a code without its check digit: weights 3 and 1 alternate from the right.
+    """
+    total = sum(int(x) * (3 if i % 2 == 0 else 1) for i, x in enumerate(reversed(digits)))
+    return str(-total % 10)
+
+
+def strip_separators(code: str) -> str:
+    return code.strip().replace(' ', '').replace('-', '')
+
+
+def normalize(code: str) -> Optional[str]:
+    """
+    Normalize a UPC/EAN/GTIN to its 14-digit form, so that a UPC-A and the same code scanned as an EAN-13 match.
+
+    :param code: The code; spaces and dashes are ignored.
+    :return: The zero-padded GTIN-14, or None if the code is malformed or its check digit is wrong.
+    """
+    digits = strip_separators(code)
+    if not digits.isdigit() or len(digits) not in GTIN_LENGTHS:
+        return None
+    if check_digit(digits[:-1]) != digits[-1]:
+        return None
+    return digits.zfill(14)
+
+
+def normalize_stored(code: str) -> Optional[str]:
+    """
+    Normalize a code from the feed, where the check digit is sometimes left out.
+    A code is only completed when its length rules out a full GTIN (7 or 11 digits): a 12 or 13-digit code with a
+    wrong check digit is rejected, not read as a shorter code missing its check digit.
+
+    :return: The GTIN-14, or None if the code is not a GTIN with or without its check digit.
+    """
+    digits = strip_separators(code)
+    if digits.isdigit() and len(digits) not in GTIN_LENGTHS and len(digits) + 1 in GTIN_LENGTHS:
+        return normalize(digits + check_digit(digits))
+    return normalize(digits)
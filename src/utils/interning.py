@@ -0,0 +1,71 @@
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from models.category import Category
+from models.country import Country
+
+
+class InternPool:
+    """
+    Canonical Country and Category instances.
+    Feed parsing and DB loading share one immutable instance per country code and per category id instead of
+    building one per product. The first instance registered for a key wins; the repositories seed the pool with
+    the stored ones.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled  # Disabled only to measure the unshared baseline
+        self.lock = threading.Lock()
+        self.countries: Dict[str, Country] = {}
+        self.categories: Dict[int, Category] = {}
+
+    def seed_countries(self, countries: Iterable[Country]) -> None:
+        with self.lock:
+            for country in countries:
+                self.countries[country.code] = country
+
+    def seed_categories(self, categories: Iterable[Category]) -> None:
+        with self.lock:
+            for category in categories:
+                self.categories[category.id] = category
+
+    def country(self, name: Optional[str], code: Optional[str]) -> Country:
+        """
+        Return the canonical country for `code`, creating it from `name` and `code` if it is new.
+        """
+        if not self.enabled:
+            return Country(name=name, code=code)
+        country = self.countries.get(code)
+        if country is None:
+            with self.lock:
+                country = self.countries.setdefault(code, Country(name=name, code=code))
+        return country
+
+    def category(self, value: Any) -> Any:
+        """
+        Return the canonical category for a feed category (dict or Category); other values are returned as is
+        for the model validation to deal with.
+        """
+        if not self.enabled:
+            return value
+        if isinstance(value, Category):
+            category_id = value.id
+        elif isinstance(value, dict) and isinstance(value.get('id'), int):
+            category_id = value['id']
+        else:
+            return value
+
+        category = self.categories.get(category_id)
+        if category is None:
+            with self.lock:
+                category = self.categories.setdefault(
+                    category_id, value if isinstance(value, Category) else Category(**value))
+        return category
+
+    def clear(self) -> None:
+        with self.lock:
+            self.countries.clear()
+            self.categories.clear()
+
+
+intern_pool = InternPool()
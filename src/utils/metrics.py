@@ -0,0 +1,251 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.run_state import run_dir
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FLUSH_INTERVAL = 1.0
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key: Iterable[Tuple[str, str]]) -> str:
+    labels = ','.join(f'{name}="{escape(value)}"' for name, value in key)
+    return f'{{{labels}}}' if labels else ''
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, description: str):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.values: Dict[LabelKey, Any] = {}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        key = label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + value
+        self.registry.changed()
+
+
+class Gauge(Metric):
+    """
+    A gauge. Across workers the values are summed (`aggregate='sum'`, e.g. in-flight requests) or the largest one is
+    reported (`aggregate='max'`, e.g. the catalog size every worker holds).
+    """
+    kind = 'gauge'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, description: str, aggregate: str = 'max'):
+        super().__init__(registry, name, description)
+        self.aggregate = aggregate
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self.registry.lock:
+            self.values[label_key(labels)] = value
+        self.registry.changed()
+
+    def inc(self, value: float = 1, **labels: Any) -> None:
+        key = label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + value
+        self.registry.changed()
+
+    def dec(self, value: float = 1, **labels: Any) -> None:
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, description: str, buckets: Tuple = DEFAULT_BUCKETS):
+        super().__init__(registry, name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            # Per-bucket (non cumulative) counts, the +Inf bucket last, then sum and count
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        self.registry.changed()
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process metrics, rendered in the Prometheus text exposition format.
+    Every process writes its values to `<run dir>/metrics/<pid>.json` (at most once per FLUSH_INTERVAL), and
+    `render()` merges the files of all processes, so any gunicorn worker serves the totals of the deployment.
+    Gauges of processes that are gone are dropped; their counters and histograms are kept.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.metrics: Dict[str, Metric] = {}
+        self.flushed = 0.0
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker starts from zero, the parent keeps reporting its own values
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values = {}
+            self.flushed = 0.0
+
+    def _register(self, metric: Metric) -> Any:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(self, name, description))
+
+    def gauge(self, name: str, description: str, aggregate: str = 'max') -> Gauge:
+        return self._register(Gauge(self, name, description, aggregate))
+
+    def histogram(self, name: str, description: str, buckets: Tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, description, buckets))
+
+    def changed(self) -> None:
+        if self.directory and time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                name: [[list(map(list, key)), value] for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self) -> None:
+        """
+        Write the values of this process to the shared directory.
+        """
+        self.flushed = time.monotonic()
+        try:
+            path = os.path.join(self.directory, 'metrics')
+            os.makedirs(path, exist_ok=True)
+            target = os.path.join(path, f'{os.getpid()}.json')
+            temporary = f'{target}.{threading.get_ident()}.tmp'
+            with open(temporary, 'w', encoding='utf8') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(temporary, target)
+        except OSError as e:
+            logging.getLogger(__name__).error(f"Could not write metrics: {e}")
+
+    def _snapshots(self) -> List[Tuple[int, Dict[str, Any]]]:
+        own = os.getpid()
+        snapshots = [(own, self.snapshot())]
+        if not self.directory:
+            return snapshots
+        self.flush()
+        path = os.path.join(self.directory, 'metrics')
+        for filename in os.listdir(path):
+            if not filename.endswith('.json') or filename == f'{own}.json':
+                continue
+            try:
+                with open(os.path.join(path, filename), 'r', encoding='utf8') as file:
+                    snapshots.append((int(filename[:-len('.json')]), json.load(file)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """
+        Render the metrics of all processes in the Prometheus text format.
+        """
+        merged: Dict[str, Dict[LabelKey, Any]] = {name: {} for name in self.metrics}
+        for pid, snapshot in self._snapshots():
+            alive = pid == os.getpid() or pid_alive(pid)
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                values = merged[name]
+                for key, value in entries:
+                    key = tuple(map(tuple, key))
+                    if key not in values:
+                        values[key] = list(value) if isinstance(value, list) else value
+                    elif metric.kind == 'histogram':
+                        values[key] = [a + b for a, b in zip(values[key], value)]
+                    elif metric.kind == 'gauge' and metric.aggregate == 'max':
+                        values[key] = max(values[key], value)
+                    else:
+                        values[key] += value
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.description}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged[name].items()):
+                if metric.kind != 'histogram':
+                    lines.append(f'{name}{format_labels(key)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + ['+Inf'], value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(key + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(key)} {value[-2]}')
+                lines.append(f'{name}_count{format_labels(key)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry(run_dir())
+atexit.register(metrics.flush)
+
+# Web
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by route, method and status.')
+http_request_seconds = metrics.histogram('http_request_duration_seconds', 'HTTP request latency by route.')
+http_in_flight = metrics.gauge('http_requests_in_flight', 'HTTP requests being served.', aggregate='sum')
+image_requests = metrics.counter('image_cache_requests_total', 'Image proxy requests by cache result.')
+image_upstream_seconds = metrics.histogram('image_upstream_duration_seconds', 'Image downloads from upstream.')
+
+# Database
+db_queries = metrics.counter('db_queries_total', 'SQL statements by statement type and outcome.')
+db_query_seconds = metrics.histogram('db_query_duration_seconds', 'SQL statement latency by statement type.')
+db_connect_seconds = metrics.histogram('db_connect_duration_seconds', 'Time to open a database connection.')
+db_connect_errors = metrics.counter('db_connect_errors_total', 'Failed database connections.')
+
+# Ingest
+ingest_runs = metrics.counter('ingest_runs_total', 'Feed ingests by result.')
+ingest_phase_seconds = metrics.histogram(
+    'ingest_phase_duration_seconds', 'Duration of the feed ingest phases.', (1, 5, 10, 30, 60, 120, 300, 600, 1800))
+ingest_download_bytes = metrics.gauge('ingest_download_bytes', 'Size of the last downloaded feed.')
+ingest_parsed_products = metrics.gauge('ingest_parsed_products', 'Products parsed from the last feed.')
+ingest_persisted_rows = metrics.counter('ingest_persisted_rows_total', 'Price history points recorded by ingests.')
+catalog_products = metrics.gauge('catalog_products', 'Products served.')
@@ -0,0 +1,219 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+MAX_STACKS = 20000
+MAX_PROFILES = 50
+
+
+def frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Periodic stack sampler over all threads.
+    Samples are aggregated as collapsed stacks (`thread;outer;...;inner count`), the input format of flamegraph.pl
+    and speedscope. The sampling thread is started lazily in each process, so it survives gunicorn's fork.
+    """
+
+    def __init__(self, interval: float = 0.02, max_depth: int = 64):
+        """
+        :param interval: Seconds between two samples.
+        :param max_depth: Innermost frames kept per stack.
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.pid: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def ensure_started(self) -> None:
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # A forked worker inherits the state of the parent but not its threads
+            self.pid = os.getpid()
+            self.stacks = Counter()
+            self.samples = 0
+            self.thread = threading.Thread(target=self._run, name='stack_sampler', daemon=True)
+            self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Stack sampling failed: {e}")
+
+    def sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        collapsed = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f'thread-{ident}'))
+            collapsed.append(';'.join(reversed(labels)))
+
+        with self.lock:
+            self.samples += 1
+            for stack in collapsed:
+                if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                    self.stacks[stack] += 1
+                else:
+                    self.stacks['[truncated]'] += 1
+
+    def collapsed(self) -> str:
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+
+
+class RequestProfiler:
+    """
+    cProfile capture of single requests, triggered by the `X-Profile: 1` header or the `profile=1` query parameter.
+    The top functions of the last profiles are kept in memory; with `dump_dir` the raw stats are also written as
+    `<id>.prof` files for snakeviz and friends.
+    """
+
+    def __init__(self, top: int = 30, dump_dir: Optional[str] = None):
+        self.top = top
+        self.dump_dir = dump_dir
+        self.lock = threading.Lock()
+        self.profiles: Deque[Dict[str, Any]] = deque(maxlen=MAX_PROFILES)
+
+    @staticmethod
+    def requested(request: Any) -> bool:
+        return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+    def start(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows a single active profiler per process
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, route: str, elapsed_ms: float) -> Dict[str, Any]:
+        """
+        Stop a profile and record its top functions by cumulative time.
+
+        :return: The recorded profile.
+        """
+        profile.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats('cumulative').print_stats(self.top)
+
+        profile_id = uuid.uuid4().hex[:12]
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            stats.dump_stats(os.path.join(self.dump_dir, f'{profile_id}.prof'))
+
+        record = {
+            'id': profile_id,
+            'route': route,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'created': time.time(),
+            'stats': output.getvalue(),
+        }
+        with self.lock:
+            self.profiles.append(record)
+        return record
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return next((x for x in self.profiles if x['id'] == profile_id), None)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [{key: value for key, value in x.items() if key != 'stats'} for x in self.profiles]
+
+
+def install(app: Any) -> bool:
+    """
+    Register the profiling hooks and the /admin/profile endpoints on a Flask app when `PROFILING` is set.
+    Nothing is registered otherwise, so disabled profiling costs nothing per request.
+
+    Environment: PROFILING (1 to enable), PROFILING_SAMPLE_MS (sampling interval, default 20, 0 disables the
+    sampler), PROFILING_TOP (functions reported per request, default 30), PROFILING_DIR (where .prof files go).
+
+    :return: True if profiling was enabled.
+    """
+    if os.getenv('PROFILING', '').lower() not in ('1', 'true', 'yes'):
+        return False
+
+    from flask import g, jsonify, request
+
+    sample_ms = float(os.getenv('PROFILING_SAMPLE_MS', '20'))
+    sampler = StackSampler(sample_ms / 1000) if sample_ms > 0 else None
+    profiler = RequestProfiler(int(os.getenv('PROFILING_TOP', '30')), os.getenv('PROFILING_DIR'))
+
+    @app.before_request
+    def start_profile():
+        if sampler:
+            sampler.ensure_started()
+        if RequestProfiler.requested(request):
+            g.profile = profiler.start()
+            g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def stop_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            record = profiler.stop(profile, request.path, (time.perf_counter() - g.profile_started) * 1000)
+            response.headers['X-Profile-Id'] = record['id']
+        return response
+
+    @app.route('/admin/profile/requests', methods=['GET'])
+    def profiled_requests():
+        return jsonify(profiler.summaries())
+
+    @app.route('/admin/profile/requests/<profile_id>', methods=['GET'])
+    def profiled_request(profile_id):
+        record = profiler.get(profile_id)
+        if record is None:
+            return jsonify({"error": "Profile not found"}), 404
+        return record['stats'], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    @app.route('/admin/profile/stacks', methods=['GET'])
+    def sampled_stacks():
+        if sampler is None:
+            return jsonify({"error": "Sampler disabled"}), 404
+        sampler.ensure_started()
+        body = sampler.collapsed()
+        if request.args.get('reset') == 'true':
+            sampler.reset()
+        return body, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    if sampler:
+        # Also covers the startup ingest; forked workers restart it on their first request
+        sampler.ensure_started()
+    print(f'Profiling enabled (sampler: {sample_ms} ms)')
+    return True
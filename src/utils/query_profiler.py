@@ -0,0 +1,184 @@
+import atexit
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from utils.metrics import db_queries, db_query_seconds
+
+MAX_SAMPLES = 1024
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%s|\?')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(query: str) -> str:
+    """
+    Normalize a SQL statement so that executions differing only in literals or parameters share one key.
+
+    :param query: The SQL query text.
+    :return: The statement fingerprint.
+    """
+    query = _COMMENT_RE.sub(' ', query)
+    query = _STRING_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _PARAM_RE.sub('?', query)
+    query = _LIST_RE.sub('(?)', query)
+    return _SPACE_RE.sub(' ', query).strip().rstrip(';')
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class QueryStats:
+    def __init__(self, query: str):
+        self.query = query
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows_returned = 0
+        self.rows_affected = 0
+        self.samples: Deque[float] = deque(maxlen=MAX_SAMPLES)
+
+    def to_json_model(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        return {
+            'query': self.query,
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p95_ms': round(percentile(samples, 95), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'rows_returned': self.rows_returned,
+            'rows_affected': self.rows_affected,
+        }
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        slow_ms: float = 500,
+        explain: bool = False,
+        dump_path: Optional[str] = None,
+        log_path: Optional[str] = None,
+    ):
+        """
+        Collect per-fingerprint statement statistics and write a slow-query log.
+
+        :param slow_ms: Statements slower than this (in milliseconds) are written to the slow-query log.
+        :param explain: If True, slow Postgres SELECTs are re-run under EXPLAIN ANALYZE and the plan is logged.
+        :param dump_path: Optional file the statistics are written to at process exit. `{pid}` is substituted.
+        :param log_path: Optional file the slow-query log is appended to, in addition to regular logging.
+        """
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.dump_path = dump_path
+        self.logger = logging.getLogger('slow_query')
+        if log_path and not self.logger.handlers:
+            handler = logging.FileHandler(log_path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(process)d %(message)s'))
+            self.logger.addHandler(handler)
+        self.stats: Dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'QueryProfiler':
+        return cls(
+            slow_ms=float(os.getenv('SLOW_QUERY_MS', '500')),
+            explain=os.getenv('SLOW_QUERY_EXPLAIN', '').lower() in ('1', 'true', 'yes'),
+            dump_path=os.getenv('QUERY_PROFILE_PATH'),
+            log_path=os.getenv('SLOW_QUERY_LOG'),
+        )
+
+    def record(
+        self,
+        query: str,
+        elapsed_ms: float,
+        rows_returned: int = 0,
+        rows_affected: int = 0,
+        error: bool = False,
+    ) -> bool:
+        """
+        Record one statement execution.
+
+        :return: True if the statement crossed the slow-query threshold.
+        """
+        statement = query.lstrip().split(None, 1)[0].upper() if query.strip() else ''
+        db_queries.inc(statement=statement, error='true' if error else 'false')
+        db_query_seconds.observe(elapsed_ms / 1000, statement=statement)
+
+        key = fingerprint(query)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = QueryStats(key)
+            stats.count += 1
+            stats.errors += int(error)
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows_returned += max(rows_returned, 0)
+            stats.rows_affected += max(rows_affected, 0)
+            stats.samples.append(elapsed_ms)
+
+        is_slow = elapsed_ms >= self.slow_ms
+        if is_slow:
+            self.logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {max(rows_returned, rows_affected, 0)} rows): {key}")
+        return is_slow
+
+    def log_plan(self, query: str, plan: List[Any]) -> None:
+        lines = '\n'.join(str(row[0]) for row in plan)
+        self.logger.warning(f"Plan for slow query {fingerprint(query)}:\n{lines}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Return the collected statistics, most expensive statements first.
+        """
+        with self._lock:
+            stats = [x.to_json_model() for x in self.stats.values()]
+        return sorted(stats, key=lambda x: x['total_ms'], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = {}
+
+    def dump(self) -> None:
+        """
+        Write the collected statistics to `dump_path`, or log a summary when no path is configured.
+        """
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+
+        if self.dump_path:
+            path = self.dump_path.format(pid=os.getpid())
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file, indent=4)
+            return
+
+        for stats in snapshot:
+            self.logger.info(
+                f"{stats['count']:>8} x {stats['total_ms']:>10.1f} ms "
+                f"(p50 {stats['p50_ms']:.1f} / p95 {stats['p95_ms']:.1f} / p99 {stats['p99_ms']:.1f}) "
+                f"{stats['query'][:120]}"
+            )
+
+
+query_profiler = QueryProfiler.from_env()
+atexit.register(query_profiler.dump)
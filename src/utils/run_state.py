@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def run_dir() -> str:
+    """
+    Directory shared by the processes of one deployment (gunicorn workers), see BOOZEHOUND_RUN_DIR.
+    """
+    return os.getenv('BOOZEHOUND_RUN_DIR', os.path.join(tempfile.gettempdir(), 'boozehound'))
+
+
+def next_counter(name: str, floor: int = 0) -> int:
+    """
+    Increment a counter shared by the processes of the deployment, under an exclusive file lock.
+
+    :param name: The counter; stored in `<run dir>/<name>`.
+    :param floor: The returned value is at least `floor + 1`.
+    :return: The new value, unique across the processes.
+    """
+    directory = run_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'a+', encoding='utf8') as file:
+        if fcntl:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        content = file.read().strip()
+        value = max(int(content) if content.isdigit() else 0, floor) + 1
+        file.seek(0)
+        file.truncate()
+        file.write(str(value))
+        file.flush()
+    return value
+
+
+def read_counter(name: str) -> int:
+    """
+    :return: The current value of a counter of `next_counter`, 0 if it was never incremented.
+    """
+    try:
+        with open(os.path.join(run_dir(), name), 'r', encoding='utf8') as file:
+            content = file.read().strip()
+    except OSError:
+        return 0
+    return int(content) if content.isdigit() else 0
+
+
+@contextmanager
+def file_lock(name: str) -> Iterator[bool]:
+    """
+    Try to take an exclusive lock shared by the processes of the deployment, without waiting.
+    The lock is released when the block exits or the process dies.
+
+    :param name: The lock; `<run dir>/<name>.lock`.
+    :return: Whether the lock was acquired.
+    """
+    directory = run_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{name}.lock'), 'a', encoding='utf8') as file:
+        acquired = True
+        if fcntl:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired and fcntl:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def write_stamp(name: str) -> None:
+    """
+    Record the current time in `<run dir>/<name>`.
+    """
+    directory = run_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'w', encoding='utf8') as file:
+        file.write(str(time.time()))
+
+
+def stamp_age(name: str) -> Optional[float]:
+    """
+    :return: Seconds since `write_stamp(name)`, or None if it was never written.
+    """
+    try:
+        with open(os.path.join(run_dir(), name), 'r', encoding='utf8') as file:
+            return time.time() - float(file.read())
+    except (OSError, ValueError):
+        return None
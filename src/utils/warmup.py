@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+RETRY_INTERVAL = 30  # seconds before a failed warm-up is retried
+
+
+class Warmup:
+    """
+    Background loading of the catalog, so the web server accepts requests (and passes health checks) right away.
+    The warm-up runs in a thread started lazily in each process: with gunicorn's `--preload` the master only
+    imports the application and every forked worker warms itself up, no lock or half-loaded state crosses a fork.
+    """
+
+    def __init__(self, target: Callable[['Warmup'], None]):
+        """
+        :param target: The loading function; it reports its progress with `step()`.
+        """
+        self.target = target
+        self.lock = threading.Lock()
+        self.pid: Optional[int] = None
+        self.status = 'pending'
+        self.steps: List[Dict[str, Any]] = []
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == 'ready'
+
+    def ensure_started(self) -> None:
+        if self.pid == os.getpid() and not self._should_retry():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and not self._should_retry():
+                return
+            self.pid = os.getpid()
+            self.status = 'warming'
+            self.steps = []
+            self.started = time.time()
+            self.finished = None
+            self.error = None
+            self.done = threading.Event()
+            threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def _should_retry(self) -> bool:
+        return self.status == 'failed' and time.time() - (self.finished or 0) >= RETRY_INTERVAL
+
+    def _run(self) -> None:
+        try:
+            self.target(self)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Warm-up failed: {e}")
+            self.error = str(e)
+            self.status = 'failed'
+        else:
+            self.status = 'ready'
+            print(f'Warm-up done in {time.time() - self.started:.1f}s')
+        self.finished = time.time()
+        if self.steps and self.steps[-1]['seconds'] is None:
+            self.steps[-1]['seconds'] = round(self.finished - self.steps[-1]['started'], 3)
+        self.done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Start the warm-up if needed and wait for it to end.
+
+        :return: True if the catalog is loaded.
+        """
+        self.ensure_started()
+        self.done.wait(timeout)
+        return self.ready
+
+    def step(self, name: str) -> None:
+        """
+        Record the start of a warm-up step; the previous step is considered done.
+        """
+        now = time.time()
+        if self.steps and self.steps[-1]['seconds'] is None:
+            self.steps[-1]['seconds'] = round(now - self.steps[-1]['started'], 3)
+        self.steps.append({'name': name, 'started': now, 'seconds': None})
+        print(f'Warm-up: {name}...')
+
+    def to_json_model(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            'status': self.status,
+            'pid': self.pid,
+            'elapsed': round(end - self.started, 3) if self.started else None,
+            'steps': [{'name': x['name'], 'seconds': x['seconds']} for x in self.steps],
+            'error': self.error,
+        }
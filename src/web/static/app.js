@@ -10,6 +10,7 @@ const app = Vue.createApp({
          countries: [],
          categories: [],
          groupedProducts: [],
+         facets: null,
          filters: {
             country: '',
             category: null,
@@ -29,13 +30,14 @@ const app = Vue.createApp({
       if (!this.products.length)
          return;
 
-      GlobalStore.max_score = this.products[0].combined_score;
+      GlobalStore.max_score = this.products.reduce((max, x) => Math.max(max, x.combined_score), 0);
 
       //const filteredData = this.products.filter((item) => item.combined_score >= 1000);
       //this.groupedProducts = this.groupAndSort(filteredData, 'category', this.sorts, 1000);
       this.filter();
       this.countries = this.getCountries(this.products);
       this.categories = this.getCategories(this.products);
+      this.listenForChanges();
    },
    created() {
       this.getQueryParams();
@@ -98,13 +100,14 @@ const app = Vue.createApp({
                   const timestamp = parseInt(storedDataOject.timestamp, 10);
                   const thirtyMinutes = 30 * 60 * 1000;
 
-                  if (
-                     now - timestamp < thirtyMinutes &&
-                     storedDataOject.products &&
-                     storedDataOject.products.length > 0
-                  ) {
+                  if (storedDataOject.columnar) {
+                     storedDataOject.products = hydrateCards(decodeColumnar(storedDataOject.columnar),
+                        storedDataOject.columnar.lookups);
+                  }
+                  const products = storedDataOject.products;
+                  if (now - timestamp < thirtyMinutes && products && products.length > 0) {
                      console.log('Cached.')
-                     this.setProducts(storedDataOject.products);
+                     this.setProducts(products);
                      return;
                   }
                }
@@ -117,11 +120,18 @@ const app = Vue.createApp({
       },
       async fetchData(data) {
          try {
-            const response = await fetch('/api/data');
-            data = await response.json();
-
+            // Card fields only, the details are fetched when a product is opened.
+            // With a stored catalog only the changes since its version are sent, unless it is too old.
+            const stored = data.columnar;
+            const since = stored && stored.version ? `&since=${stored.version}` : '';
+            const response = await fetch(`/api/data?fields=card&format=columnar${since}`);
+            const body = await response.json();
+            const columnar = body.format === 'columnar' ? body : applyColumnarDelta(stored, body);
+            data = { products: hydrateCards(decodeColumnar(columnar), columnar.lookups) };
+
+            // Stored columnar, several times smaller than the decoded products
             const dataToStore = JSON.stringify({
-               products: data.products,
+               columnar: columnar,
                timestamp: new Date().getTime()
             });
 
@@ -136,6 +146,32 @@ const app = Vue.createApp({
             this.setProducts(data.products);
          }
       },
+      listenForChanges() {
+         // The server answers 304 until its catalog version changes, the stored catalog is then updated with a delta
+         let etag = null;
+         setInterval(async () => {
+            try {
+               const response = await fetch('/api/version', {
+                  cache: 'no-store',
+                  headers: etag ? { 'If-None-Match': etag } : {},
+               });
+               if (response.status !== 200)
+                  return;
+               etag = response.headers.get('ETag');
+               const { version } = await response.json();
+               const stored = JSON.parse(localStorage.getItem('ProductData') || '{}');
+               // Versions only grow, an older one comes from a worker that has not reloaded yet
+               if (!stored.columnar || !(version > stored.columnar.version))
+                  return;
+               await this.fetchData({ columnar: stored.columnar, products: this.products });
+               this.filter();
+               this.countries = this.getCountries(this.products);
+               this.categories = this.getCategories(this.products);
+            } catch (error) {
+               console.error('Error polling the catalog version:', error);
+            }
+         }, VERSION_POLL_MS);
+      },
       getCountries(products) {
          const countriesSet = new Set();
 
@@ -258,11 +294,59 @@ const app = Vue.createApp({
             return result;
          });
 
-         if (this.products.length == filteredProducts.length)
-            filteredProducts = filteredProducts.filter((item) => item.combined_score >= 1000);
-
+         this.loadFacets();
+         if (this.products.length == filteredProducts.length && this.isDefaultSort()) {
+            // Default view: the top lists are selected by the server at catalog load
+            this.loadTop();
+            return;
+         }
          this.groupedProducts = this.groupAndSort(filteredProducts, 'category', this.sorts, 10000);
       },
+      isDefaultSort() {
+         return this.sorts.join() === GlobalStore.sorts.join();
+      },
+      async loadTop() {
+         try {
+            const response = await fetch(`/api/top?score=combined&group=category&n=${TOP_N}&fields=card`);
+            if (!response.ok)
+               throw new Error(`HTTP ${response.status}`);
+            const body = await response.json();
+            // Filters or sorts changed while loading
+            if (!this.isDefaultSort() || this.hasFilters())
+               return;
+            this.groupedProducts = body.groups.map((group) => ({
+               category: group.category,
+               items: hydrateCards(group.items, body.lookups).filter((x) => x.price).map((x) => this.decorate(x)),
+            }));
+         } catch (error) {
+            console.error('Error fetching top products:', error);
+            this.groupedProducts = this.groupAndSort(
+               this.products.filter((item) => item.combined_score >= 1000), 'category', this.sorts, 10000);
+         }
+      },
+      hasFilters() {
+         const filters = this.filters;
+         return !!(filters.category || filters.country || filters.search || filters.is_new || filters.single_only ||
+            filters.sale_only);
+      },
+      async loadFacets() {
+         const params = new URLSearchParams();
+         if (this.filters.category) {
+            params.set('category', this.filters.category);
+         }
+         if (this.filters.country) {
+            params.set('country', this.filters.country);
+         }
+         ['is_new', 'single_only', 'sale_only'].filter((x) => this.filters[x]).forEach((x) => params.set(x, 'true'));
+         try {
+            const response = await fetch(`/api/facets?${params.toString()}`);
+            if (response.ok) {
+               this.facets = await response.json();
+            }
+         } catch (error) {
+            console.error('Error fetching facets:', error);
+         }
+      },
       groupAndSort(data, groupByField, sortByFields, topN) {
          // Step 2: Group by the specified field
          const groupedData = data
@@ -273,15 +357,7 @@ const app = Vue.createApp({
                   acc[key] = [];
                }
 
-               acc[key].push({
-                  ...item,
-                  url: this.get_url(item.sku),
-                  image: this.get_image(item.sku),
-                  alt_image: this.get_alt_image(item.category),
-                  price_drop: item.price.price - item.price.sale_price,
-                  price_drop_rate: (item.price.price - item.price.sale_price) / item.price.price,
-                  actual_country: window.UPC.getCountryFromUPC(item.upc),
-               });
+               acc[key].push(this.decorate(item));
                return acc;
             }, {});
 
@@ -307,6 +383,17 @@ const app = Vue.createApp({
 
          return sortedResult;
       },
+      decorate(item) {
+         return {
+            ...item,
+            url: this.get_url(item.sku),
+            image: this.get_image(item.sku),
+            alt_image: this.get_alt_image(item.category),
+            price_drop: item.price.price - item.price.sale_price,
+            price_drop_rate: (item.price.price - item.price.sale_price) / item.price.price,
+            actual_country: window.UPC.getCountryFromUPC(item.upc),
+         };
+      },
       get_url: (sku) => `https://www.bcliquorstores.com/product/${sku}`,
       get_image: (sku) => `/image/height400px/${sku}.jpg`,
       get_alt_image: (category) => categoryImageMap[category],
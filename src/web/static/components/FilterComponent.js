@@ -7,10 +7,18 @@ const FilterComponent = {
       'sort': { type: Number, required: true },
       'countries': { type: Array, required: true },
       'categories': { type: Array, required: true },
+      'facets': { type: Object, required: false, default: null },
       'updateFilters': { type: Function, required: true },
       'updateSorts': { type: Function, required: true }
    },
    methods: {
+      count(type, key) {
+         if (!this.facets) {
+            return '';
+         }
+         const facet = this.facets[type][key];
+         return ` (${facet ? facet.count : 0})`;
+      },
       reset() {
          this.updateFilters();
       },
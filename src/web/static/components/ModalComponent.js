@@ -38,6 +38,11 @@ const ModalComponent = {
          required: true,
       },
    },
+   data() {
+      return {
+         details: null,
+      };
+   },
    async mounted() {
       // Remove dialog click-to-close (bad UX)
       // Add Escape key support
@@ -55,6 +60,7 @@ const ModalComponent = {
          document.body.classList.add('modal-is-open');
       }, 300);
 
+      this.fetchDetails(this.product.sku);
       data = await this.fetchData(this.product.sku);
       dateLabels = data.map(entry => new Date(entry.last_updated));
       priceData = data.map(entry => entry.price);
@@ -153,7 +159,7 @@ const ModalComponent = {
    methods: {
       async fetchData(sku) {
          try {
-            const response = await fetch(`/api/price/${sku}`);
+            const response = await fetch(`/api/price/${sku}?resolution=auto`);
             if (!response.ok) {
                throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -162,6 +168,17 @@ const ModalComponent = {
             console.error('Error fetching data:', error);
          }
       },
+      async fetchDetails(sku) {
+         try {
+            const response = await fetch(`/api/product/${sku}`);
+            if (!response.ok) {
+               throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            this.details = await response.json();
+         } catch (error) {
+            console.error('Error fetching details:', error);
+         }
+      },
       handleImageError(event, category) {
          event.target.src = categoryImageMap[category] || categoryImageMap['Liquor'];
       },
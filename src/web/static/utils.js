@@ -3,6 +3,9 @@ const GlobalStore = {
    sorts: ['-combined_score']
 };
 
+const TOP_N = 100;  // Products per category of the default view, the most /api/top returns
+const VERSION_POLL_MS = 60 * 1000;
+
 const categoryImageMap = {
    'Wine': '/static/img/wine.png',
    'Beer': '/static/img/beer.png',
@@ -10,3 +13,135 @@ const categoryImageMap = {
    'Spirits': '/static/img/liquor.png',
    'Liquor': '/static/img/liquor.png',
 }
+
+// Rebuild the product objects of a `format=columnar` /api/data response (see src/utils/columnar.py)
+function decodeColumnar(data) {
+   const { count, tables, refs, columns } = data;
+   const decoders = Object.keys(columns).map((name) => ({
+      path: name.split('.'),
+      values: columns[name],
+      table: refs[name] ? tables[refs[name]] : null,
+   }));
+   const nested = [...new Set(decoders.filter((x) => x.path.length > 1).map((x) => x.path[0]))];
+
+   const products = new Array(count);
+   for (let i = 0; i < count; i++) {
+      const product = {};
+      for (const { path, values, table } of decoders) {
+         let value = values[i];
+         if (table && value !== null) {
+            value = Array.isArray(value) ? value.map((x) => table[x]) : table[value];
+         }
+         if (path.length === 1) {
+            product[path[0]] = value;
+         } else {
+            (product[path[0]] = product[path[0]] || {})[path[1]] = value;
+         }
+      }
+      // A nested object whose values are all null was null
+      for (const key of nested) {
+         if (Object.values(product[key]).every((x) => x === null)) {
+            product[key] = null;
+         }
+      }
+      products[i] = product;
+   }
+   return products;
+}
+
+const NEW_PRODUCT_DAYS = 7;
+
+// Rebuild the nested objects of card products from their flat ids (see ProductService.lookups). "New" is computed
+// here, the server caches the cards for the whole catalog.
+function hydrateCards(products, lookups) {
+   const countries = (lookups && lookups.countries) || {};
+   const categories = (lookups && lookups.categories) || {};
+   const newSince = new Date(Date.now() - NEW_PRODUCT_DAYS * 24 * 3600 * 1000).toISOString().slice(0, 10);
+   products.forEach((product) => {
+      if (product.country === undefined && product.country_code !== undefined) {
+         product.country = { code: product.country_code, name: countries[product.country_code] || null };
+      }
+      if (product.full_category === undefined && product.category_ids) {
+         product.full_category = product.category_ids.map((id) => ({ id: id, description: categories[id] || null }));
+         product.category = product.full_category.length ? product.full_category[0].description : null;
+      }
+      if (product.regular_price !== undefined && product.price === undefined) {
+         product.price = product.regular_price === null ? null : {
+            price: product.regular_price,
+            sale_price: product.sale_price,
+            promotion_end_date: product.promotion_end_date,
+         };
+      }
+      if (product.first_update !== undefined) {
+         product.is_new = !!product.first_update && product.first_update > newSince;
+      }
+   });
+   return products;
+}
+
+// Store `value` of column `name` the way the server encodes it: by reference for dictionary-encoded columns
+function encodeColumnValue(columnar, name, value) {
+   const tableName = columnar.refs[name];
+   if (!tableName || value === null || value === undefined) {
+      return value === undefined ? null : value;
+   }
+   const table = columnar.tables[tableName] = columnar.tables[tableName] || [];
+   const ref = (x) => {
+      const key = JSON.stringify(x);
+      let index = table.findIndex((y) => JSON.stringify(y) === key);
+      if (index < 0) {
+         index = table.push(x) - 1;
+      }
+      return index;
+   };
+   return Array.isArray(value) ? value.map(ref) : ref(value);
+}
+
+function setColumnarRow(columnar, index, fields) {
+   for (const [field, value] of Object.entries(fields)) {
+      if (columnar.columns[field]) {
+         columnar.columns[field][index] = encodeColumnValue(columnar, field, value);
+         continue;
+      }
+      // Nested object split in `field.key` columns
+      Object.keys(columnar.columns).filter((name) => name.startsWith(`${field}.`)).forEach((name) => {
+         const key = name.slice(field.length + 1);
+         columnar.columns[name][index] = encodeColumnValue(columnar, name, value ? value[key] : null);
+      });
+   }
+}
+
+// Apply a `/api/data?since=` delta to a columnar catalog in place
+function applyColumnarDelta(columnar, delta) {
+   const columns = columnar.columns;
+   const removed = new Set(delta.removed);
+   if (removed.size) {
+      const keep = columns.sku.map((sku) => !removed.has(sku));
+      Object.keys(columns).forEach((name) => {
+         columns[name] = columns[name].filter((_, i) => keep[i]);
+      });
+   }
+
+   const indexes = new Map(columns.sku.map((sku, i) => [sku, i]));
+   delta.changed.forEach((change) => {
+      const index = indexes.get(change.sku);
+      if (index !== undefined) {
+         setColumnarRow(columnar, index, change);
+      }
+   });
+   delta.added.forEach((product) => {
+      let index = indexes.get(product.sku);
+      if (index === undefined) {
+         index = columns.sku.length;
+         Object.values(columns).forEach((values) => values.push(null));
+      }
+      setColumnarRow(columnar, index, product);
+   });
+
+   columnar.count = columns.sku.length;
+   columnar.version = delta.version;
+   if (delta.lookups) {
+      columnar.lookups = delta.lookups;
+   }
+   return columnar;
+}
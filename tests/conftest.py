@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+# Metrics, counters and locks of the tests stay out of the deployment's run directory
+os.environ['BOOZEHOUND_RUN_DIR'] = tempfile.mkdtemp(prefix='boozehound-tests-')
+
+from db_helper import DbHelper  # noqa: E402
+from models.product import Product  # noqa: E402
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'run'
+    monkeypatch.setenv('BOOZEHOUND_RUN_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DbHelper({'sqlite': str(tmp_path / 'test.db')})
+
+
+def count(db: DbHelper, table: str) -> int:
+    return db.execute_query(f"SELECT COUNT(*) FROM {table}", fetch_one=True)[0]
+
+
+def feed_source(sku: str, **overrides) -> dict:
+    """
+    A product as found in the `_source` of the BCL feed.
+    """
+    source = {
+        'sku': sku, 'upc': [f'0620670{sku}'], 'name': f'Product {sku}', 'volume': '0.75', 'unitSize': 1,
+        'alcoholPercentage': 12.5, 'productType': 'Wine', 'tastingDescription': 'Dry',
+        'countryName': 'France', 'countryCode': 'FR',
+        'category': {'id': 1, 'description': 'Wine'}, 'subCategory': {'id': 10, 'description': 'Red Wine'},
+        'class': {'id': 100, 'description': 'Bordeaux'},
+        'last_updated': '2026-10-01T08:00:00', 'currentPrice': '10.0', 'regularPrice': '12.0',
+        'promotionStartDate': None, 'promotionEndDate': None,
+    }
+    source.update(overrides)
+    return source
+
+
+def feed_product(sku: str, **overrides) -> Product:
+    return Product(**feed_source(sku, **overrides))
+
+
+def write_feed(path, *sources) -> str:
+    """
+    Write a BCL feed file with the given `_source` dicts.
+    """
+    path.write_text(json.dumps({'hits': {'hits': [{'_source': x} for x in sources]}}))
+    return str(path)
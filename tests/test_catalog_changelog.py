@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+from conftest import feed_source, write_feed
+from models.watch_rule import WatchRule
+from repositories.catalog_changelog import CatalogChangelog, diff, new_version, stored_version
+from services.product_service import ProductService
+
+
+def model(sku, price=10.0, name=None):
+    return {'sku': sku, 'name': name or f'Product {sku}', 'price': price}
+
+
+def test_diff():
+    old = {'1': model('1'), '2': model('2'), '3': model('3')}
+    new = {'1': model('1'), '2': model('2', price=8.0), '4': model('4')}
+    assert diff(old, new) == {'added': {'4': model('4')}, 'removed': ['3'], 'changed': {'2': {'price': 8.0}}}
+
+
+def test_since_merges_the_deltas():
+    changelog = CatalogChangelog()
+    changelog.record([model('1'), model('2'), model('3')], 10)
+    changelog.record([model('1', price=9.0), model('2'), model('4')], 11)
+    changelog.record([model('1', price=9.0, name='Renamed'), model('4', price=5.0), model('5')], 12)
+
+    assert changelog.since(10) == {
+        'added': {'4': model('4', price=5.0), '5': model('5')},
+        'removed': ['3', '2'],
+        'changed': {'1': {'price': 9.0, 'name': 'Renamed'}},
+    }
+    assert changelog.since(12) == {'added': {}, 'removed': [], 'changed': {}}
+    assert changelog.since(9) is None
+
+
+def test_readded_product_is_added_again():
+    changelog = CatalogChangelog()
+    changelog.record([model('1'), model('2')], 1)
+    changelog.record([model('1')], 2)
+    changelog.record([model('1'), model('2', price=7.0)], 3)
+    assert changelog.since(1) == {'added': {'2': model('2', price=7.0)}, 'removed': [], 'changed': {}}
+
+
+def test_unversioned_catalog_has_no_delta():
+    changelog = CatalogChangelog()
+    changelog.record([model('1')], 1)
+    changelog.record([model('1', price=8.0)])
+    assert changelog.version == 0
+    assert changelog.since(0) is None
+    assert changelog.since(1) is None
+    changelog.record([model('1')], 2)
+    assert changelog.since(1) is None
+
+
+def test_same_version_is_not_a_new_entry():
+    changelog = CatalogChangelog()
+    changelog.record([model('1')], 1)
+    changelog.record([model('1')], 1)
+    assert list(changelog.entries) == []
+
+
+def test_new_version_is_stored(run_dir):
+    assert stored_version() == 0
+    first = new_version()
+    assert first >= int(datetime.now().timestamp())
+    assert stored_version() == first
+    assert new_version() == first + 1
+
+
+def test_workers_serve_the_leader_version(tmp_path, run_dir):
+    db_url = f'sqlite:///{tmp_path / "test.db"}'
+    today = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    leader = ProductService(db_url, None, None, None, True)
+    follower = ProductService(db_url, None, None, None, True)
+    assert leader.changelog.version == follower.changelog.version == 0
+
+    for day, price in ((today - timedelta(days=1), '10.0'), (today, '9.0')):
+        leader.load_products(write_feed(
+            tmp_path / 'feed.json', feed_source('1001', last_updated=day.isoformat(), currentPrice=price),
+            feed_source('1002', last_updated=day.isoformat())))
+        leader.persist_products()
+        leader.reload_products()
+        follower.sync_catalog()
+        assert follower.changelog.version == leader.changelog.version == stored_version()
+
+    assert list(leader.changelog.entries) == list(follower.changelog.entries)
+    previous = leader.changelog.entries[-1][0]
+    delta = follower.changelog.since(previous)
+    assert delta == leader.changelog.since(previous)
+    assert list(delta['changed']) == ['1001']
+    assert delta['changed']['1001']['sale_price'] == 9.0
+
+
+def test_sync_reloads_the_watch_rules(tmp_path, run_dir):
+    db_url = f'sqlite:///{tmp_path / "test.db"}'
+    leader = ProductService(db_url, None, None, None, True)
+    follower = ProductService(db_url, None, None, None, True)
+    rule = leader.watchlist.add_rule(WatchRule(subscriber='me@example.com', sku='1001', max_price=20), 'token')
+
+    follower.sync_catalog()
+    assert list(follower.watchlist.rules) == [rule.id]
+
+
+def test_sync_reads_the_primary(tmp_path, run_dir):
+    db_url = f'sqlite:///{tmp_path / "test.db"}'
+    day = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0).isoformat()
+    leader = ProductService(db_url, None, None, None, True)
+    # A replica that has not received the ingest yet
+    follower = ProductService(db_url, None, None, None, True, read_db_url=f'sqlite:///{tmp_path / "replica.db"}')
+
+    leader.load_products(write_feed(tmp_path / 'feed.json', feed_source('1001', last_updated=day)))
+    leader.persist_products()
+    follower.sync_catalog()
+    assert [x.sku for x in follower.products] == ['1001']
+    assert follower.changelog.version == stored_version()
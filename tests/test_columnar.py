@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import feed_product
+from utils import columnar
+
+UTILS_JS = os.path.join(os.path.dirname(__file__), '..', 'src', 'web', 'static', 'utils.js')
+
+
+def models():
+    # As sent, with the dates serialized
+    return json.loads(json.dumps([
+        feed_product('1000').to_json_model(),
+        feed_product('2000', promotionEndDate='2026-10-31').to_json_model(),
+        feed_product('3000', countryName='Canada', countryCode='CA').to_json_model(),
+    ], default=str))
+
+
+def test_repeated_values_are_stored_once():
+    data = columnar.encode(models(), ['sku', 'country', 'country_code', 'full_category', 'price'])
+    assert data['count'] == 3
+    assert data['tables']['country_codes'] == ['FR', 'CA']
+    assert data['columns']['country_code'] == [0, 0, 1]
+    assert len(data['tables']['categories']) == 3
+    assert data['columns']['full_category'] == [[0, 1, 2]] * 3
+    assert data['columns']['price.promotion_end_date'] == [None, 0, None]
+    assert data['refs'] == {
+        'country': 'countries', 'country_code': 'country_codes', 'full_category': 'categories',
+        'price.promotion_end_date': 'dates',
+    }
+
+
+def test_nested_objects_are_split_in_columns():
+    rows = models() + [dict(models()[0], sku='4000', price=None)]
+    data = columnar.encode(rows, ['sku', 'price'])
+    assert list(data['columns']) == ['sku', 'price.price', 'price.sale_price', 'price.promotion_end_date']
+    assert data['columns']['price.sale_price'] == [10.0, 10.0, 10.0, None]
+
+
+def run_js(script):
+    with open(UTILS_JS, encoding='utf8') as file:
+        source = file.read()
+    result = subprocess.run(['node', '-e', source + script], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_browser_decodes_the_rows():
+    rows = models()
+    data = columnar.encode(rows, list(rows[0]))
+    assert run_js(f'; console.log(JSON.stringify(decodeColumnar({json.dumps(data)})))') == rows
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_browser_applies_deltas():
+    rows = models()
+    fields = ['sku', 'country_code', 'price']
+    data = columnar.encode(rows[:2], fields)
+    delta = {
+        'version': 2,
+        'added': [{key: rows[2][key] for key in fields}],
+        'removed': ['1000'],
+        'changed': [{'sku': '2000', 'price': None}],
+    }
+    decoded = run_js(f'; console.log(JSON.stringify(decodeColumnar(applyColumnarDelta({json.dumps(data)}, '
+                     f'{json.dumps(delta)}))))')
+    assert decoded == [
+        {'sku': '2000', 'country_code': 'FR', 'price': None},
+        {key: rows[2][key] for key in fields},
+    ]
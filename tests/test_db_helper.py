@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import count
+from db_helper import BULK_BATCH_SIZE, DbHelper
+
+INSERT_COUNTRY = "INSERT INTO countries (code, name) VALUES (%s, %s)"
+
+
+def test_session_commits_once(db):
+    with db.session():
+        db.execute_query(INSERT_COUNTRY, ('CA', 'Canada'))
+        db.bulk_insert_query(INSERT_COUNTRY, [('FR', 'France'), ('IT', 'Italy')])
+    assert count(db, 'countries') == 3
+
+
+def test_session_rolls_back_on_error(db):
+    with pytest.raises(RuntimeError):
+        with db.session():
+            db.execute_query(INSERT_COUNTRY, ('CA', 'Canada'))
+            raise RuntimeError()
+    assert count(db, 'countries') == 0
+
+
+def test_failed_batch_rolls_back_the_session(db):
+    rows = [(f'C{i}', f'Country {i}') for i in range(BULK_BATCH_SIZE)]
+    rows.append(('C0', 'Duplicate'))  # Second batch violates the primary key
+    with pytest.raises(Exception):
+        with db.session():
+            db.execute_query(INSERT_COUNTRY, ('CA', 'Canada'))
+            db.bulk_insert_query(INSERT_COUNTRY, rows)
+    assert count(db, 'countries') == 0
+
+
+def test_savepoint_isolates_a_block(db):
+    with db.session():
+        db.execute_query(INSERT_COUNTRY, ('CA', 'Canada'))
+        with pytest.raises(Exception):
+            with db.savepoint():
+                db.execute_query(INSERT_COUNTRY, ('FR', 'France'))
+                db.execute_query(INSERT_COUNTRY, ('CA', 'Duplicate'))
+    assert db.execute_query("SELECT code FROM countries") == [('CA',)]
+
+
+def test_dialect_follows_the_backend():
+    assert DbHelper({'host': 'localhost'}).is_mysql
+    assert not DbHelper({'host': 'db.example.com'}).is_mysql
+    assert not DbHelper({'sqlite': ':memory:'}).is_mysql
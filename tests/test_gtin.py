@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import feed_product
+from repositories.upc_index import UpcIndex
+from utils.gtin import check_digit, normalize, normalize_stored
+
+
+def test_check_digit():
+    assert check_digit('03600029145') == '2'
+    assert check_digit('400638133393') == '1'
+
+
+@pytest.mark.parametrize('code, gtin', [
+    ('036000291452', '00036000291452'),  # UPC-A
+    ('0036000291452', '00036000291452'),  # The same scanned as an EAN-13
+    ('4006381333931', '04006381333931'),  # EAN-13
+    ('96385074', '00000096385074'),  # EAN-8
+    ('0-36000-29145-2', '00036000291452'),
+    ('036000291453', None),  # Wrong check digit
+    ('03600029145', None),  # No check digit
+    ('abc', None),
+])
+def test_normalize(code, gtin):
+    assert normalize(code) == gtin
+
+
+def test_feed_codes_may_lack_the_check_digit():
+    assert normalize_stored('03600029145') == '00036000291452'
+    assert normalize_stored('036000291452') == '00036000291452'
+    assert normalize_stored('0-36000-29145') == '00036000291452'
+    assert normalize_stored('123') is None
+    # A full UPC-A with a wrong check digit, not 11 digits missing theirs
+    assert normalize_stored('036000291453') is None
+
+
+def test_index_prefers_the_best_ranked_product():
+    index = UpcIndex.from_products([
+        feed_product('1000', upc=['03600029145']),
+        feed_product('2000', upc=['036000291452', '4006381333931']),
+    ])
+    assert index.lookup('0036000291452') == '1000'
+    assert index.lookup('4006381333931') == '2000'
+    assert index.lookup('036000291453') is None
+    assert index.lookup('96385074') is None
@@ -0,0 +1,63 @@
+from conftest import count
+from db_helper import DbHelper
+
+UNREACHABLE = {'host': '127.0.0.1', 'port': 1, 'user': 'boozehound', 'password': '', 'dbname': 'boozehound',
+               'connect_timeout': 1}
+
+
+def test_sync_copies_the_primary(tmp_path):
+    primary = DbHelper({'sqlite': str(tmp_path / 'primary.db')})
+    primary.bulk_insert_query("INSERT INTO countries (code, name) VALUES (%s, %s)", [('CA', 'Canada'), ('FR', 'France')])
+
+    local = DbHelper({'sqlite': str(tmp_path / 'local.db')})
+    db = DbHelper({'sqlite': str(tmp_path / 'primary.db')}, local=local)
+    assert not db.local_ready
+    db.sync_local()
+    assert db.local_ready
+    assert count(local, 'countries') == 2
+
+    # Mirrored from now on
+    db.execute_query("INSERT INTO countries (code, name) VALUES (%s, %s)", ('IT', 'Italy'))
+    assert count(local, 'countries') == 3
+
+
+def test_sync_copies_updated_rows(tmp_path):
+    primary = DbHelper({'sqlite': str(tmp_path / 'primary.db')})
+    primary.execute_query("INSERT INTO countries (code, name) VALUES (%s, %s)", ('CA', 'Canada'))
+    local = DbHelper({'sqlite': str(tmp_path / 'local.db')})
+    DbHelper({'sqlite': str(tmp_path / 'primary.db')}, local=local).sync_local()
+
+    # Updated while the local tier was not attached: same row count
+    primary.execute_query("UPDATE countries SET name = %s WHERE code = %s", ('Kanada', 'CA'))
+    primary.execute_query(
+        "INSERT INTO price_history_intervals (sku, valid_from, valid_to, regular_price, current_price) "
+        "VALUES (%s, %s, %s, %s, %s)", ('1', '2026-01-01', '2026-01-02', 10, 10))
+    DbHelper({'sqlite': str(tmp_path / 'primary.db')}, local=local).sync_local()
+    primary.execute_query("UPDATE price_history_intervals SET valid_to = %s", ('2026-01-03',))
+    DbHelper({'sqlite': str(tmp_path / 'primary.db')}, local=local).sync_local()
+
+    assert local.execute_query("SELECT name FROM countries") == [('Kanada',)]
+    assert local.execute_query("SELECT valid_to FROM price_history_intervals") == [('2026-01-03',)]
+
+
+def test_inserted_ids_match_the_primary(tmp_path):
+    primary = DbHelper({'sqlite': str(tmp_path / 'primary.db')})
+    local = DbHelper({'sqlite': str(tmp_path / 'local.db')})
+    # A row only the local tier has would shift its autoincrement ids
+    local.execute_query("INSERT INTO watch_rules (id, subscriber, sku) VALUES (%s, %s, %s)", (5, 'stale', '1'))
+    db = DbHelper({'sqlite': str(tmp_path / 'primary.db')}, local=local)
+    new_id = db.insert_row('watch_rules', ('subscriber', 'sku'), ('someone', '2'))
+
+    assert local.execute_query("SELECT id FROM watch_rules WHERE subscriber = %s", ('someone',)) == [(new_id,)]
+
+
+def test_unsynced_local_tier_is_not_read(tmp_path):
+    local = DbHelper({'sqlite': str(tmp_path / 'local.db')})
+    local.execute_query("INSERT INTO countries (code, name) VALUES (%s, %s)", ('CA', 'Canada'))
+    db = DbHelper(UNREACHABLE, local=local)
+    assert db.execute_query("SELECT code FROM countries") is None
+    assert db.offline
+
+    local.execute_query("INSERT INTO local_sync (synced_at) VALUES (CURRENT_TIMESTAMP)")
+    db = DbHelper(UNREACHABLE, local=local)
+    assert db.execute_query("SELECT code FROM countries") == [('CA',)]
@@ -0,0 +1,43 @@
+from datetime import date, datetime
+
+from models.price_interval import PriceInterval
+from repositories.price_analytics import PriceAnalytics
+
+TODAY = date(2026, 6, 30)
+ROWS = [
+    ('1000', '2026-01-01', '2026-05-31', 20, 20),  # 151 days
+    ('1000', '2026-06-01', '2026-06-20', 20, 15),  # 20 days
+    ('1000', '2026-06-21', '2026-06-30', 20, 18),  # 10 days
+]
+
+
+def test_statistics():
+    stats = PriceAnalytics.from_intervals(ROWS, TODAY).stats['1000']
+    assert (stats.current_price, stats.min_price, stats.max_price, stats.median_price) == (18, 15, 20, 20)
+    assert stats.mean_price == round((20 * 151 + 15 * 20 + 18 * 10) / 181, 2)
+    assert (stats.min_price_30d, stats.max_price_30d) == (15, 18)
+    assert stats.mean_price_30d == round((15 * 20 + 18 * 10) / 30, 2)
+    assert stats.max_price_90d == 20
+    assert stats.last_change == date(2026, 6, 21)
+    assert stats.days_since_change == 9
+    assert stats.discount_vs_median == 0.1
+    assert not stats.is_lowest_90d()
+
+
+def test_windows_without_recent_observations_use_the_last_price():
+    stats = PriceAnalytics.from_intervals(ROWS[:1], date(2026, 12, 31)).stats['1000']
+    assert (stats.min_price_30d, stats.mean_price_90d) == (20, 20)
+    assert stats.last_change is None
+
+
+def test_applied_changes_only_refresh_the_touched_skus():
+    analytics = PriceAnalytics.from_intervals(ROWS[:2] + [('2000', '2026-06-01', '2026-06-20', 5, 5)], TODAY)
+    untouched = analytics.stats['2000']
+    interval = PriceInterval(sku='1000', valid_from=datetime(2026, 6, 21), valid_to=datetime(2026, 6, 30),
+                             regular_price=20, current_price=18)
+    analytics.apply([(interval, None)], TODAY)
+
+    assert analytics.stats['1000'] == PriceAnalytics.from_intervals(ROWS, TODAY).stats['1000']
+    assert analytics.stats['2000'] is untouched
+    assert analytics.last_price('1000') == 18
+    assert analytics.last_price('3000') is None
@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+from repositories.price_history_partitions import PriceHistoryPartitions, add_months
+
+
+class RecordingDb:
+    """
+    Stands in for a MySQL DbHelper: answers the partition queries and records the DDL.
+    """
+
+    backend = 'mysql'
+    is_mysql = True
+    offline = False
+
+    def __init__(self, partitions, oldest=None):
+        self.partitions = partitions
+        self.oldest = oldest
+        self.statements = []
+
+    def execute_query(self, query, params=None, fetch_one=False, primary=False, mirror=True):
+        if 'information_schema.PARTITIONS' in query:
+            return [(name,) for name in self.partitions]
+        if 'MIN(last_updated)' in query:
+            return (self.oldest,)
+        self.statements.append(' '.join(query.split()))
+        return []
+
+
+def test_add_months():
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_existing_rows_are_split_into_their_months_first():
+    db = RecordingDb(['p_future'], oldest=datetime(2026, 7, 14, 8))
+    created = PriceHistoryPartitions(db).create_future_partitions(1, today=date(2026, 10, 19))
+    assert created == ['p202607', 'p202608', 'p202609', 'p202610', 'p202611']
+    assert "PARTITION p202607 VALUES LESS THAN (TO_DAYS('2026-08-01'))" in db.statements[0]
+
+
+def test_only_missing_partitions_are_created():
+    db = RecordingDb(['p202610', 'p_future'])
+    created = PriceHistoryPartitions(db).create_future_partitions(2, today=date(2026, 10, 19))
+    assert created == ['p202611', 'p202612']
+
+
+def test_expired_partitions_are_archived(tmp_path):
+    db = RecordingDb(['p202401', 'p202402', 'p202610', 'p_future'])
+    paths = PriceHistoryPartitions(db, str(tmp_path)).archive_expired(32, today=date(2026, 10, 19))
+    assert [path.rsplit('/', 1)[-1] for path in paths] == ['price_history_2024_01.csv.gz']
+    assert db.statements[-1] == 'ALTER TABLE price_history DROP PARTITION p202401'
@@ -0,0 +1,94 @@
+from datetime import date, timedelta
+
+from conftest import count, feed_product
+from models.price_interval import intervals_to_points
+from repositories.price_history_repository import PriceHistoryRepository
+
+
+def history_row(day, sku, current_price, regular_price=10.0):
+    return (f'2026-01-{day:02d} 08:00:00', sku, regular_price, current_price, None, None)
+
+
+def interval_days(db):
+    rows = db.execute_query("SELECT sku, valid_from, valid_to FROM price_history_intervals ORDER BY sku, valid_from")
+    return [(sku, valid_from[:10], valid_to[:10]) for sku, valid_from, valid_to in rows]
+
+
+def test_build_intervals_collapses_runs_of_identical_prices(db):
+    repo = PriceHistoryRepository(db)
+    intervals = repo.build_intervals([
+        history_row(1, '1000', 10.0), history_row(2, '1000', 10.0), history_row(3, '1000', 8.0),
+        history_row(4, '1000', 10.0), history_row(1, '2000', 5.0), history_row(5, '2000', 5.0),
+    ])
+    assert [(x.sku, x.valid_from.day, x.valid_to.day, float(x.current_price)) for x in intervals] == [
+        ('1000', 1, 2, 10.0), ('1000', 3, 3, 8.0), ('1000', 4, 4, 10.0), ('2000', 1, 5, 5.0)]
+
+
+def test_compact_history_rewrites_the_intervals(db):
+    db.bulk_insert_query(
+        "INSERT INTO price_history (last_updated, sku, regular_price, current_price) VALUES (%s, %s, %s, %s)",
+        [row[:4] for row in (history_row(1, '1000', 10.0), history_row(2, '1000', 10.0), history_row(3, '1000', 8.0))])
+    repo = PriceHistoryRepository(db)
+    assert repo.compact_history() == 2
+    # Refused once the intervals exist: they may hold archived months the raw history no longer has
+    db.execute_query("DELETE FROM price_history WHERE sku = %s", ('1000',))
+    assert repo.compact_history() == 0
+    assert interval_days(db) == [('1000', '2026-01-01', '2026-01-02'), ('1000', '2026-01-03', '2026-01-03')]
+
+
+def test_new_points_extend_or_open_intervals(db):
+    repo = PriceHistoryRepository(db)
+    first = repo.bulk_add_price_intervals([feed_product('1000', last_updated='2026-01-01T08:00:00').price_history[0]])
+    assert [(x.sku, previous) for x, previous in first] == [('1000', None)]
+
+    changes = repo.bulk_add_price_intervals([
+        feed_product('1000', last_updated='2026-01-02T08:00:00').price_history[0],
+        feed_product('2000', last_updated='2026-01-02T08:00:00').price_history[0],
+    ])
+    assert [(x.sku, x.valid_to.day, previous.day if previous else None) for x, previous in changes] == [
+        ('1000', 2, 1), ('2000', 2, None)]
+
+    # A price change opens a new interval, an already recorded point is ignored
+    changes = repo.bulk_add_price_intervals([
+        feed_product('1000', last_updated='2026-01-03T08:00:00', currentPrice='8.0').price_history[0],
+        feed_product('2000', last_updated='2026-01-02T08:00:00').price_history[0],
+    ])
+    assert [(x.sku, x.valid_from.day, previous) for x, previous in changes] == [('1000', 3, None)]
+    assert interval_days(db) == [
+        ('1000', '2026-01-01', '2026-01-02'), ('1000', '2026-01-03', '2026-01-03'),
+        ('2000', '2026-01-02', '2026-01-02')]
+
+
+def test_interval_rows_cover_the_active_catalog(db):
+    today = date.today()
+    db.bulk_insert_query("INSERT INTO products (sku, name) VALUES (%s, %s)", [('1000', 'Active'), ('2000', 'Gone')])
+    db.bulk_insert_query(
+        "INSERT INTO price_history_intervals (sku, valid_from, valid_to, current_price) VALUES (%s, %s, %s, 10)", [
+            ('1000', today - timedelta(days=400), today - timedelta(days=100)),
+            ('1000', today - timedelta(days=99), today),
+            ('2000', today - timedelta(days=60), today - timedelta(days=31)),
+            ('3000', today, today),  # Not a product
+        ])
+    rows = PriceHistoryRepository(db).load_interval_rows()
+    assert [(sku, valid_from[:10]) for sku, valid_from, *_ in rows] == [
+        ('1000', str(today - timedelta(days=400))), ('1000', str(today - timedelta(days=99)))]
+
+
+def test_raw_history_is_written_on_price_changes_only(db):
+    repo = PriceHistoryRepository(db)
+    for day, price in ((1, '10.0'), (2, '10.0'), (3, '10.0'), (4, '8.0')):
+        repo.bulk_add_price_histories([feed_product('1000', last_updated=f'2026-01-0{day}T08:00:00', currentPrice=price)])
+
+    assert [(row[0][:10], float(row[1])) for row in db.execute_query(
+        "SELECT last_updated, current_price FROM price_history ORDER BY last_updated")] == [
+        ('2026-01-01', 10.0), ('2026-01-04', 8.0)]
+    assert count(db, 'price_history_intervals') == 2
+
+
+def test_intervals_to_points_keep_the_ends_of_each_price(db):
+    intervals = PriceHistoryRepository(db).build_intervals([
+        history_row(1, '1000', 10.0), history_row(4, '1000', 10.0, regular_price=12.0),
+        history_row(5, '1000', 8.0), history_row(9, '1000', 8.0),
+    ])
+    points = intervals_to_points(intervals)
+    assert [(x.last_updated.day, float(x.current_price)) for x in points] == [(1, 10.0), (4, 10.0), (5, 8.0), (9, 8.0)]
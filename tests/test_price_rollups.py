@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from models.price_interval import PriceInterval
+from repositories.price_history_store import day_offset
+from repositories.price_rollups import PriceRollups, month_start, next_month, week_start
+
+ROWS = [
+    ('1000', '2026-01-26', '2026-01-31', 10, 10),  # Monday to Saturday
+    ('1000', '2026-02-01', '2026-02-03', 10, 7),
+]
+
+
+def test_buckets():
+    monday = day_offset('2026-01-26')
+    assert week_start(monday) == monday
+    assert week_start(day_offset('2026-02-01')) == monday  # Sunday
+    assert month_start(day_offset('2026-01-31')) == day_offset('2026-01-01')
+    assert next_month(day_offset('2025-12-01')) == day_offset('2026-01-01')
+
+
+def test_day_weighted_weeks_and_months():
+    rollups = PriceRollups.from_intervals(ROWS)
+    assert rollups.to_json_model('1000', 'week') == [
+        {'last_updated': datetime(2026, 1, 26), 'price': 9.57, 'open': 10, 'close': 7, 'min': 7, 'max': 10},
+        {'last_updated': datetime(2026, 2, 2), 'price': 7, 'open': 7, 'close': 7, 'min': 7, 'max': 7},
+    ]
+    assert [(x['last_updated'].month, x['price']) for x in rollups.to_json_model('1000', 'month')] == [(1, 10), (2, 7)]
+    assert rollups.to_json_model('1000', 'month', since_day=day_offset('2026-02-15'))[0]['last_updated'].month == 2
+    assert rollups.to_json_model('2000', 'week') == []
+
+
+def test_applied_changes_match_a_rebuild():
+    rollups = PriceRollups.from_intervals(ROWS[:1])
+    interval = PriceInterval(sku='1000', valid_from=datetime(2026, 2, 1), valid_to=datetime(2026, 2, 2),
+                             regular_price=10, current_price=7)
+    rollups.apply([(interval, None)])
+    interval.valid_to = datetime(2026, 2, 3)
+    rollups.apply([(interval, datetime(2026, 2, 2))])
+    rollups.apply([(interval, datetime(2026, 2, 3))])  # Already recorded
+
+    rebuilt = PriceRollups.from_intervals(ROWS)
+    for resolution in ('week', 'month'):
+        assert rollups.to_json_model('1000', resolution) == rebuilt.to_json_model('1000', resolution)
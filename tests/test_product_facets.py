@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from conftest import feed_product
+from repositories.product_facets import ProductFacets
+
+NOW = datetime(2026, 10, 10)
+
+
+def facets():
+    return ProductFacets.from_products([
+        feed_product('1000', first_update=datetime(2026, 10, 8)),  # New, on sale
+        feed_product('2000', countryName='Canada', countryCode='CA', currentPrice='12.0'),
+        feed_product('3000', countryName='Canada', countryCode='CA', unitSize=6, currentPrice='12.0',
+                     category={'id': 2, 'description': 'Beer'}, subCategory={'id': 20, 'description': 'Lager'},
+                     **{'class': {'id': 200, 'description': 'Pale Lager'}}),
+    ], NOW)
+
+
+def test_counts_without_filters():
+    data = facets().to_json_model(now=NOW)
+    assert data['total'] == 3
+    assert {x: y['count'] for x, y in data['categories'].items()} == {1: 2, 10: 2, 100: 2, 2: 1, 20: 1, 200: 1}
+    assert data['countries'] == {'FR': {'name': 'France', 'count': 1}, 'CA': {'name': 'Canada', 'count': 2}}
+    assert data['flags'] == {'sale_only': 1, 'is_new': 1, 'single_only': 2}
+
+
+def test_a_facet_ignores_its_own_filter():
+    data = facets().to_json_model(country='CA')
+    assert data['total'] == 2
+    assert {x: y['count'] for x, y in data['countries'].items()} == {'FR': 1, 'CA': 2}
+    assert {x: y['count'] for x, y in data['categories'].items()} == {1: 1, 10: 1, 100: 1, 2: 1, 20: 1, 200: 1}
+
+    data = facets().to_json_model(category=2, flags=['single_only'])
+    assert data['total'] == 0
+    assert data['flags']['single_only'] == 0  # Beer is sold by 6
+    assert {x: y['count'] for x, y in data['categories'].items()} == {1: 2, 10: 2, 100: 2}
+
+
+def test_unknown_values_match_nothing():
+    data = facets().to_json_model(category=999, flags=['bogus'])
+    assert data['total'] == 0
+    assert data['countries'] == {}
+
+
+def test_new_products_age_without_a_reload():
+    catalog = facets()
+    assert catalog.to_json_model(flags=['is_new'], now=NOW)['total'] == 1
+    assert catalog.to_json_model(flags=['is_new'], now=NOW + timedelta(days=6))['total'] == 0
@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import count, feed_product
+from repositories.category_repository import CategoryRepository
+from repositories.country_repository import CountryRepository
+from repositories.price_history_repository import PriceHistoryRepository
+from repositories.product_repository import ProductRepository
+
+
+@pytest.fixture
+def repo(db):
+    return ProductRepository(db, CategoryRepository(db), CountryRepository(db), PriceHistoryRepository(db))
+
+
+def test_upcs_of_a_rolled_back_ingest_are_stored_again(db, repo):
+    products = [feed_product('1000', upc=['062067000010', '062067000027'])]
+    with pytest.raises(RuntimeError):
+        with db.session():
+            repo.bulk_add_upcs(products)
+            raise RuntimeError()
+    assert count(db, 'product_upcs') == 0
+
+    repo.load_products()  # Resync after a failed persist
+    repo.bulk_add_upcs(products)
+    assert count(db, 'product_upcs') == 2
+
+
+def test_stored_upcs_are_skipped(db, repo):
+    products = [feed_product('1000')]
+    repo.bulk_add_upcs(products)
+    repo.bulk_add_upcs(products)
+    assert count(db, 'product_upcs') == 1
+    assert repo.load_upcs() == {'1000': ['06206701000']}
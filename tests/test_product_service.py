@@ -0,0 +1,96 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import db_helper as db_helper_module
+from conftest import count, feed_product, feed_source, write_feed
+from db_helper import DbHelper
+from repositories.catalog_changelog import stored_version
+from services import product_service as product_service_module
+from services.product_service import ProductService
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ProductService(f'sqlite:///{tmp_path / "test.db"}', None, None, None)
+    service.set_products([feed_product('1001'), feed_product('1002', countryName='Canada', countryCode='CA')])
+    return service
+
+
+def test_lookups_name_the_flat_ids(service):
+    assert service.lookups() == {
+        'countries': {'FR': 'France', 'CA': 'Canada'},
+        'categories': {'1': 'Wine', '10': 'Red Wine', '100': 'Bordeaux'},
+    }
+    assert {x['country_code'] for x in service.json_models()} == {'FR', 'CA'}
+    assert all(x['category_ids'] == [1, 10, 100] for x in service.json_models())
+
+
+def test_columnar_cache_key_is_canonical(service):
+    body = service.columnar(['sku', 'name'])
+    assert service.columnar(['name', 'sku', 'name']) is body
+    assert list(service._columnar) == [('sku', 'name')]
+    assert list(json.loads(body)['columns']) == ['sku', 'name']
+
+
+def test_columnar_cache_is_bounded(service, monkeypatch):
+    monkeypatch.setattr(product_service_module, 'MAX_COLUMNAR_BODIES', 2)
+    first = service.columnar(['sku'])
+    service.columnar(['name'])
+    assert service.columnar(['sku']) is first  # Now the most recently used
+    service.columnar(['volume'])
+    assert list(service._columnar) == [('sku',), ('volume',)]
+
+
+@pytest.fixture
+def stored(tmp_path, run_dir):
+    return ProductService(f'sqlite:///{tmp_path / "stored.db"}', None, None, None, True)
+
+
+def load_feed(service, tmp_path, *skus):
+    today = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0).isoformat()
+    service.load_products(write_feed(tmp_path / 'feed.json', *(feed_source(x, last_updated=today) for x in skus)))
+
+
+def test_persist_products_stores_the_feed(stored, tmp_path):
+    load_feed(stored, tmp_path, '1001', '1002')
+    assert stored.persist_products() == 2
+    for table in ('products', 'product_upcs', 'price_history_intervals'):
+        assert count(stored.db_helper, table) == 2
+    assert stored_version()
+
+    stored.reload_products()
+    assert [x.sku for x in stored.products] == ['1001', '1002']
+    assert stored.changelog.version == stored_version()
+
+
+def test_connection_is_retried_after_a_failure(stored, tmp_path, monkeypatch):
+    open_database = DbHelper._open
+    monkeypatch.setattr(db_helper_module, 'OFFLINE_RETRY_INTERVAL', 0)
+    monkeypatch.setattr(DbHelper, '_open', classmethod(lambda cls, config: 1 / 0))
+    assert stored.db_helper.connect() is None
+    assert stored.db_helper.offline
+
+    monkeypatch.setattr(DbHelper, '_open', open_database)
+    load_feed(stored, tmp_path, '1001')
+    assert stored.persist_products() == 1
+    assert not stored.db_helper.offline
+    assert count(stored.db_helper, 'products') == 1
+
+
+def test_nothing_is_versioned_without_a_database(stored, tmp_path, monkeypatch):
+    load_feed(stored, tmp_path, '1001')
+    stored.persist_products()
+    stored.reload_products()
+    version = stored.changelog.version
+
+    monkeypatch.setattr(DbHelper, '_open', classmethod(lambda cls, config: 1 / 0))
+    load_feed(stored, tmp_path, '1001', '1002')
+    with pytest.raises(ConnectionError):
+        stored.persist_products()
+    assert stored_version() == version
+
+    stored.reload_products()  # Reads nothing, the served catalog is kept
+    assert [x.sku for x in stored.products] == ['1001']
+    assert stored.changelog.version == version
@@ -0,0 +1,47 @@
+import multiprocessing
+
+from utils.run_state import file_lock, next_counter, read_counter, stamp_age, write_stamp
+
+
+def test_counter(run_dir):
+    assert read_counter('counter') == 0
+    assert next_counter('counter') == 1
+    assert next_counter('counter', floor=10) == 11
+    assert next_counter('counter') == 12
+    assert read_counter('counter') == 12
+
+
+def test_stamp(run_dir):
+    assert stamp_age('stamp') is None
+    write_stamp('stamp')
+    assert 0 <= stamp_age('stamp') < 5
+
+
+def test_file_lock_has_one_holder(run_dir):
+    with file_lock('ingest') as leader:
+        with file_lock('ingest') as follower:
+            assert leader and not follower
+        with file_lock('other') as other:
+            assert other
+    with file_lock('ingest') as next_leader:
+        assert next_leader
+
+
+def try_ingest_lock(results):
+    with file_lock('ingest') as acquired:
+        results.put(acquired)
+
+
+def test_file_lock_is_shared_by_processes(run_dir):
+    results = multiprocessing.get_context('fork').Queue()
+    with file_lock('ingest'):
+        process = multiprocessing.get_context('fork').Process(target=try_ingest_lock, args=(results,))
+        process.start()
+        process.join()
+    assert results.get(timeout=5) is False
+
+
+def test_sqlite_database_lock_falls_back_to_the_file_lock(db, run_dir):
+    with db.try_lock('ingest') as leader:
+        with file_lock('ingest') as follower:
+            assert leader and not follower
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from conftest import feed_product
+from models.watch_rule import WatchRule
+from repositories.watchlist_repository import WatchlistRepository
+from services.watchlist_service import WatchlistService
+
+
+@pytest.fixture
+def workers(db, tmp_path):
+    outbox = str(tmp_path / 'outbox.jsonl')
+    return WatchlistService(WatchlistRepository(db), outbox), WatchlistService(WatchlistRepository(db), outbox)
+
+
+def test_rule_added_on_another_worker_fires(workers):
+    web, ingest = workers
+    web.add_rule(WatchRule(subscriber='me@example.com', sku='1000', max_price=20), 'token')
+
+    # The ingest worker reloads on the event the web worker publishes
+    ingest.reload()
+    product = feed_product('1000')
+    fired = ingest.evaluate([(product, 25.0, 19.0)])
+    assert [(x['subscriber'], x['sku'], x['threshold']) for x in fired] == [('me@example.com', '1000', 20)]
+    with open(ingest.outbox_path, encoding='utf8') as file:
+        assert json.loads(file.readline())['rule_id'] == fired[0]['rule_id']
+
+
+@pytest.mark.parametrize('previous, price, fires', [
+    (25.0, 20.0, True),  # Drops to the threshold
+    (25.0, 21.0, False),  # Still above
+    (19.0, 18.0, False),  # Already below, notified before
+    (15.0, 18.0, False),  # Price increase
+    (None, 19.0, False),  # No previous price, nothing crossed
+])
+def test_threshold_crossing(workers, previous, price, fires):
+    service, _ = workers
+    service.add_rule(WatchRule(subscriber='me@example.com', sku='1000', max_price=20), 'token')
+    assert bool(service.evaluate([(feed_product('1000'), previous, price)])) == fires
+
+
+def test_category_rule_per_litre(workers):
+    service, _ = workers
+    # Category 10 (Red Wine) under 20 per litre: 0.75 l at 14.25 is 19 per litre
+    service.add_rule(WatchRule(subscriber='me@example.com', category_id=10, max_price_per_litre=20), 'token')
+    assert service.evaluate([(feed_product('1000'), 16.0, 14.25)])
+    assert not service.evaluate([(feed_product('1000'), 16.0, 15.5)])
+
+
+def test_rules_need_their_owner_token(workers):
+    web, other = workers
+    rule = web.add_rule(WatchRule(subscriber='me@example.com', sku='1000', max_price=20), 'token')
+
+    assert [x.id for x in other.rules_of('me@example.com', 'token')] == [rule.id]
+    assert other.rules_of('me@example.com', 'guess') == []
+    assert 'token_hash' not in rule.to_json_model()
+
+    assert not other.remove_rule(rule.id, 'guess')
+    assert other.remove_rule(rule.id, 'token')
+    assert not web.remove_rule(rule.id, 'token')
+    web.reload()
+    assert web.evaluate([(feed_product('1000'), 25.0, 19.0)]) == []